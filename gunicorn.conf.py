@@ -0,0 +1,75 @@
+"""
+Configuración de gunicorn para producción.
+Uso: gunicorn -c gunicorn.conf.py
+
+- preload_app: Django, las rutas y las plantillas se cargan una vez en el master
+  y los workers las heredan al hacer fork (copy-on-write: menos memoria y
+  workers que arrancan ya calientes).
+- Workers e hilos desde el entorno: WEB_CONCURRENCY (por defecto 2 * CPUs + 1)
+  y GUNICORN_THREADS (por defecto 1: workers sync; con más de 1 se usan gthread).
+- El master precalienta (stoke/arranque.py) antes de crear los workers y cierra
+  las conexiones a la base para que ningún worker herede un socket compartido.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stoke_project.settings_produccion')
+
+wsgi_app = 'stoke_project.wsgi:application'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+preload_app = True
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Reciclar workers de a poco acota el crecimiento de memoria sin reiniciar todos juntos
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+
+def when_ready(server):
+    """En el master, con la aplicación ya cargada y antes de crear los workers"""
+    from stoke.arranque import precalentar
+
+    try:
+        tiempos = precalentar(cerrar_conexiones=True)
+    except Exception as e:
+        # Sin base al arrancar no se frena el servidor: los workers se conectan solos después
+        server.log.warning('Precalentado incompleto: %s', e)
+        return
+    server.log.info('Precalentado: ' + ', '.join(f'{paso} {ms:.0f} ms' for paso, ms in tiempos.items()))
+
+
+def post_worker_init(worker):
+    """
+    Con workers sync la request se atiende en el mismo hilo del worker, así que
+    se puede abrir su conexión antes del primer cliente. Con gthread cada hilo del
+    pool abre la suya (y la reutiliza gracias a CONN_MAX_AGE).
+    """
+    if worker_class != 'sync':
+        return
+    from django.db import connections
+
+    try:
+        for conexion in connections.all():
+            conexion.ensure_connection()
+    except Exception as e:
+        worker.log.warning('No se pudo abrir la conexión a la base: %s', e)
+
+
+def child_exit(server, worker):
+    """Suma las métricas del worker que terminó al acumulado (ver stoke/metricas.py)"""
+    directorio = os.getenv('STOKE_METRICAS_DIR', '')
+    if directorio:
+        from stoke.metricas import archivar_proceso
+
+        archivar_proceso(worker.pid, directorio)
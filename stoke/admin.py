@@ -1,13 +1,84 @@
+from functools import wraps
+
 from django.contrib import admin
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
 from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.utils import timezone
 from django import forms
-from .models import Producto, Venta, Categoria, DetalleVenta, CierreCaja
+from .models import (
+    Producto, Venta, Categoria, DetalleVenta, CierreCaja, ListaPrecios, HistorialPrecio, ResumenDiario,
+    Devolucion, DetalleDevolucion, Promocion, Sucursal, Existencia, Inventario, ConteoInventario, CodigoBarras,
+    EventoSalida, OrdenCompra, LineaOrdenCompra,
+)
+from .devoluciones import anular_ventas
+
+
+METODOS_PERMISO = (
+    'has_module_permission',
+    'has_view_permission',
+    'has_add_permission',
+    'has_change_permission',
+    'has_delete_permission',
+)
+
+
+def por_request(metodo):
+    """Memoriza el resultado de un has_*_permission durante la request"""
+    @wraps(metodo)
+    def envoltura(self, request, *args, **kwargs):
+        permisos = request.__dict__.setdefault('_stoke_permisos', {})
+        clave = (
+            id(self),
+            metodo.__qualname__,
+            tuple(getattr(arg, 'pk', arg) for arg in args),
+            tuple((nombre, getattr(valor, 'pk', valor)) for nombre, valor in sorted(kwargs.items())),
+        )
+        if clave not in permisos:
+            permisos[clave] = metodo(self, request, *args, **kwargs)
+        return permisos[clave]
+    envoltura.por_request = True
+    return envoltura
+
+
+class PermisosPorRequest:
+    """
+    Mixin para ModelAdmin e inlines: cada has_*_permission se evalúa una sola vez
+    por request (y por objeto), aunque el admin lo consulte para el índice, la
+    barra lateral, cada inline y cada fila.
+    También envuelve los has_*_permission que definan las subclases.
+    """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for nombre in METODOS_PERMISO:
+            metodo = cls.__dict__.get(nombre)
+            if metodo is not None and not getattr(metodo, 'por_request', False):
+                setattr(cls, nombre, por_request(metodo))
+    
+    @por_request
+    def has_module_permission(self, request, *args, **kwargs):
+        return super().has_module_permission(request, *args, **kwargs)
+    
+    @por_request
+    def has_view_permission(self, request, *args, **kwargs):
+        return super().has_view_permission(request, *args, **kwargs)
+    
+    @por_request
+    def has_add_permission(self, request, *args, **kwargs):
+        return super().has_add_permission(request, *args, **kwargs)
+    
+    @por_request
+    def has_change_permission(self, request, *args, **kwargs):
+        return super().has_change_permission(request, *args, **kwargs)
+    
+    @por_request
+    def has_delete_permission(self, request, *args, **kwargs):
+        return super().has_delete_permission(request, *args, **kwargs)
 
 
 @admin.register(Categoria)
-class CategoriaAdmin(admin.ModelAdmin):
+class CategoriaAdmin(PermisosPorRequest, admin.ModelAdmin):
     list_display = ['nombre', 'descripcion']
     search_fields = ['nombre']
     list_filter = ['nombre']
@@ -29,19 +100,112 @@ class CategoriaAdmin(admin.ModelAdmin):
         return request.user.is_staff
 
 
+@admin.register(Sucursal)
+class SucursalAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['nombre', 'direccion', 'activa']
+    list_filter = ['activa']
+    search_fields = ['nombre']
+    filter_horizontal = ['usuarios']
+    
+    def has_add_permission(self, request):
+        return request.user.is_superuser
+    
+    def has_change_permission(self, request, obj=None):
+        return request.user.is_superuser
+    
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
+    
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_staff
+
+
+class ExistenciaInline(PermisosPorRequest, admin.TabularInline):
+    """Stock del producto en cada sucursal (se corrige desde Existencias o con un inventario)"""
+    model = Existencia
+    fields = ['sucursal', 'stock']
+    readonly_fields = ['stock']
+    extra = 0
+    
+    def has_change_permission(self, request, obj=None):
+        """Guardar una fila existente pisaría el stock que vendió la caja mientras tanto"""
+        return False
+
+
+class ExistenciaForm(forms.ModelForm):
+    ajuste = forms.IntegerField(
+        required=False,
+        help_text="Unidades a sumar al stock (negativo para restar). Para un recuento completo usar un inventario",
+    )
+    
+    class Meta:
+        model = Existencia
+        fields = ['producto', 'sucursal']
+
+
+@admin.register(Existencia)
+class ExistenciaAdmin(PermisosPorRequest, admin.ModelAdmin):
+    """
+    El stock no se edita como valor absoluto: se corrige con un ajuste relativo
+    (stock = stock + ajuste en la base) para no pisar las ventas concurrentes.
+    """
+    form = ExistenciaForm
+    list_display = ['producto', 'sucursal', 'stock', 'vendidas_30_dias', 'vendidas_total']
+    readonly_fields = ['stock', 'vendidas_hoy', 'dia_vendidas', 'vendidas_30_dias', 'vendidas_total']
+    list_filter = ['sucursal', 'producto__categoria']
+    search_fields = ['producto__nombre', 'producto__codigo_barras']
+    list_select_related = ['producto', 'sucursal']
+    autocomplete_fields = ['producto']
+    
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None:
+            return ['producto', 'sucursal', *self.readonly_fields]
+        return self.readonly_fields
+    
+    def save_model(self, request, obj, form, change):
+        ajuste = form.cleaned_data.get('ajuste') or 0
+        if not change:
+            obj.stock = ajuste
+            super().save_model(request, obj, form, change)
+        elif ajuste:
+            Existencia.objects.filter(pk=obj.pk).update(stock=F('stock') + ajuste)
+            obj.refresh_from_db(fields=['stock'])
+    
+    def has_add_permission(self, request):
+        return request.user.is_superuser
+    
+    def has_change_permission(self, request, obj=None):
+        return request.user.is_superuser
+    
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
+    
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_staff
+
+
+class CodigoBarrasInline(PermisosPorRequest, admin.TabularInline):
+    """Códigos alternativos con los que también se encuentra el producto"""
+    model = CodigoBarras
+    fields = ['codigo', 'codigo_normalizado']
+    readonly_fields = ['codigo_normalizado']
+    extra = 0
+
+
 @admin.register(Producto)
-class ProductoAdmin(admin.ModelAdmin):
-    list_display = ['nombre', 'codigo_barras', 'precio', 'stock', 'categoria', 'tamaño', 'activo']
+class ProductoAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['nombre', 'codigo_barras', 'precio', 'categoria', 'tamaño', 'activo']
     list_filter = ['categoria', 'activo', 'fecha_creacion']
-    search_fields = ['nombre', 'codigo_barras']
-    readonly_fields = ['fecha_creacion', 'fecha_actualizacion']
+    search_fields = ['nombre', 'codigo_barras', 'codigos__codigo']
+    readonly_fields = ['codigo_normalizado', 'fecha_creacion', 'fecha_actualizacion']
+    inlines = [CodigoBarrasInline, ExistenciaInline]
     
     fieldsets = (
         ('Información del Producto', {
-            'fields': ('nombre', 'codigo_barras', 'categoria', 'tamaño', 'activo')
+            'fields': ('nombre', 'codigo_barras', 'codigo_normalizado', 'categoria', 'tamaño', 'activo')
         }),
-        ('Precio y Stock', {
-            'fields': ('precio', 'stock')
+        ('Precio', {
+            'fields': ('precio', 'costo')
         }),
         ('Fechas', {
             'fields': ('fecha_creacion', 'fecha_actualizacion'),
@@ -64,31 +228,45 @@ class ProductoAdmin(admin.ModelAdmin):
     def has_view_permission(self, request, obj=None):
         """Todos los usuarios staff pueden ver productos (para seleccionarlos en ventas)"""
         return request.user.is_staff
+    
+    def save_model(self, request, obj, form, change):
+        """Registra en el historial los cambios de precio hechos a mano"""
+        precio_anterior = form.initial.get('precio')
+        super().save_model(request, obj, form, change)
+        if change and 'precio' in form.changed_data:
+            cambio = HistorialPrecio.cambio(obj.pk, precio_anterior, obj.precio, request.user)
+            if cambio:
+                cambio.save()
 
 
-class DetalleVentaInline(admin.TabularInline):
+class DetalleVentaInline(PermisosPorRequest, admin.TabularInline):
     """Inline para ver detalles de venta"""
     model = DetalleVenta
-    readonly_fields = ['producto', 'cantidad', 'precio_unitario', 'subtotal']
+    readonly_fields = ['producto', 'cantidad', 'precio_unitario', 'descuento', 'promocion', 'subtotal', 'cantidad_devuelta']
     extra = 0
     can_delete = False
 
 
 @admin.register(Venta)
-class VentaAdmin(admin.ModelAdmin):
-    list_display = ['id', 'fecha', 'usuario', 'metodo_pago', 'total', 'vuelto']
-    list_filter = ['fecha', 'metodo_pago', 'usuario']
+class VentaAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['id', 'fecha', 'sucursal', 'usuario', 'metodo_pago', 'total', 'vuelto', 'total_devuelto', 'anulada']
+    list_filter = ['sucursal', 'fecha', 'metodo_pago', 'usuario', 'anulada']
     search_fields = ['usuario__username', 'id']
     date_hierarchy = 'fecha'
-    readonly_fields = ['fecha', 'total', 'vuelto']
+    readonly_fields = ['fecha', 'sucursal', 'total', 'vuelto', 'recargo_tarjeta', 'monto_manual', 'total_devuelto', 'anulada']
+    list_select_related = ['sucursal', 'usuario']
     inlines = [DetalleVentaInline]
+    actions = ['anular']
     
     fieldsets = (
         ('Información de la Venta', {
-            'fields': ('fecha', 'usuario', 'metodo_pago', 'total')
+            'fields': ('fecha', 'sucursal', 'usuario', 'metodo_pago', 'total')
         }),
         ('Pago', {
-            'fields': ('monto_recibido', 'vuelto', 'recargo_tarjeta')
+            'fields': ('monto_recibido', 'vuelto', 'recargo_tarjeta', 'monto_manual')
+        }),
+        ('Devoluciones', {
+            'fields': ('total_devuelto', 'anulada')
         }),
         ('Observaciones', {
             'fields': ('observaciones',),
@@ -105,16 +283,52 @@ class VentaAdmin(admin.ModelAdmin):
         return False
     
     def has_delete_permission(self, request, obj=None):
-        """Solo los superusuarios pueden eliminar ventas"""
-        return request.user.is_superuser
+        """Las ventas no se borran: se anulan (así quedan la devolución y su evento para contabilidad)"""
+        return False
+    
+    @admin.action(description='Anular ventas seleccionadas (repone stock)')
+    def anular(self, request, queryset):
+        if not request.user.is_superuser:
+            self.message_user(request, 'Solo los superusuarios pueden anular ventas', level='error')
+            return
+        cantidad = anular_ventas(queryset, request.user, 'Anulada desde el admin')
+        self.message_user(request, f'{cantidad} ventas anuladas')
+
+
+class DetalleDevolucionInline(PermisosPorRequest, admin.TabularInline):
+    model = DetalleDevolucion
+    readonly_fields = ['detalle_venta', 'cantidad', 'subtotal']
+    extra = 0
+    can_delete = False
+
+
+@admin.register(Devolucion)
+class DevolucionAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['id', 'fecha', 'venta', 'usuario', 'total', 'es_anulacion']
+    list_filter = ['fecha', 'es_anulacion', 'usuario']
+    search_fields = ['venta__id', 'usuario__username']
+    date_hierarchy = 'fecha'
+    list_select_related = ['venta', 'usuario']
+    readonly_fields = ['venta', 'usuario', 'fecha', 'total', 'es_anulacion', 'motivo']
+    inlines = [DetalleDevolucionInline]
+    
+    def has_add_permission(self, request):
+        """Las devoluciones se hacen desde el historial o anulando ventas"""
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(DetalleVenta)
-class DetalleVentaAdmin(admin.ModelAdmin):
-    list_display = ['id', 'venta', 'producto', 'cantidad', 'precio_unitario', 'subtotal']
+class DetalleVentaAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['id', 'venta', 'producto', 'cantidad', 'precio_unitario', 'descuento', 'subtotal', 'cantidad_devuelta']
     list_filter = ['venta__fecha', 'producto']
     search_fields = ['producto__nombre', 'venta__id']
-    readonly_fields = ['venta', 'producto', 'cantidad', 'precio_unitario', 'subtotal']
+    readonly_fields = ['venta', 'producto', 'cantidad', 'precio_unitario', 'descuento', 'promocion', 'subtotal', 'cantidad_devuelta']
     
     def has_add_permission(self, request):
         return False
@@ -124,17 +338,18 @@ class DetalleVentaAdmin(admin.ModelAdmin):
 
 
 @admin.register(CierreCaja)
-class CierreCajaAdmin(admin.ModelAdmin):
-    list_display = ['fecha', 'usuario', 'total_ventas', 'cantidad_ventas', 'diferencia']
-    list_filter = ['fecha', 'usuario']
+class CierreCajaAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['fecha', 'sucursal', 'usuario', 'total_ventas', 'cantidad_ventas', 'diferencia']
+    list_filter = ['sucursal', 'fecha', 'usuario']
     search_fields = ['usuario__username']
-    readonly_fields = ['fecha', 'fecha_hora_cierre', 'total_ventas', 'cantidad_ventas', 
+    list_select_related = ['sucursal', 'usuario']
+    readonly_fields = ['fecha', 'sucursal', 'fecha_hora_cierre', 'total_ventas', 'cantidad_ventas', 
                        'total_efectivo', 'total_tarjeta_debito', 'total_tarjeta_credito',
                        'total_transferencia', 'total_mercado_pago', 'diferencia']
     
     fieldsets = (
         ('Información', {
-            'fields': ('fecha', 'usuario', 'fecha_hora_cierre')
+            'fields': ('fecha', 'sucursal', 'usuario', 'fecha_hora_cierre')
         }),
         ('Dinero en Caja', {
             'fields': ('dinero_inicial', 'dinero_final', 'diferencia')
@@ -161,22 +376,216 @@ class CierreCajaAdmin(admin.ModelAdmin):
         return request.user.is_superuser
 
 
-# Personalizar permisos de grupos
-def setup_permissions():
-    """Configura permisos para grupos de usuarios"""
-    # Crear grupo de vendedores si no existe
-    vendedores_group, created = Group.objects.get_or_create(name='Vendedores')
+@admin.register(ResumenDiario)
+class ResumenDiarioAdmin(PermisosPorRequest, admin.ModelAdmin):
+    """Totales acumulados en cada venta; se concilian al guardar el cierre"""
+    list_display = ['fecha', 'sucursal', 'usuario', 'total_ventas', 'cantidad_ventas', 'fecha_actualizacion']
+    list_filter = ['sucursal', 'fecha', 'usuario']
+    list_select_related = ['sucursal', 'usuario']
+    date_hierarchy = 'fecha'
+    
+    def has_add_permission(self, request):
+        return False
     
-    # Permisos para vendedores: solo pueden agregar ventas
-    from django.contrib.contenttypes.models import ContentType
-    from django.contrib.auth.models import Permission
+    def has_change_permission(self, request, obj=None):
+        return False
     
-    venta_content_type = ContentType.objects.get_for_model(Venta)
-    producto_content_type = ContentType.objects.get_for_model(Producto)
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+
+@admin.register(Promocion)
+class PromocionAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['nombre', 'tipo', 'producto', 'categoria', 'metodo_pago', 'activa', 'fecha_desde', 'fecha_hasta']
+    list_filter = ['tipo', 'activa', 'categoria', 'metodo_pago']
+    search_fields = ['nombre', 'producto__nombre']
+    autocomplete_fields = ['producto']
+    list_select_related = ['producto', 'categoria']
     
-    # Vendedores pueden ver y agregar ventas, ver productos
-    vendedores_group.permissions.add(
-        Permission.objects.get(codename='add_venta', content_type=venta_content_type),
-        Permission.objects.get(codename='view_venta', content_type=venta_content_type),
-        Permission.objects.get(codename='view_producto', content_type=producto_content_type),
+    fieldsets = (
+        ('Promoción', {
+            'fields': ('nombre', 'tipo', 'activa')
+        }),
+        ('Alcance', {
+            'fields': ('producto', 'categoria', 'metodo_pago')
+        }),
+        ('Regla', {
+            'fields': ('cantidad', 'cantidad_paga', 'precio', 'porcentaje')
+        }),
+        ('Vigencia', {
+            'fields': ('fecha_desde', 'fecha_hasta')
+        }),
     )
+    
+    def has_add_permission(self, request):
+        return request.user.is_superuser
+    
+    def has_change_permission(self, request, obj=None):
+        return request.user.is_superuser
+    
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
+    
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_staff
+
+
+@admin.register(ListaPrecios)
+class ListaPreciosAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['nombre', 'tipo', 'valor', 'categoria', 'filtro_nombre', 'fecha_vigencia', 'fecha_aplicacion', 'productos_actualizados']
+    list_filter = ['tipo', 'categoria', 'fecha_vigencia']
+    search_fields = ['nombre', 'filtro_nombre']
+    readonly_fields = ['fecha_aplicacion', 'productos_actualizados', 'usuario', 'fecha_creacion']
+    actions = ['aplicar_ahora']
+    
+    fieldsets = (
+        ('Lista', {
+            'fields': ('nombre', 'tipo', 'valor', 'fecha_vigencia')
+        }),
+        ('Productos alcanzados', {
+            'fields': ('categoria', 'filtro_nombre', 'solo_activos')
+        }),
+        ('Aplicación', {
+            'fields': ('fecha_aplicacion', 'productos_actualizados', 'usuario', 'fecha_creacion'),
+            'classes': ('collapse',)
+        }),
+    )
+    
+    def save_model(self, request, obj, form, change):
+        if not obj.usuario_id:
+            obj.usuario = request.user
+        super().save_model(request, obj, form, change)
+    
+    @admin.action(description='Aplicar ahora las listas seleccionadas')
+    def aplicar_ahora(self, request, queryset):
+        total = 0
+        for lista in queryset.filter(fecha_aplicacion__isnull=True).order_by('fecha_vigencia', 'id'):
+            total += lista.aplicar(usuario=request.user)
+        self.message_user(request, f'{total} precios actualizados')
+    
+    def has_add_permission(self, request):
+        return request.user.is_superuser
+    
+    def has_change_permission(self, request, obj=None):
+        """Una lista ya aplicada no se puede modificar"""
+        if obj is not None and obj.aplicada:
+            return False
+        return request.user.is_superuser
+    
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.aplicada:
+            return False
+        return request.user.is_superuser
+    
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_staff
+
+
+@admin.register(HistorialPrecio)
+class HistorialPrecioAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['fecha', 'producto', 'precio_anterior', 'precio_nuevo', 'lista', 'usuario']
+    list_filter = ['fecha', 'lista']
+    search_fields = ['producto__nombre', 'producto__codigo_barras']
+    list_select_related = ['producto', 'lista', 'usuario']
+    date_hierarchy = 'fecha'
+    readonly_fields = ['producto', 'precio_anterior', 'precio_nuevo', 'lista', 'usuario', 'fecha']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ConteoInventarioInline(PermisosPorRequest, admin.TabularInline):
+    model = ConteoInventario
+    fields = ['producto', 'stock_inicial', 'cantidad', 'diferencia', 'fecha_actualizacion']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('producto')
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Inventario)
+class InventarioAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['id', 'sucursal', 'descripcion', 'estado', 'fecha_apertura', 'fecha_cierre', 'productos_ajustados']
+    list_filter = ['estado', 'sucursal']
+    list_select_related = ['sucursal']
+    date_hierarchy = 'fecha_apertura'
+    readonly_fields = ['sucursal', 'estado', 'no_contados_en_cero', 'usuario', 'fecha_apertura', 'fecha_cierre', 'usuario_cierre', 'productos_ajustados']
+    inlines = [ConteoInventarioInline]
+    
+    def has_add_permission(self, request):
+        """Los inventarios se abren, cuentan y cierran desde la pantalla de inventario"""
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class LineaOrdenCompraInline(PermisosPorRequest, admin.TabularInline):
+    model = LineaOrdenCompra
+    fields = ['producto', 'cantidad', 'costo_unitario']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('producto')
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OrdenCompra)
+class OrdenCompraAdmin(PermisosPorRequest, admin.ModelAdmin):
+    list_display = ['id', 'sucursal', 'proveedor', 'remito', 'estado', 'fecha_creacion', 'fecha_recepcion', 'unidades_recibidas']
+    list_filter = ['estado', 'sucursal']
+    list_select_related = ['sucursal']
+    search_fields = ['proveedor', 'remito']
+    date_hierarchy = 'fecha_creacion'
+    readonly_fields = ['sucursal', 'estado', 'actualizar_costos', 'usuario', 'fecha_creacion', 'fecha_recepcion', 'usuario_recepcion', 'productos_recibidos', 'unidades_recibidas']
+    inlines = [LineaOrdenCompraInline]
+    
+    def has_add_permission(self, request):
+        """Las órdenes se abren, cargan y reciben desde la pantalla de compras"""
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(EventoSalida)
+class EventoSalidaAdmin(PermisosPorRequest, admin.ModelAdmin):
+    """Outbox de eventos para contabilidad; los envía `manage.py despachar_eventos`"""
+    list_display = ['id', 'tipo', 'clave', 'estado', 'intentos', 'proximo_intento', 'fecha_creacion', 'fecha_entrega']
+    list_filter = ['estado', 'tipo']
+    search_fields = ['clave']
+    date_hierarchy = 'fecha_creacion'
+    readonly_fields = ['tipo', 'clave', 'datos', 'estado', 'intentos', 'proximo_intento', 'ultimo_error', 'fecha_creacion', 'fecha_entrega']
+    actions = ['reintentar']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    @admin.action(description='Reintentar ahora los eventos seleccionados')
+    def reintentar(self, request, queryset):
+        if not request.user.is_superuser:
+            self.message_user(request, 'Solo los superusuarios pueden reintentar eventos', level='error')
+            return
+        cantidad = queryset.exclude(estado='entregado').update(estado='pendiente', intentos=0, proximo_intento=timezone.now())
+        self.message_user(request, f'{cantidad} eventos vuelven a la cola')
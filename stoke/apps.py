@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class StokeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stoke'
+
+    def ready(self):
+        # Registra las señales que invalidan el índice de promociones, los usuarios en caché
+        # y la versión del catálogo
+        from . import autenticacion, catalogo, promociones  # noqa: F401
@@ -0,0 +1,81 @@
+"""
+Precalentado del proceso antes de recibir tráfico (ver gunicorn.conf.py).
+
+La primera request de un worker frío paga trabajo que después ya no se repite:
+armar las rutas, compilar las plantillas, abrir la conexión a la base, compilar
+el índice de promociones. precalentar() hace todo eso de antemano. Con
+preload_app se corre una vez en el master y los workers heredan el resultado
+(copy-on-write), así que además se comparte la memoria.
+
+Las conexiones que se abren acá se cierran al final si `cerrar_conexiones`:
+un socket abierto antes del fork quedaría compartido entre los workers.
+"""
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver, reverse
+
+# Un código cualquiera: solo interesa que la consulta por código pase una vez
+# por la base (planes, índices en memoria del servidor) antes de un escaneo real
+CODIGO_PRUEBA = '0000000000000'
+
+
+def plantillas_del_proyecto():
+    """Nombres de las plantillas de stoke (incluida la de login)"""
+    carpeta = Path(apps.get_app_config('stoke').path) / 'templates'
+    return sorted(str(ruta.relative_to(carpeta)) for ruta in carpeta.rglob('*.html'))
+
+
+def _rutas():
+    get_resolver().url_patterns  # Importa las vistas
+    reverse('stoke:ventas')  # Arma el índice de nombres para reverse()
+
+
+def _plantillas():
+    for nombre in plantillas_del_proyecto():
+        get_template(nombre)  # Queda compilada en el cached.Loader
+
+
+def _conexiones():
+    for conexion in connections.all():
+        conexion.ensure_connection()
+
+
+def _catalogo():
+    from .catalogo import version_catalogo
+    from .models import Producto
+    from .promociones import obtener_indice
+
+    version_catalogo()
+    obtener_indice()
+    Producto.ids_por_codigo([CODIGO_PRUEBA])
+
+
+PASOS = [
+    ('rutas', _rutas, False),
+    ('plantillas', _plantillas, False),
+    ('conexiones', _conexiones, True),
+    ('catálogo y códigos', _catalogo, True),
+]
+
+
+def precalentar(base_de_datos=True, cerrar_conexiones=False):
+    """
+    Corre los pasos de precalentado y devuelve {paso: milisegundos}.
+    Con base_de_datos=False se saltean los pasos que consultan la base.
+    """
+    tiempos = {}
+    try:
+        for nombre, paso, usa_base in PASOS:
+            if usa_base and not base_de_datos:
+                continue
+            inicio = time.perf_counter()
+            paso()
+            tiempos[nombre] = (time.perf_counter() - inicio) * 1000
+    finally:
+        if cerrar_conexiones:
+            connections.close_all()
+    return tiempos
@@ -0,0 +1,329 @@
+"""
+Controles de integridad de los datos (ver `manage.py audit_stoke`).
+
+Las ventas se recorren por rangos de id. Cada control es una sola consulta por
+rango que devuelve solo las filas que no cumplen, y cada reparación es un UPDATE
+que recalcula el valor en la misma sentencia, así no pisa una devolución que
+entre mientras tanto. Los rangos son independientes y se pueden auditar en
+paralelo.
+
+Además cada rango devuelve sus totales por sucursal/usuario/día/método. Como
+son sumas, se juntan al final y se comparan contra los resúmenes diarios y los
+cierres de caja.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import (
+    Case, Count, DateTimeField, DecimalField, Exists, ExpressionWrapper, F, IntegerField, Max, Min, OuterRef, Q, Subquery,
+    Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest, Round, TruncDate
+from django.utils import timezone
+
+from .jornada import dia_comercial, hora_corte
+from .models import (
+    CAMPOS_TOTAL_METODO, CierreCaja, DetalleDevolucion, DetalleVenta, Devolucion, Existencia, ResumenDiario, Venta,
+)
+
+CENTAVO = Decimal('0.01')
+IMPORTE = DecimalField(max_digits=12, decimal_places=2)
+
+# --reparar corrige venta_total (salvo anuladas, sin detalles o anteriores a monto_manual), venta_devuelto,
+# venta_vuelto, detalle_devuelto y resumen; los demás solo se informan
+CHEQUEOS = {
+    'venta_total': 'Total distinto de detalles + monto manual + recargo',
+    'venta_devuelto': 'total_devuelto distinto de la suma de sus devoluciones',
+    'venta_vuelto': 'Vuelto distinto de monto recibido - total',
+    'venta_anulada': 'Venta anulada con total_devuelto distinto del total',
+    'detalle_subtotal': 'Subtotal distinto de precio x cantidad - descuento',
+    'detalle_devuelto': 'cantidad_devuelta distinta de la suma de sus devoluciones',
+    'detalle_excedido': 'Más unidades devueltas que vendidas',
+    'resumen': 'Resumen diario distinto de las ventas del día',
+    'cierre': 'Cierre de caja distinto de las ventas del día',
+    'cierre_diferencia': 'Diferencia del cierre mal calculada',
+    'stock_negativo': 'Existencia con stock negativo',
+}
+
+
+def rangos(modelo, tamaño):
+    """Rangos (desde exclusivo, hasta inclusivo) de `tamaño` ids que cubren la tabla"""
+    limites = modelo.objects.order_by().aggregate(primero=Min('id'), ultimo=Max('id'))
+    if limites['primero'] is None:
+        return []
+    return [
+        (desde, min(desde + tamaño, limites['ultimo']))
+        for desde in range(limites['primero'] - 1, limites['ultimo'], tamaño)
+    ]
+
+
+# --- Expresiones de los valores esperados ---
+
+def suma_de(modelo, campo_relacion, campo, salida):
+    """SUM(campo) de las filas de `modelo` que apuntan a la fila externa, 0 si no hay"""
+    suma = (
+        modelo.objects.filter(**{campo_relacion: OuterRef('pk')})
+        .order_by().values(campo_relacion).annotate(suma=Sum(campo)).values('suma')
+    )
+    return Coalesce(Subquery(suma, output_field=salida), Value(0), output_field=salida)
+
+
+def total_esperado():
+    return Round(
+        suma_de(DetalleVenta, 'venta', 'subtotal', IMPORTE) + F('monto_manual') + F('recargo_tarjeta'),
+        2, output_field=IMPORTE,
+    )
+
+
+def corte_monto_manual():
+    """
+    Cuándo se aplicó la migración que agregó Venta.monto_manual. En las ventas
+    anteriores el importe manual se reconstruyó a partir del total, así que un
+    total distinto no se puede recalcular con confianza.
+    """
+    return (
+        MigrationRecorder.Migration.objects.filter(app='stoke', name='0008_promociones')
+        .values_list('applied', flat=True).first()
+    )
+
+
+def devuelto_esperado():
+    return Round(suma_de(Devolucion, 'venta', 'total', IMPORTE), 2, output_field=IMPORTE)
+
+
+def vuelto_esperado():
+    """Como Venta.calcular_vuelto: solo efectivo con monto recibido"""
+    return Case(
+        When(metodo_pago='efectivo', monto_recibido__gt=0, then=Greatest(F('monto_recibido') - F('total'), Value(0))),
+        default=Value(0),
+        output_field=IMPORTE,
+    )
+
+
+def cantidad_devuelta_esperada():
+    return suma_de(DetalleDevolucion, 'detalle_venta', 'cantidad', IntegerField())
+
+
+def dia_de_venta():
+    """Día comercial de cada venta calculado en la base (ver jornada.dia_comercial)"""
+    corte = hora_corte()
+    fecha = F('fecha')
+    if corte.hour or corte.minute:
+        fecha = ExpressionWrapper(
+            fecha - Value(timedelta(hours=corte.hour, minutes=corte.minute)), output_field=DateTimeField()
+        )
+    return TruncDate(fecha, tzinfo=timezone.get_default_timezone())
+
+
+# --- Controles por rango de ventas ---
+
+def hallazgo(chequeo, id, actual, esperado, reparado=False, **extra):
+    if isinstance(esperado, Decimal):
+        esperado = esperado.quantize(CENTAVO)
+    return {'chequeo': chequeo, 'id': id, 'actual': actual, 'esperado': esperado, 'reparado': reparado, **extra}
+
+
+def auditar_ventas(desde, hasta, reparar=False):
+    """
+    Controla las ventas con id en (desde, hasta] y sus detalles. Devuelve
+    (hallazgos, totales por (sucursal, usuario, día) y método, ids de ventas reparadas).
+    """
+    ventas = Venta.objects.filter(id__gt=desde, id__lte=hasta).order_by()
+    detalles = DetalleVenta.objects.filter(venta_id__gt=desde, venta_id__lte=hasta).order_by()
+    hallazgos = []
+    reparadas = set()
+
+    # Primero los detalles: el total de la venta se compara contra sus subtotales
+    for fila in detalles.annotate(
+        esperado=Round(F('precio_unitario') * F('cantidad') - F('descuento'), 2, output_field=IMPORTE)
+    ).exclude(subtotal=F('esperado')).values('id', 'venta_id', 'subtotal', 'esperado'):
+        hallazgos.append(hallazgo('detalle_subtotal', fila['id'], fila['subtotal'], fila['esperado'], venta=fila['venta_id']))
+
+    malas = list(
+        detalles.annotate(esperado=cantidad_devuelta_esperada())
+        .exclude(cantidad_devuelta=F('esperado')).values('id', 'venta_id', 'cantidad_devuelta', 'esperado')
+    )
+    if reparar and malas:
+        detalles.filter(id__in=[fila['id'] for fila in malas]).update(cantidad_devuelta=cantidad_devuelta_esperada())
+        reparadas.update(fila['venta_id'] for fila in malas)
+    for fila in malas:
+        hallazgos.append(hallazgo(
+            'detalle_devuelto', fila['id'], fila['cantidad_devuelta'], fila['esperado'], reparar, venta=fila['venta_id']
+        ))
+
+    for fila in detalles.filter(cantidad_devuelta__gt=F('cantidad')).values('id', 'venta_id', 'cantidad', 'cantidad_devuelta'):
+        hallazgos.append(hallazgo('detalle_excedido', fila['id'], fila['cantidad_devuelta'], fila['cantidad'], venta=fila['venta_id']))
+
+    # Totales: solo se informan las anuladas (su devolución se calculó con el total viejo), las que no
+    # tienen detalles (todo el total era monto manual) y las anteriores a monto_manual
+    corte = corte_monto_manual()
+    malas = list(
+        ventas.annotate(esperado=total_esperado(), con_detalles=Exists(DetalleVenta.objects.filter(venta=OuterRef('pk'))))
+        .exclude(total=F('esperado')).values('id', 'total', 'esperado', 'anulada', 'con_detalles', 'fecha')
+    )
+    for fila in malas:
+        if fila['anulada']:
+            fila['motivo'] = 'anulada'
+        elif not fila['con_detalles']:
+            fila['motivo'] = 'sin detalles'
+        elif corte is not None and fila['fecha'] < corte:
+            fila['motivo'] = 'anterior a monto_manual'
+    corregibles = [fila['id'] for fila in malas if 'motivo' not in fila]
+    if reparar and corregibles:
+        ventas.filter(id__in=corregibles).update(total=total_esperado())
+        reparadas.update(corregibles)
+    for fila in malas:
+        extra = {'sin_reparar': fila['motivo']} if 'motivo' in fila else {}
+        hallazgos.append(hallazgo('venta_total', fila['id'], fila['total'], fila['esperado'], reparar and not extra, **extra))
+
+    malas = list(
+        ventas.annotate(esperado=devuelto_esperado())
+        .exclude(total_devuelto=F('esperado')).values('id', 'total_devuelto', 'esperado')
+    )
+    if reparar and malas:
+        ventas.filter(id__in=[fila['id'] for fila in malas]).update(total_devuelto=devuelto_esperado())
+        reparadas.update(fila['id'] for fila in malas)
+    for fila in malas:
+        hallazgos.append(hallazgo('venta_devuelto', fila['id'], fila['total_devuelto'], fila['esperado'], reparar))
+
+    for fila in ventas.filter(anulada=True).exclude(total_devuelto=F('total')).values('id', 'total_devuelto', 'total'):
+        hallazgos.append(hallazgo('venta_anulada', fila['id'], fila['total_devuelto'], fila['total']))
+
+    # Después de corregir los totales, así el vuelto se compara contra el total bueno
+    malas = list(
+        ventas.annotate(esperado=vuelto_esperado())
+        .exclude(vuelto=F('esperado')).values('id', 'vuelto', 'esperado', 'monto_recibido', 'total')
+    )
+    if reparar and malas:
+        ventas.filter(id__in=[fila['id'] for fila in malas]).update(vuelto=vuelto_esperado())
+        reparadas.update(fila['id'] for fila in malas)
+    for fila in malas:
+        hallazgos.append(hallazgo(
+            'venta_vuelto', fila['id'], fila['vuelto'], fila['esperado'], reparar,
+            monto_recibido=fila['monto_recibido'], total=fila['total'],
+        ))
+
+    # Totales del rango para comparar con resúmenes y cierres (como CierreCaja.calcular_totales)
+    totales = totales_vacios()
+    for fila in (
+        ventas.annotate(dia=dia_de_venta())
+        .values('sucursal_id', 'usuario_id', 'dia', 'metodo_pago')
+        .annotate(neto=Sum(F('total') - F('total_devuelto')), cantidad=Count('id', filter=Q(anulada=False)))
+    ):
+        grupo = totales[(fila['sucursal_id'], fila['usuario_id'], fila['dia'])]
+        grupo[CAMPOS_TOTAL_METODO[fila['metodo_pago']]] += fila['neto'] or 0
+        grupo['total_ventas'] += fila['neto'] or 0
+        grupo['cantidad_ventas'] += fila['cantidad']
+
+    return hallazgos, totales, reparadas
+
+
+def totales_vacios():
+    """{(sucursal, usuario, día): {campo de ResumenDiario: total}}"""
+    return defaultdict(lambda: defaultdict(Decimal))
+
+
+def juntar_totales(destino, parcial):
+    for clave, campos in parcial.items():
+        grupo = destino[clave]
+        for campo, valor in campos.items():
+            grupo[campo] += valor
+
+
+def normalizar(campos):
+    """Totales de un grupo como los guarda ResumenDiario (centavos, enteros)"""
+    return {
+        campo: int(campos.get(campo, 0)) if campo == 'cantidad_ventas' else Decimal(campos.get(campo, 0)).quantize(CENTAVO)
+        for campo in ResumenDiario.CAMPOS_TOTALES
+    }
+
+
+# --- Controles sobre los totales juntados ---
+
+def auditar_resumenes(totales, reparar=False):
+    """
+    Compara los resúmenes diarios (salvo el día en curso, que se concilia al
+    cerrar la caja) contra los totales de las ventas. Reparando, corrige los
+    distintos y crea los que falten (por ejemplo, de ventas importadas).
+    """
+    hoy = dia_comercial()
+    hallazgos, cambiados, nuevos = [], [], []
+    vistos = set()
+    for resumen in ResumenDiario.objects.filter(fecha__lt=hoy).order_by('id').iterator(chunk_size=2000):
+        clave = (resumen.sucursal_id, resumen.usuario_id, resumen.fecha)
+        vistos.add(clave)
+        esperado = normalizar(totales.get(clave, {}))
+        actual = {campo: getattr(resumen, campo) for campo in ResumenDiario.CAMPOS_TOTALES}
+        if actual != esperado:
+            hallazgos.append(hallazgo('resumen', resumen.id, actual, esperado, reparar, fecha=resumen.fecha))
+            for campo, valor in esperado.items():
+                setattr(resumen, campo, valor)
+            cambiados.append(resumen)
+
+    for (sucursal_id, usuario_id, fecha), campos in totales.items():
+        if fecha >= hoy or (sucursal_id, usuario_id, fecha) in vistos:
+            continue
+        esperado = normalizar(campos)
+        if not any(esperado.values()):
+            continue
+        hallazgos.append(hallazgo(
+            'resumen', None, None, esperado, reparar, fecha=fecha, sucursal=sucursal_id, usuario=usuario_id
+        ))
+        nuevos.append(ResumenDiario(sucursal_id=sucursal_id, usuario_id=usuario_id, fecha=fecha, **esperado))
+
+    if reparar:
+        ahora = timezone.now()
+        for resumen in cambiados:
+            resumen.fecha_actualizacion = ahora
+        ResumenDiario.objects.bulk_update(cambiados, [*ResumenDiario.CAMPOS_TOTALES, 'fecha_actualizacion'], batch_size=1000)
+        ResumenDiario.objects.bulk_create(nuevos, batch_size=1000)
+    return hallazgos
+
+
+def auditar_cierres(totales):
+    """
+    Compara cada cierre con las ventas de su día. Solo se informa: el cierre
+    registra lo que había al cerrar, y una devolución posterior de una venta de
+    ese día también aparece como diferencia.
+    """
+    hallazgos = []
+    for cierre in CierreCaja.objects.order_by('id').iterator(chunk_size=2000):
+        esperado = normalizar(totales.get((cierre.sucursal_id, cierre.usuario_id, cierre.fecha), {}))
+        actual = {campo: getattr(cierre, campo) for campo in ResumenDiario.CAMPOS_TOTALES}
+        if actual != esperado:
+            hallazgos.append(hallazgo('cierre', cierre.id, actual, esperado, fecha=cierre.fecha))
+        diferencia = cierre.dinero_final - cierre.dinero_inicial - cierre.total_efectivo
+        if cierre.diferencia != diferencia:
+            hallazgos.append(hallazgo('cierre_diferencia', cierre.id, cierre.diferencia, diferencia, fecha=cierre.fecha))
+    return hallazgos
+
+
+def auditar_existencias():
+    return [
+        hallazgo('stock_negativo', fila['id'], fila['stock'], 0, sucursal=fila['sucursal_id'], producto=fila['producto_id'])
+        for fila in Existencia.objects.filter(stock__lt=0).order_by('id').values('id', 'sucursal_id', 'producto_id', 'stock')
+    ]
+
+
+def invalidar_historial(venta_ids, lote=1000):
+    """Borra el fragmento cacheado del historial de las ventas reparadas (su clave no cambia)"""
+    venta_ids = sorted(venta_ids)
+    for inicio in range(0, len(venta_ids), lote):
+        ultimas = (
+            Venta.objects.filter(id__in=venta_ids[inicio:inicio + lote])
+            .annotate(ultima_devolucion=Max('devoluciones__id')).order_by().values_list('id', 'ultima_devolucion')
+        )
+        cache.delete_many([make_template_fragment_key('historial_venta', [id, ultima]) for id, ultima in ultimas])
+
+
+def resumen(hallazgos):
+    """Cantidad de hallazgos y de reparados por control"""
+    encontrados, reparados = Counter(), Counter()
+    for fila in hallazgos:
+        encontrados[fila['chequeo']] += 1
+        reparados[fila['chequeo']] += fila['reparado']
+    return encontrados, reparados
@@ -0,0 +1,87 @@
+"""
+Backend de autenticación con caché del usuario.
+
+Django busca el usuario de la sesión en la base en cada request (y sus permisos
+cada vez que se consultan). Con STOKE_USUARIO_TTL > 0 el usuario se guarda en la
+caché de Django junto con sus permisos ya calculados, así que las requests
+autenticadas (por ejemplo, cada escaneo en buscar_producto) no consultan auth_user.
+
+La entrada se borra al guardar o eliminar el usuario (cambio de contraseña,
+desactivación, superusuario) y todas las entradas quedan vencidas cuando cambian
+grupos o permisos. Con una caché compartida (REDIS_URL) la invalidación llega a
+todos los workers al instante; con la caché local de cada proceso, los demás
+workers la ven recién al vencer el TTL, por eso ahí viene desactivada.
+
+Las sesiones abiertas con ModelBackend (antes de este backend) siguen usándolo
+hasta el próximo login: por eso sigue en AUTHENTICATION_BACKENDS.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+CLAVE_VERSION = 'stoke:usuarios:version'
+
+
+def clave_usuario(user_id):
+    return f'stoke:usuario:{user_id}'
+
+
+def ttl_usuario():
+    return getattr(settings, 'STOKE_USUARIO_TTL', 0)
+
+
+class BackendConCache(ModelBackend):
+    """ModelBackend que reutiliza el usuario (y sus permisos) guardado en la caché"""
+
+    def get_user(self, user_id):
+        ttl = ttl_usuario()
+        if not ttl:
+            return super().get_user(user_id)
+
+        clave = clave_usuario(user_id)
+        guardado = cache.get_many([clave, CLAVE_VERSION])
+        version = guardado.get(CLAVE_VERSION)
+        if clave in guardado:
+            usuario, version_usuario = guardado[clave]
+            if version_usuario == version:
+                return usuario
+
+        usuario = super().get_user(user_id)
+        if usuario is not None:
+            # Calcular los permisos antes de guardar, así quedan en la caché del objeto
+            self.get_all_permissions(usuario)
+            cache.set(clave, (usuario, version), ttl)
+        return usuario
+
+
+def invalidar_usuario(user_id):
+    cache.delete(clave_usuario(user_id))
+
+
+def invalidar_todos():
+    """Vence todos los usuarios en caché (cambios de grupos o permisos)"""
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, None)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _usuario_modificado(sender, instance, **kwargs):
+    invalidar_usuario(instance.pk)
+
+
+@receiver(post_delete, sender=Group)
+def _grupo_eliminado(sender, **kwargs):
+    invalidar_todos()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def _permisos_modificados(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar_todos()
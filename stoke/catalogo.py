@@ -0,0 +1,36 @@
+"""
+Versión del catálogo de productos.
+
+Los fragmentos de plantilla que dependen de productos y categorías (por ejemplo,
+las pestañas de la grilla de ventas) se guardan en la caché con esta versión en
+la clave: al cambiar el catálogo se genera una versión nueva y los fragmentos
+viejos dejan de usarse (y vencen solos).
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+CLAVE_VERSION = 'stoke:catalogo:version'
+
+
+def version_catalogo():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, uuid.uuid4().hex, None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def invalidar_catalogo():
+    """Llamar después de cambios en bloque (UPDATE) que no disparan señales"""
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, None)
+
+
+@receiver(post_save, sender='stoke.Producto')
+@receiver(post_delete, sender='stoke.Producto')
+@receiver(post_save, sender='stoke.Categoria')
+@receiver(post_delete, sender='stoke.Categoria')
+def _catalogo_modificado(sender, **kwargs):
+    invalidar_catalogo()
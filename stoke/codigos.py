@@ -0,0 +1,74 @@
+"""
+Normalización y validación de códigos de barras.
+
+Los lectores mandan el mismo artículo de distintas formas: EAN-13 con o sin el
+cero inicial de un UPC-A, UPC-A de 12 dígitos, ceros de relleno a la izquierda.
+Todo código numérico se guarda como GTIN-14 (rellenado con ceros), así que las
+variantes coinciden por igualdad exacta sobre un índice único. Los códigos
+internos con letras se guardan en mayúsculas y sin espacios.
+
+El dígito verificador solo se exige en los largos GTIN (EAN-8, UPC-A, EAN-13,
+GTIN-14) fuera de los prefijos GS1 de circulación restringida, que son los que
+usan los comercios para sus códigos internos y de balanza. Los demás numéricos
+(de 9 a 11 dígitos, o con esos prefijos) se aceptan como códigos internos.
+"""
+import re
+
+from django.core.exceptions import ValidationError
+
+LARGO_GTIN = 14
+LARGOS_GTIN = (8, 12, 13, 14)  # EAN-8, UPC-A, EAN-13, GTIN-14: los únicos con dígito verificador
+
+_SEPARADORES = re.compile(r'[\s-]+')
+
+
+def normalizar_codigo(codigo):
+    """Forma canónica de un código (None si está vacío)"""
+    if codigo is None:
+        return None
+    codigo = _SEPARADORES.sub('', str(codigo)).upper()
+    if not codigo:
+        return None
+    if codigo.isdigit() and len(codigo) <= LARGO_GTIN:
+        return codigo.zfill(LARGO_GTIN)
+    return codigo
+
+
+def digito_verificador(digitos):
+    """Dígito verificador GS1 de los dígitos sin el verificador"""
+    suma = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digitos)))
+    return str((10 - suma % 10) % 10)
+
+
+def circulacion_restringida(digitos):
+    """Prefijos GS1 para uso interno del comercio (peso variable, códigos propios)"""
+    if len(digitos) == 14:
+        return circulacion_restringida(digitos[1:])
+    if len(digitos) == 13:
+        # EAN-13 que empieza con 2, o un UPC-A escrito con el cero delante
+        return digitos[0] == '2' or (digitos[0] == '0' and circulacion_restringida(digitos[1:]))
+    if len(digitos) == 12:
+        return digitos[0] in '24'
+    return digitos[0] in '02'  # EAN-8
+
+
+def es_gtin(codigo):
+    """Si el código (sin separadores) es un GTIN que debe tener dígito verificador válido"""
+    return codigo.isdigit() and len(codigo) in LARGOS_GTIN and not circulacion_restringida(codigo)
+
+
+def validar_codigo(codigo):
+    """
+    Valida el dígito verificador de los códigos GTIN (EAN-8, UPC-A, EAN-13,
+    GTIN-14, con o sin ceros a la izquierda) y devuelve el código normalizado.
+    """
+    normalizado = normalizar_codigo(codigo)
+    if normalizado is None:
+        return None
+    compacto = _SEPARADORES.sub('', str(codigo))
+    if es_gtin(compacto):
+        if digito_verificador(normalizado[:-1]) != normalizado[-1]:
+            raise ValidationError(f'El código {codigo} tiene un dígito verificador inválido')
+    elif len(normalizado) > 50:
+        raise ValidationError(f'El código {codigo} es demasiado largo')
+    return normalizado
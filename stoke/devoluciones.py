@@ -0,0 +1,171 @@
+"""
+Devoluciones parciales y anulaciones de ventas.
+
+Cada operación corre en una sola transacción: registra la Devolucion, repone el
+stock de la sucursal de la venta con un UPDATE en bloque (stoke.stock) y descuenta
+lo reintegrado del ResumenDiario del día de la venta, de modo que el cierre de
+caja siga cuadrando. También deja el evento para contabilidad (stoke.eventos).
+
+Cada línea devuelta reintegra su parte del subtotal más la parte proporcional del
+recargo por tarjeta. La devolución que deja la venta sin unidades pendientes la
+anula: reintegra todo lo que faltaba (incluido el importe manual y los centavos
+de redondeo), así total_devuelto termina igual al total.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from . import eventos
+from .jornada import dia_comercial
+from .models import DetalleDevolucion, DetalleVenta, Devolucion, ResumenDiario, Venta
+from .stock import sumar_stock
+
+
+def factor_recargo(total, recargo):
+    """Multiplicador que reparte el recargo por tarjeta de una venta entre sus líneas"""
+    base = total - recargo
+    if not recargo or base <= 0:
+        return Decimal('1')
+    return total / base
+
+
+def monto_linea(subtotal, cantidad, unidades, factor=Decimal('1')):
+    """Parte proporcional del subtotal de una línea para `unidades` devueltas, con su parte del recargo"""
+    return (subtotal * unidades / cantidad * factor).quantize(Decimal('0.01'))
+
+
+def devolver(venta_id, cantidades, usuario, motivo=''):
+    """
+    Devuelve unidades de algunas líneas de una venta.
+    `cantidades` es un dict {detalle_id: unidades}. Devuelve la Devolucion creada.
+    """
+    with transaction.atomic():
+        venta = Venta.objects.select_for_update().get(pk=venta_id)
+        if venta.anulada:
+            raise ValidationError('La venta ya está anulada')
+        
+        detalles = venta.detalles.in_bulk()
+        faltantes = set(cantidades) - set(detalles)
+        if faltantes:
+            raise ValidationError(f'Los detalles {sorted(faltantes)} no pertenecen a la venta #{venta.id}')
+        
+        factor = factor_recargo(venta.total, venta.recargo_tarjeta)
+        stock = defaultdict(int)
+        lineas = []
+        for detalle_id, unidades in cantidades.items():
+            detalle = detalles[detalle_id]
+            pendientes = detalle.cantidad - detalle.cantidad_devuelta
+            if unidades > pendientes:
+                raise ValidationError(f'Solo quedan {pendientes} unidades para devolver del detalle #{detalle_id}')
+            stock[detalle.producto_id] += unidades
+            lineas.append(DetalleDevolucion(
+                detalle_venta=detalle,
+                cantidad=unidades,
+                subtotal=monto_linea(detalle.subtotal, detalle.cantidad, unidades, factor)
+            ))
+        
+        # Si no queda nada por devolver, la venta queda anulada y se reintegra todo lo que faltaba
+        completa = all(
+            detalle.cantidad - detalle.cantidad_devuelta == cantidades.get(detalle_id, 0)
+            for detalle_id, detalle in detalles.items()
+        )
+        if completa:
+            total = venta.total - venta.total_devuelto
+        else:
+            total = sum((linea.subtotal for linea in lineas), Decimal('0'))
+        devolucion = Devolucion.objects.create(venta=venta, usuario=usuario, total=total, motivo=motivo)
+        for linea in lineas:
+            linea.devolucion = devolucion
+        DetalleDevolucion.objects.bulk_create(lineas)
+        
+        sumar_stock(venta.sucursal_id, stock)
+        DetalleVenta.objects.filter(id__in=cantidades).update(
+            cantidad_devuelta=F('cantidad_devuelta') + Case(
+                *[When(id=detalle_id, then=Value(unidades)) for detalle_id, unidades in cantidades.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+        Venta.objects.filter(pk=venta.pk).update(total_devuelto=F('total_devuelto') + total, anulada=completa)
+        # Una venta anulada deja de contar en el cierre (CierreCaja.calcular_totales)
+        ResumenDiario.acumular(
+            venta.sucursal_id, dia_comercial(venta.fecha), venta.usuario_id, venta.metodo_pago, -total, cantidad=-1 if completa else 0
+        )
+        eventos.registrar_devoluciones([devolucion], {devolucion.id: lineas})
+    
+    return devolucion
+
+
+def anular_ventas(ventas, usuario, motivo=''):
+    """
+    Anula ventas completas (un queryset o una lista de ids), devolviendo todo lo
+    que quede pendiente. La cantidad de consultas no depende de cuántas ventas o
+    líneas se anulen (sí de cuántas sucursales abarquen). Devuelve la cantidad de
+    ventas anuladas.
+    """
+    ids = list(ventas.values_list('id', flat=True)) if hasattr(ventas, 'values_list') else list(ventas)
+    
+    with transaction.atomic():
+        filas = list(
+            Venta.objects.select_for_update()
+            .filter(id__in=ids, anulada=False)
+            .values('id', 'fecha', 'sucursal_id', 'usuario_id', 'metodo_pago', 'total', 'total_devuelto', 'recargo_tarjeta')
+        )
+        if not filas:
+            return 0
+        ids = [fila['id'] for fila in filas]
+        sucursal_por_venta = {fila['id']: fila['sucursal_id'] for fila in filas}
+        factor_por_venta = {fila['id']: factor_recargo(fila['total'], fila['recargo_tarjeta']) for fila in filas}
+        
+        devoluciones = Devolucion.objects.bulk_create([
+            Devolucion(
+                venta_id=fila['id'],
+                usuario=usuario,
+                total=fila['total'] - fila['total_devuelto'],
+                es_anulacion=True,
+                motivo=motivo
+            )
+            for fila in filas
+        ])
+        devolucion_por_venta = {devolucion.venta_id: devolucion for devolucion in devoluciones}
+        
+        pendientes = DetalleVenta.objects.filter(
+            venta_id__in=ids,
+            cantidad__gt=F('cantidad_devuelta')
+        ).values_list('id', 'venta_id', 'producto_id', 'cantidad', 'cantidad_devuelta', 'subtotal')
+        
+        stock = defaultdict(lambda: defaultdict(int))
+        lineas = []
+        for detalle_id, venta_id, producto_id, cantidad, devuelta, subtotal in pendientes:
+            unidades = cantidad - devuelta
+            stock[sucursal_por_venta[venta_id]][producto_id] += unidades
+            lineas.append(DetalleDevolucion(
+                devolucion=devolucion_por_venta[venta_id],
+                detalle_venta_id=detalle_id,
+                cantidad=unidades,
+                subtotal=monto_linea(subtotal, cantidad, unidades, factor_por_venta[venta_id])
+            ))
+        DetalleDevolucion.objects.bulk_create(lineas, batch_size=1000)
+        lineas_por_devolucion = defaultdict(list)
+        for linea in lineas:
+            lineas_por_devolucion[linea.devolucion.id].append(linea)
+        eventos.registrar_devoluciones(devoluciones, lineas_por_devolucion)
+        
+        for sucursal_id, cantidades in stock.items():
+            sumar_stock(sucursal_id, cantidades)
+        DetalleVenta.objects.filter(venta_id__in=ids).update(cantidad_devuelta=F('cantidad'))
+        Venta.objects.filter(id__in=ids).update(anulada=True, total_devuelto=F('total'))
+        
+        # Un UPDATE del resumen por cada sucursal/día/usuario/método afectado, no por venta
+        resumenes = defaultdict(lambda: [Decimal('0'), 0])
+        for fila in filas:
+            clave = (fila['sucursal_id'], dia_comercial(fila['fecha']), fila['usuario_id'], fila['metodo_pago'])
+            resumenes[clave][0] += fila['total'] - fila['total_devuelto']
+            resumenes[clave][1] += 1
+        for (sucursal_id, dia, usuario_id, metodo_pago), (monto, cantidad) in resumenes.items():
+            ResumenDiario.acumular(sucursal_id, dia, usuario_id, metodo_pago, -monto, cantidad=-cantidad)
+    
+    return len(ids)
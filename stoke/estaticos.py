@@ -0,0 +1,38 @@
+"""
+Almacenamiento de archivos estáticos para producción.
+
+Si whitenoise está instalado se usa su CompressedManifestStaticFilesStorage; si
+no, ManifestComprimido: nombres con hash (se pueden cachear "para siempre") y
+una copia .gz al lado de cada archivo de texto, lista para servir con
+`gzip_static on` en nginx. Ambos requieren correr collectstatic al desplegar.
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+
+class ManifestComprimido(ManifestStaticFilesStorage):
+    EXTENSIONES = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.html')
+    TAMAÑO_MINIMO = 1024  # Por debajo de esto comprimir no ahorra nada
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for nombre in self.hashed_files.values():
+            if nombre.endswith(self.EXTENSIONES):
+                self.comprimir(nombre)
+
+    def comprimir(self, nombre):
+        with self.open(nombre) as archivo:
+            contenido = archivo.read()
+        if len(contenido) < self.TAMAÑO_MINIMO:
+            return
+        comprimido = gzip.compress(contenido, compresslevel=9, mtime=0)
+        if len(comprimido) >= len(contenido):
+            return
+        destino = f'{nombre}.gz'
+        if self.exists(destino):
+            self.delete(destino)
+        self._save(destino, ContentFile(comprimido))
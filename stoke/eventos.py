@@ -0,0 +1,232 @@
+"""
+Outbox de eventos para sistemas externos (contabilidad, facturación).
+
+El cobro y las devoluciones solo insertan una fila en EventoSalida dentro de su
+propia transacción: no hay red en el camino de la venta. `manage.py
+despachar_eventos` después:
+
+1. Reclama un lote de pendientes (SELECT ... FOR UPDATE SKIP LOCKED en
+   PostgreSQL) y les corre el próximo intento unos segundos hacia adelante, así
+   otro despachador no los toma mientras se envían. Si el proceso muere, el
+   evento vuelve a la cola cuando vence esa reserva.
+2. Los envía fuera de la transacción con el enviador de STOKE_EVENTOS_ENVIADOR.
+   La entrega es "al menos una vez": cada envío lleva Idempotency-Key para que
+   el receptor descarte repetidos.
+3. Marca los entregados; los que fallan se reintentan con espera exponencial
+   hasta STOKE_EVENTOS_MAX_INTENTOS y después quedan como fallidos (se
+   reintentan a mano desde el admin).
+4. Borra los entregados más viejos que STOKE_EVENTOS_RETENCION_DIAS.
+"""
+import http.client
+import random
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import EventoSalida
+from .serializers import dumps
+
+RESERVA = timedelta(seconds=60)  # Tiempo que un lote reclamado queda fuera de la cola
+ESPERA_INICIAL = 5  # Segundos antes del primer reintento; se duplica en cada intento
+ESPERA_MAXIMA = 3600
+LOTE_COMPACTACION = 5000
+
+
+# --- Registro (dentro de la transacción que origina el evento) ---
+
+def datos_venta(venta, lineas):
+    return {
+        'venta_id': venta.id,
+        'fecha': venta.fecha,
+        'sucursal_id': venta.sucursal_id,
+        'usuario_id': venta.usuario_id,
+        'metodo_pago': venta.metodo_pago,
+        'total': venta.total,
+        'recargo_tarjeta': venta.recargo_tarjeta,
+        'monto_manual': venta.monto_manual,
+        'lineas': [
+            {
+                'producto_id': linea.producto_id,
+                'cantidad': linea.cantidad,
+                'precio_unitario': linea.precio_unitario,
+                'descuento': linea.descuento,
+                'subtotal': linea.subtotal,
+            }
+            for linea in lineas
+        ],
+    }
+
+
+def datos_devolucion(devolucion, lineas):
+    return {
+        'devolucion_id': devolucion.id,
+        'venta_id': devolucion.venta_id,
+        'fecha': devolucion.fecha,
+        'total': devolucion.total,
+        'es_anulacion': devolucion.es_anulacion,
+        'motivo': devolucion.motivo,
+        'lineas': [
+            {'detalle_venta_id': linea.detalle_venta_id, 'cantidad': linea.cantidad, 'subtotal': linea.subtotal}
+            for linea in lineas
+        ],
+    }
+
+
+def registrar_venta(venta, lineas):
+    """Evento venta.registrada; `lineas` son las de la cotización (o los DetalleVenta)"""
+    EventoSalida.objects.create(tipo='venta.registrada', clave=str(venta.id), datos=datos_venta(venta, lineas))
+
+
+def registrar_devoluciones(devoluciones, lineas_por_devolucion):
+    """Eventos venta.devolucion (o venta.anulada) en un solo INSERT"""
+    EventoSalida.objects.bulk_create([
+        EventoSalida(
+            tipo='venta.anulada' if devolucion.es_anulacion else 'venta.devolucion',
+            clave=str(devolucion.id),
+            datos=datos_devolucion(devolucion, lineas_por_devolucion.get(devolucion.id, [])),
+        )
+        for devolucion in devoluciones
+    ])
+
+
+# --- Envío ---
+
+class ErrorEntrega(Exception):
+    pass
+
+
+class EnviadorHTTP:
+    """
+    POST de cada evento como JSON a STOKE_EVENTOS_URL, reutilizando la conexión
+    entre eventos del mismo lote. Cualquier respuesta que no sea 2xx es un error.
+    """
+
+    def __init__(self):
+        url = getattr(settings, 'STOKE_EVENTOS_URL', '')
+        if not url:
+            raise ErrorEntrega('Falta configurar STOKE_EVENTOS_URL')
+        partes = urlsplit(url)
+        self.clase = http.client.HTTPSConnection if partes.scheme == 'https' else http.client.HTTPConnection
+        self.servidor = partes.netloc
+        self.ruta = partes.path or '/'
+        if partes.query:
+            self.ruta += '?' + partes.query
+        self.timeout = getattr(settings, 'STOKE_EVENTOS_TIMEOUT', 10)
+        self.token = getattr(settings, 'STOKE_EVENTOS_TOKEN', '')
+        self.conexion = None
+
+    def enviar(self, evento):
+        cuerpo = dumps({
+            'id': evento.id,
+            'tipo': evento.tipo,
+            'clave': evento.clave,
+            'fecha': evento.fecha_creacion,
+            'datos': evento.datos,
+        })
+        cabeceras = {
+            'Content-Type': 'application/json',
+            'Idempotency-Key': f'stoke-{evento.id}',
+        }
+        if self.token:
+            cabeceras['Authorization'] = f'Bearer {self.token}'
+
+        # Si el servidor cerró la conexión reutilizada, se reintenta una vez con una nueva
+        for reintento in (False, True):
+            if self.conexion is None:
+                self.conexion = self.clase(self.servidor, timeout=self.timeout)
+            try:
+                self.conexion.request('POST', self.ruta, cuerpo, cabeceras)
+                respuesta = self.conexion.getresponse()
+                contenido = respuesta.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                self.cerrar()
+                if reintento:
+                    raise ErrorEntrega(f'{type(e).__name__}: {e}')
+        if not 200 <= respuesta.status < 300:
+            raise ErrorEntrega(f'HTTP {respuesta.status}: {contenido[:200].decode(errors="replace")}')
+
+    def cerrar(self):
+        if self.conexion is not None:
+            self.conexion.close()
+            self.conexion = None
+
+
+def obtener_enviador():
+    return import_string(settings.STOKE_EVENTOS_ENVIADOR)()
+
+
+# --- Despacho ---
+
+def espera(intentos):
+    """Segundos hasta el próximo intento (exponencial, con ±20% para no sincronizar reintentos)"""
+    segundos = min(ESPERA_INICIAL * 2 ** max(intentos - 1, 0), ESPERA_MAXIMA)
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+
+def reclamar(cantidad):
+    """Toma hasta `cantidad` eventos vencidos y los reserva (varios despachadores no se pisan)"""
+    ahora = timezone.now()
+    with transaction.atomic():
+        pendientes = EventoSalida.objects.filter(estado='pendiente', proximo_intento__lte=ahora).order_by('proximo_intento')
+        if connection.features.has_select_for_update_skip_locked:
+            pendientes = pendientes.select_for_update(skip_locked=True)
+        ids = list(pendientes.values_list('id', flat=True)[:cantidad])
+        if not ids:
+            return []
+        EventoSalida.objects.filter(id__in=ids).update(proximo_intento=ahora + RESERVA, intentos=F('intentos') + 1)
+    return list(EventoSalida.objects.filter(id__in=ids).order_by('id'))
+
+
+def despachar(enviador, cantidad=100):
+    """
+    Envía un lote. Ante el primer error se corta el lote (si el receptor está
+    caído, los demás también fallarían) y lo no enviado vuelve a la cola sin
+    contar el intento. Devuelve (reclamados, entregados, fallidos).
+    """
+    eventos = reclamar(cantidad)
+    entregados = []
+    fallido = None
+    for evento in eventos:
+        try:
+            enviador.enviar(evento)
+        except Exception as e:
+            fallido = evento
+            error = str(e) or type(e).__name__
+            break
+        entregados.append(evento.id)
+
+    ahora = timezone.now()
+    if entregados:
+        EventoSalida.objects.filter(id__in=entregados).update(estado='entregado', fecha_entrega=ahora, ultimo_error='')
+    if fallido is not None:
+        agotado = fallido.intentos >= settings.STOKE_EVENTOS_MAX_INTENTOS
+        EventoSalida.objects.filter(pk=fallido.pk).update(
+            estado='fallido' if agotado else 'pendiente',
+            proximo_intento=ahora + espera(fallido.intentos),
+            ultimo_error=error[:1000],
+        )
+        sin_enviar = [evento.id for evento in eventos[len(entregados) + 1:]]
+        if sin_enviar:
+            EventoSalida.objects.filter(id__in=sin_enviar).update(
+                proximo_intento=ahora + espera(fallido.intentos), intentos=F('intentos') - 1
+            )
+    return len(eventos), len(entregados), int(fallido is not None)
+
+
+def compactar(dias=None):
+    """Borra los eventos entregados hace más de `dias` días, de a lotes. Devuelve cuántos"""
+    dias = settings.STOKE_EVENTOS_RETENCION_DIAS if dias is None else dias
+    limite = timezone.now() - timedelta(days=dias)
+    viejos = EventoSalida.objects.filter(estado='entregado', fecha_entrega__lt=limite)
+    borrados = 0
+    while True:
+        ids = list(viejos.values_list('id', flat=True)[:LOTE_COMPACTACION])
+        if not ids:
+            return borrados
+        borrados += EventoSalida.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,46 @@
+"""
+Día comercial (jornada) del kiosco.
+
+Un día comercial empieza a la hora de corte (settings.STOKE_HORA_CORTE, por
+defecto medianoche) en la zona horaria local (TIME_ZONE) y termina a la misma
+hora del día siguiente. Los kioscos que cierran pasada la medianoche pueden
+configurar, por ejemplo, STOKE_HORA_CORTE = '04:00' para que las ventas de la
+madrugada cuenten en el día anterior.
+
+Los rangos son semiabiertos [inicio, fin) y en UTC, de modo que los filtros
+quedan como `fecha >= inicio AND fecha < fin` y usan el índice de `fecha`.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def hora_corte():
+    """Hora local en la que empieza cada día comercial"""
+    corte = getattr(settings, 'STOKE_HORA_CORTE', '00:00')
+    if isinstance(corte, time):
+        return corte
+    return time.fromisoformat(corte)
+
+
+def dia_comercial(momento=None):
+    """Fecha del día comercial al que pertenece `momento` (por defecto, ahora)"""
+    corte = hora_corte()
+    local = timezone.localtime(momento)
+    return (local - timedelta(hours=corte.hour, minutes=corte.minute)).date()
+
+
+def rango_dia(fecha):
+    """Devuelve (inicio, fin) en UTC del día comercial `fecha`, con `fin` excluido"""
+    corte = hora_corte()
+    zona = timezone.get_default_timezone()
+    inicio = timezone.make_aware(datetime.combine(fecha, corte), zona)
+    fin = timezone.make_aware(datetime.combine(fecha + timedelta(days=1), corte), zona)
+    return inicio.astimezone(dt_timezone.utc), fin.astimezone(dt_timezone.utc)
+
+
+def filtro_dia(fecha, campo='fecha'):
+    """Kwargs de filtro para las filas de `campo` dentro del día comercial `fecha`"""
+    inicio, fin = rango_dia(fecha)
+    return {f'{campo}__gte': inicio, f'{campo}__lt': fin}
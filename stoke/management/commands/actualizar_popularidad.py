@@ -0,0 +1,26 @@
+"""
+Comando para correr la ventana de 30 días de los contadores de unidades vendidas
+Uso:
+    python manage.py actualizar_popularidad                  # en cron, una vez por día pasada la hora de corte
+    python manage.py actualizar_popularidad --reconstruir    # recalcula todo desde las ventas (al instalar o tras importar)
+"""
+from django.core.management.base import BaseCommand
+
+from stoke import popularidad
+
+
+class Command(BaseCommand):
+    help = 'Actualiza los contadores de unidades vendidas que ordenan la grilla y la búsqueda'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reconstruir', action='store_true',
+            help='Recalcular hoy, 30 días y total desde todas las ventas (mejor con las cajas cerradas)',
+        )
+
+    def handle(self, *args, **options):
+        if options['reconstruir']:
+            filas = popularidad.reconstruir()
+        else:
+            filas = popularidad.actualizar()
+        self.stdout.write(self.style.SUCCESS(f'✅ {filas} existencias actualizadas'))
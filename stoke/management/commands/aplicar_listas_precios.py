@@ -0,0 +1,23 @@
+"""
+Comando para aplicar las listas de precios cuya vigencia ya comenzó
+Uso: python manage.py aplicar_listas_precios (programarlo en cron cada pocos minutos)
+"""
+from django.core.management.base import BaseCommand
+
+from stoke.models import ListaPrecios
+
+
+class Command(BaseCommand):
+    help = 'Aplica las listas de precios programadas cuya fecha de vigencia ya llegó'
+
+    def handle(self, *args, **options):
+        aplicadas = ListaPrecios.aplicar_pendientes()
+        
+        if not aplicadas:
+            self.stdout.write('No hay listas de precios pendientes')
+            return
+        
+        for lista, cantidad in aplicadas.items():
+            self.stdout.write(
+                self.style.SUCCESS(f'✅ {lista.nombre}: {cantidad} productos actualizados')
+            )
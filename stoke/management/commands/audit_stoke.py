@@ -0,0 +1,100 @@
+"""
+Comando para controlar la integridad de ventas, devoluciones, resúmenes, cierres y stock
+Uso:
+    python manage.py audit_stoke                          # solo informa (auditorias/<fecha y hora>.jsonl)
+    python manage.py audit_stoke --reparar                # además corrige los campos calculados
+    python manage.py audit_stoke --procesos 8 --filas 100000 --salida /tmp/auditoria.jsonl
+
+Los controles y qué corrige --reparar están en stoke/auditoria.py (CHEQUEOS).
+El stock negativo, los subtotales y los cierres solo se informan, igual que los
+totales de las ventas anuladas, sin detalles o anteriores a Venta.monto_manual.
+"""
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from stoke import auditoria
+from stoke.models import Venta
+from stoke.serializers import dumps
+
+
+class Command(BaseCommand):
+    help = 'Controla los invariantes de los datos de stoke y opcionalmente corrige los campos calculados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reparar', action='store_true', help='Corregir en bloque los campos calculados')
+        parser.add_argument('--procesos', type=int, default=min(8, os.cpu_count() or 1), help='Hilos (solo PostgreSQL)')
+        parser.add_argument('--filas', type=int, default=50_000, help='Ids de venta por rango')
+        parser.add_argument('--salida', help='Archivo del informe (por defecto auditorias/<fecha y hora>.jsonl)')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        reparar = options['reparar']
+        salida = options['salida'] or os.path.join(
+            settings.BASE_DIR, 'auditorias', timezone.localtime().strftime('%Y%m%d-%H%M%S') + '.jsonl'
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+        inicio = time.monotonic()
+
+        rangos = auditoria.rangos(Venta, options['filas'])
+        paralelo = connections[DEFAULT_DB_ALIAS].vendor == 'postgresql' and options['procesos'] > 1
+
+        def auditar(rango):
+            try:
+                with transaction.atomic():
+                    return auditoria.auditar_ventas(*rango, reparar=reparar)
+            finally:
+                if paralelo:
+                    connections[DEFAULT_DB_ALIAS].close()
+
+        encontrados, reparados = Counter(), Counter()
+        totales = auditoria.totales_vacios()
+        reparadas = set()
+        hilos = ThreadPoolExecutor(max_workers=options['procesos']) if paralelo else None
+        with open(salida, 'wb') as informe:
+            def anotar(filas):
+                cantidades, corregidos = auditoria.resumen(filas)
+                encontrados.update(cantidades)
+                reparados.update(corregidos)
+                informe.writelines(dumps(fila) + b'\n' for fila in filas)
+
+            try:
+                resultados = hilos.map(auditar, rangos) if hilos else map(auditar, rangos)
+                for numero, (filas, parcial, ids) in enumerate(resultados, 1):
+                    anotar(filas)
+                    auditoria.juntar_totales(totales, parcial)
+                    reparadas.update(ids)
+                    if self.verbosity > 1:
+                        self.stdout.write(f'Rango {numero}/{len(rangos)}: {len(filas)} problemas')
+            finally:
+                if hilos:
+                    hilos.shutdown(cancel_futures=True)
+
+            with transaction.atomic():
+                anotar(auditoria.auditar_resumenes(totales, reparar=reparar))
+            anotar(auditoria.auditar_cierres(totales))
+            anotar(auditoria.auditar_existencias())
+
+        if reparadas:
+            auditoria.invalidar_historial(reparadas)
+
+        for chequeo, descripcion in auditoria.CHEQUEOS.items():
+            if encontrados[chequeo] or self.verbosity > 1:
+                linea = f'{chequeo:<20} {encontrados[chequeo]:>10}  {descripcion}'
+                if reparados[chequeo]:
+                    linea += f' ({reparados[chequeo]} reparados)'
+                self.stdout.write(linea)
+
+        segundos = time.monotonic() - inicio
+        if encontrados:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ {sum(encontrados.values())} problemas, {sum(reparados.values())} reparados. Informe en {salida} ({segundos:.1f} s)'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ Sin problemas ({segundos:.1f} s)'))
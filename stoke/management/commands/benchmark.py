@@ -0,0 +1,344 @@
+"""
+Comando para medir el costo de CPU por request de los caminos críticos
+Uso: python manage.py benchmark {serializacion,sesiones,plantillas,escaneo,arranque} [--iteraciones 500]
+
+Los datos de prueba se crean dentro de una transacción que se revierte al final,
+así que se puede correr contra la base real sin dejar rastros. `arranque` mide en
+procesos nuevos (solo lectura) el arranque en frío y la primera request.
+"""
+import copy
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.http import JsonResponse
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from stoke import serializers
+from stoke.codigos import normalizar_codigo
+from stoke.models import Categoria, DetalleVenta, Existencia, Producto, Sucursal, Venta
+from stoke.stock import anotar_stock
+
+
+def medir(funcion, iteraciones):
+    """Tiempo de CPU promedio por llamada, en microsegundos"""
+    funcion()  # calentar
+    inicio = time.process_time()
+    for _ in range(iteraciones):
+        funcion()
+    return (time.process_time() - inicio) / iteraciones * 1_000_000
+
+
+# Corre en un proceso nuevo: tiempos (ms) desde el import de Django hasta el primer escaneo
+PROCESO_ARRANQUE = '''
+import json, sys, time
+inicio = time.perf_counter()
+import django
+django.setup()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+tiempos = {'arranque': (time.perf_counter() - inicio) * 1000}
+
+if sys.argv[1] == '1':
+    from stoke.arranque import precalentar
+    inicio = time.perf_counter()
+    precalentar()
+    tiempos['precalentado'] = (time.perf_counter() - inicio) * 1000
+
+from django.test import Client
+from django.test.utils import override_settings
+from stoke.models import Producto
+
+with override_settings(ALLOWED_HOSTS=['testserver']):
+    cliente = Client()
+    for paso in ('primera request', 'segunda request'):
+        inicio = time.perf_counter()
+        cliente.get('/login/')
+        tiempos[paso] = (time.perf_counter() - inicio) * 1000
+
+inicio = time.perf_counter()
+Producto.ids_por_codigo(['7790310981238'])
+tiempos['primer escaneo'] = (time.perf_counter() - inicio) * 1000
+print(json.dumps(tiempos))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo de CPU por request (antes/después) de los caminos críticos'
+
+    ESCENARIOS = ['serializacion', 'sesiones', 'plantillas', 'escaneo', 'arranque']
+
+    def add_arguments(self, parser):
+        parser.add_argument('escenario', choices=self.ESCENARIOS, help='Qué medir')
+        parser.add_argument('--iteraciones', type=int, default=500, help='Repeticiones por medición')
+
+    def handle(self, *args, **options):
+        self.iteraciones = options['iteraciones']
+        with transaction.atomic():
+            getattr(self, f"escenario_{options['escenario']}")()
+            transaction.set_rollback(True)
+
+    def reportar(self, nombre, antes, despues):
+        ahorro = (1 - despues / antes) * 100 if antes else 0
+        self.stdout.write(f'{nombre:<32} {antes:>10.1f} µs {despues:>10.1f} µs {ahorro:>7.1f} %')
+
+    def encabezado(self, titulo):
+        self.stdout.write(self.style.SUCCESS(titulo))
+        self.stdout.write(f"{'':<32} {'antes':>13} {'después':>13} {'ahorro':>9}")
+
+    def crear_catalogo(self, cantidad=200):
+        """Categoría, sucursal y productos de prueba (con 100 unidades en la sucursal)"""
+        categoria = Categoria.objects.create(nombre='Benchmark')
+        sucursal = Sucursal.objects.create(nombre='Benchmark')
+        Producto.objects.bulk_create([
+            Producto(
+                nombre=f'Producto benchmark {i:05d}',
+                codigo_barras=f'99{i:011d}',
+                codigo_normalizado=normalizar_codigo(f'99{i:011d}'),
+                precio=Decimal('1234.56'),
+                categoria=categoria,
+                tamaño='500ml',
+            )
+            for i in range(cantidad)
+        ])
+        Existencia.objects.bulk_create([
+            Existencia(sucursal=sucursal, producto_id=producto_id, stock=100)
+            for producto_id in Producto.objects.filter(categoria=categoria).values_list('id', flat=True)
+        ])
+        return categoria, sucursal
+
+    def escenario_serializacion(self):
+        from stoke.views import CAMPOS_BUSQUEDA, CAMPOS_GRILLA
+
+        _, sucursal = self.crear_catalogo()
+        productos = anotar_stock(Producto.objects.filter(nombre__icontains='benchmark', activo=True), sucursal.id)
+
+        # Búsqueda: instancias completas + float + JsonResponse (como antes)
+        def busqueda_antes():
+            return JsonResponse({'productos': [{
+                'id': p.id,
+                'nombre': p.nombre,
+                'precio': float(p.precio),
+                'stock': p.stock,
+                'codigo_barras': p.codigo_barras or '',
+                'tamaño': p.tamaño or '',
+                'categoria': p.categoria.nombre if p.categoria else ''
+            } for p in productos[:10]]}).content
+
+        def busqueda_despues():
+            return serializers.RespuestaJSON({'productos': list(productos.values(*CAMPOS_BUSQUEDA)[:10])}).content
+
+        # Grilla: página de 200 productos
+        def grilla_antes():
+            return JsonResponse({'productos': [{
+                'id': p.id,
+                'nombre': p.nombre,
+                'precio': float(p.precio),
+                'stock': p.stock,
+                'tamaño': p.tamaño,
+                'categoria_id': p.categoria_id,
+            } for p in productos.order_by('nombre', 'id')[:200]]}).content
+
+        def grilla_despues():
+            return serializers.RespuestaJSON({
+                'productos': list(productos.order_by('-vendidas', 'nombre', 'id').values(*CAMPOS_GRILLA)[:200])
+            }).content
+
+        # Cuerpo de una venta de 20 líneas
+        ids = list(productos.values_list('id', flat=True)[:20])
+        cuerpo = json.dumps({
+            'metodo_pago': 'efectivo',
+            'total': '24691.20',
+            'monto_recibido': '25000.00',
+            'detalles': [{'producto_id': producto_id, 'cantidad': 1} for producto_id in ids],
+        }).encode()
+
+        def venta_antes():
+            return json.loads(cuerpo)
+
+        def venta_despues():
+            return serializers.loads(cuerpo)
+
+        datos_venta = serializers.loads(cuerpo)
+
+        def validacion():
+            return serializers.validar_venta(datos_venta)
+
+        backend = 'orjson' if serializers.orjson is not None else 'json (stdlib)'
+        self.encabezado(f'Serialización JSON (backend: {backend}, {self.iteraciones} iteraciones)')
+        self.reportar('buscar_producto (10 filas)', medir(busqueda_antes, self.iteraciones), medir(busqueda_despues, self.iteraciones))
+        self.reportar('listar_productos (200 filas)', medir(grilla_antes, self.iteraciones), medir(grilla_despues, self.iteraciones))
+        self.reportar('POST ventas (decodificación)', medir(venta_antes, self.iteraciones), medir(venta_despues, self.iteraciones))
+        # Antes no se validaba nada: es costo nuevo, no una regresión del parseo
+        self.stdout.write(f"{'POST ventas (validación)':<32} {'-':>13} {medir(validacion, self.iteraciones):>10.1f} µs")
+
+    def escenario_sesiones(self):
+        _, sucursal = self.crear_catalogo()
+        usuario = User.objects.create_user('benchmark-sesiones')
+        sucursal.usuarios.add(usuario)
+
+        backend_antes = 'django.contrib.auth.backends.ModelBackend'
+        backend_despues = 'stoke.autenticacion.BackendConCache'
+        motores = {
+            'db': 'django.contrib.sessions.backends.db',
+            'cached_db': 'django.contrib.sessions.backends.cached_db',
+            'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+        }
+
+        def preparar(motor, backend, ttl):
+            """Cliente logueado con la configuración dada, ya con la sucursal en la sesión"""
+            with override_settings(SESSION_ENGINE=motor, AUTHENTICATION_BACKENDS=[backend], STOKE_USUARIO_TTL=ttl, ALLOWED_HOSTS=['testserver']):
+                cliente = Client()
+                cliente.force_login(usuario, backend=backend)
+                cliente.get('/buscar-producto/', {'q': 'benchmark 00001'})
+            return cliente
+
+        def escaneo(cliente, motor, backend, ttl):
+            def funcion():
+                with override_settings(SESSION_ENGINE=motor, AUTHENTICATION_BACKENDS=[backend], STOKE_USUARIO_TTL=ttl, ALLOWED_HOSTS=['testserver']):
+                    return cliente.get('/buscar-producto/', {'q': 'benchmark 00001'})
+            return funcion
+
+        def consultas(funcion):
+            funcion()
+            with CaptureQueriesContext(connection) as capturadas:
+                funcion()
+            return len(capturadas)
+
+        antes = escaneo(preparar(motores['db'], backend_antes, 0), motores['db'], backend_antes, 0)
+        tiempo_antes = medir(antes, self.iteraciones)
+        consultas_antes = consultas(antes)
+
+        self.encabezado(f'Sesiones y usuario en buscar_producto ({self.iteraciones} iteraciones, configurado: {settings.SESSION_ENGINE})')
+        resultados = []
+        for nombre, motor in motores.items():
+            despues = escaneo(preparar(motor, backend_despues, 300), motor, backend_despues, 300)
+            self.reportar(f'escaneo {nombre} + usuario', tiempo_antes, medir(despues, self.iteraciones))
+            resultados.append((nombre, consultas(despues)))
+
+        self.stdout.write(f'Consultas por escaneo: antes (db, sin caché) {consultas_antes}; ' + ', '.join(
+            f'{nombre} {cantidad}' for nombre, cantidad in resultados
+        ))
+        self.stdout.write('"antes" es la sesión en la base con ModelBackend (una consulta de sesión y otra de usuario por request).')
+
+    def escenario_plantillas(self):
+        _, sucursal = self.crear_catalogo()
+        usuario = User.objects.create_user('benchmark-plantillas')
+        sucursal.usuarios.add(usuario)
+
+        # 100 ventas de 3 productos cada una para el historial
+        productos = list(Producto.objects.filter(nombre__icontains='benchmark')[:3])
+        ventas = Venta.objects.bulk_create([
+            Venta(sucursal=sucursal, usuario=usuario, metodo_pago='efectivo', total=Decimal('3703.68'))
+            for _ in range(100)
+        ])
+        if not all(venta.pk for venta in ventas):
+            ventas = list(Venta.objects.filter(usuario=usuario))
+        DetalleVenta.objects.bulk_create([
+            DetalleVenta(venta=venta, producto=producto, cantidad=1, precio_unitario=producto.precio, subtotal=producto.precio)
+            for venta in ventas
+            for producto in productos
+        ])
+
+        # "antes": plantillas leídas y compiladas en cada render, sin caché de fragmentos
+        plantillas_sin_cache = copy.deepcopy(settings.TEMPLATES)
+        plantillas_sin_cache[0]['OPTIONS']['loaders'] = [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]
+        antes = {
+            'TEMPLATES': plantillas_sin_cache,
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        }
+        despues = {
+            'TEMPLATES': settings.TEMPLATES,
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-plantillas'}},
+        }
+
+        def pagina(configuracion, url):
+            with override_settings(ALLOWED_HOSTS=['testserver'], **configuracion):
+                cliente = Client()
+                cliente.force_login(usuario)
+                cliente.get(url)
+
+                def funcion():
+                    with override_settings(ALLOWED_HOSTS=['testserver'], **configuracion):
+                        return cliente.get(url)
+                with CaptureQueriesContext(connection) as capturadas:
+                    funcion()
+                consultas = len(capturadas)  # Antes de medir: cada request vacía el registro de consultas
+                return medir(funcion, self.iteraciones), consultas
+
+        self.encabezado(f'Render de páginas del POS ({self.iteraciones} iteraciones)')
+        consultas = []
+        for nombre, url in [('ventas.html', '/ventas/'), ('historial_ventas.html (100 ventas)', '/historial/')]:
+            tiempo_antes, consultas_antes = pagina(antes, url)
+            tiempo_despues, consultas_despues = pagina(despues, url)
+            self.reportar(nombre, tiempo_antes, tiempo_despues)
+            consultas.append(f'{nombre} {consultas_antes} → {consultas_despues}')
+        self.stdout.write('Consultas por request: ' + '; '.join(consultas))
+        self.stdout.write('"antes" usa los loaders sin caché y sin caché de fragmentos; "después" la configuración actual con la caché caliente.')
+
+    def escenario_escaneo(self):
+        _, sucursal = self.crear_catalogo()
+        usuario = User.objects.create_user('benchmark-escaneo')
+        sucursal.usuarios.add(usuario)
+        codigos = [f'99{i:011d}' for i in range(0, 200, 20)]  # Una canasta de 10 productos
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            cliente = Client()
+            cliente.force_login(usuario)
+            cliente.get('/ventas/')
+
+            def antes():
+                for codigo in codigos:
+                    cliente.get('/buscar-producto/', {'q': codigo})
+
+            def despues():
+                return cliente.get('/productos/resolver/', {'codigo': codigos})
+
+            def consultas(funcion):
+                with CaptureQueriesContext(connection) as capturadas:
+                    funcion()
+                return len(capturadas)
+
+            iteraciones = max(1, self.iteraciones // 10)
+            self.encabezado(f'Canasta de {len(codigos)} escaneos ({iteraciones} iteraciones)')
+            self.reportar('un GET por escaneo vs un lote', medir(antes, iteraciones), medir(despues, iteraciones))
+            self.stdout.write(f'Consultas por canasta: antes {consultas(antes)}, después {consultas(despues)}')
+
+    def escenario_arranque(self):
+        def proceso(precalentado):
+            resultado = subprocess.run(
+                [sys.executable, '-c', PROCESO_ARRANQUE, '1' if precalentado else '0'],
+                cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+            )
+            if resultado.returncode:
+                raise CommandError(resultado.stderr.strip().splitlines()[-1])
+            return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+        def medianas(precalentado, veces):
+            corridas = [proceso(precalentado) for _ in range(veces)]
+            return {paso: statistics.median(corrida[paso] for corrida in corridas) for paso in corridas[0]}
+
+        veces = max(3, self.iteraciones // 100)
+        frio, caliente = medianas(False, veces), medianas(True, veces)
+
+        self.stdout.write(self.style.SUCCESS(f'Arranque en frío y primeras requests (mediana de {veces} procesos)'))
+        self.stdout.write(f"{'':<32} {'sin precalentar':>16} {'precalentado':>14}")
+        for paso in ('arranque', 'precalentado', 'primera request', 'segunda request', 'primer escaneo'):
+            sin = f'{frio[paso]:>13.1f} ms' if paso in frio else f"{'-':>16}"
+            self.stdout.write(f"{paso:<32} {sin} {caliente[paso]:>11.1f} ms")
+        self.stdout.write(
+            'Con preload_app (gunicorn.conf.py) el arranque y el precalentado los paga una vez el master '
+            'y los workers heredan rutas, plantillas e índices ya armados. Las requests son GET /login/.'
+        )
@@ -0,0 +1,18 @@
+"""
+Comando para crear los grupos de usuarios (Vendedores) con sus permisos
+Uso: python manage.py configurar_permisos (se puede correr las veces que haga falta)
+"""
+from django.contrib.auth.models import Group, Permission
+from django.core.management.base import BaseCommand
+
+from stoke.permisos import configurar_grupos
+
+
+class Command(BaseCommand):
+    help = 'Crea los grupos de usuarios y les asigna sus permisos (idempotente)'
+
+    def handle(self, *args, **options):
+        for grupo, cantidad in configurar_grupos(Group, Permission).items():
+            self.stdout.write(
+                self.style.SUCCESS(f'✅ {grupo}: {cantidad} permisos agregados')
+            )
@@ -3,7 +3,9 @@ Comando para crear usuarios normales con acceso al admin
 Uso: python manage.py create_user username password email
 """
 from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, Permission, User
+
+from stoke.permisos import configurar_grupos
 
 
 class Command(BaseCommand):
@@ -37,6 +39,14 @@ class Command(BaseCommand):
             is_superuser=is_superuser
         )
         
+        if not is_superuser:
+            # Los usuarios normales entran al grupo Vendedores (se crea si falta)
+            vendedores = Group.objects.filter(name='Vendedores').first()
+            if vendedores is None:
+                configurar_grupos(Group, Permission)
+                vendedores = Group.objects.get(name='Vendedores')
+            user.groups.add(vendedores)
+        
         if is_superuser:
             self.stdout.write(
                 self.style.SUCCESS(f'✅ Superusuario "{username}" creado exitosamente')
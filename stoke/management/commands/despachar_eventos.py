@@ -0,0 +1,72 @@
+"""
+Comando para enviar a contabilidad/facturación los eventos del outbox (ver stoke/eventos.py)
+Uso:
+    python manage.py despachar_eventos               # proceso permanente (systemd, supervisor)
+    python manage.py despachar_eventos --una-vez     # vacía la cola y termina (cron)
+    python manage.py despachar_eventos --lote 500 --espera 2
+
+Se pueden correr varios a la vez (en PostgreSQL cada uno toma eventos distintos).
+Con SIGTERM o Ctrl+C termina el lote en curso y sale.
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from stoke import eventos
+
+COMPACTAR_CADA = 3600  # Segundos entre borrados de eventos entregados viejos
+
+
+class Command(BaseCommand):
+    help = 'Envía los eventos pendientes a los sistemas externos, con reintentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=100, help='Eventos por lote')
+        parser.add_argument('--una-vez', action='store_true', help='Salir cuando no queden eventos vencidos')
+        parser.add_argument('--espera', type=float, default=1.0, help='Segundos de espera con la cola vacía')
+
+    def handle(self, *args, **options):
+        try:
+            enviador = eventos.obtener_enviador()
+        except eventos.ErrorEntrega as e:
+            raise CommandError(str(e))
+
+        self.seguir = True
+
+        def detener(numero, marco):
+            self.seguir = False
+
+        signal.signal(signal.SIGTERM, detener)
+        signal.signal(signal.SIGINT, detener)
+
+        entregados = fallidos = 0
+        ultima_compactacion = 0
+        try:
+            while self.seguir:
+                close_old_connections()
+                if time.monotonic() - ultima_compactacion > COMPACTAR_CADA:
+                    borrados = eventos.compactar()
+                    if borrados and options['verbosity'] > 1:
+                        self.stdout.write(f'{borrados} eventos entregados borrados')
+                    ultima_compactacion = time.monotonic()
+
+                reclamados, ok, error = eventos.despachar(enviador, options['lote'])
+                entregados += ok
+                fallidos += error
+                if options['verbosity'] > 1 and reclamados:
+                    self.stdout.write(f'{ok}/{reclamados} entregados')
+                if error or reclamados < options['lote']:
+                    # Cola vacía o receptor con problemas: el próximo lote puede esperar
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['espera'])
+        finally:
+            if hasattr(enviador, 'cerrar'):
+                enviador.cerrar()
+
+        mensaje = f'✅ {entregados} eventos entregados'
+        if fallidos:
+            mensaje += f', {fallidos} envíos fallidos (se reintentan más tarde)'
+        self.stdout.write(self.style.SUCCESS(mensaje))
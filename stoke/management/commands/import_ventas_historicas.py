@@ -0,0 +1,368 @@
+"""
+Comando para importar ventas históricas de un sistema anterior
+Uso:
+    python manage.py import_ventas_historicas ventas.csv --sucursal 1 --usuario admin
+    python manage.py import_ventas_historicas ventas.jsonl --sucursal 1 --usuario admin --lote 10000
+    python manage.py import_ventas_historicas ventas.csv --sucursal 1 --usuario admin --simular
+
+Una fila (o línea JSON) por producto vendido, con las columnas:
+    venta, fecha, codigo, cantidad, precio_unitario[, subtotal, descuento, metodo_pago]
+
+Las filas de una misma venta tienen que estar contiguas (el archivo ordenado por
+venta). Una venta se importa entera o no se importa: si alguna de sus filas es
+inválida, se descartan todas. Los productos se buscan por código de barras en un
+diccionario en memoria armado una sola vez; las líneas con códigos desconocidos
+no generan detalle y su importe se suma al monto manual de la venta, así el
+total histórico se conserva.
+
+Las ventas se escriben directo a las tablas (COPY en PostgreSQL, executemany en
+los demás motores), en lotes de --lote ventas con un commit por lote: no se
+descuenta stock, no se tocan los resúmenes diarios y se conserva la fecha
+original. Cada venta guarda su número original (Venta.venta_externa, único por
+sucursal) y las que ya están en la base se saltean: correr el comando de nuevo
+sobre el mismo archivo, o sobre uno cortado a la mitad, no duplica ventas. Si se
+corta, --desde <venta> retoma desde esa venta del archivo sin releer lo anterior.
+"""
+import csv
+import io
+import json
+import time
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from stoke.codigos import normalizar_codigo
+from stoke.models import CodigoBarras, DetalleVenta, Producto, Sucursal, Venta
+
+CAMPOS_VENTA = [
+    'id', 'fecha', 'sucursal', 'usuario', 'metodo_pago', 'total', 'monto_recibido', 'vuelto',
+    'recargo_tarjeta', 'monto_manual', 'observaciones', 'total_devuelto', 'anulada', 'venta_externa',
+]
+CAMPOS_DETALLE = [
+    'venta', 'producto', 'cantidad', 'precio_unitario', 'subtotal', 'descuento', 'promocion', 'cantidad_devuelta',
+]
+CERO = Decimal('0')
+
+
+class FilaInvalida(Exception):
+    pass
+
+
+def leer_filas(archivo, formato):
+    """Recorre el archivo fila por fila (sin cargarlo entero) como dicts"""
+    if formato == 'jsonl':
+        for linea in archivo:
+            if linea.strip():
+                yield json.loads(linea)
+    else:
+        yield from csv.DictReader(archivo)
+
+
+def _decimal(valor, campo):
+    if valor is None or valor == '':
+        return None
+    try:
+        numero = Decimal(str(valor).replace(',', '.'))
+    except InvalidOperation:
+        raise FilaInvalida(f'{campo} inválido: {valor}')
+    if not numero.is_finite():
+        raise FilaInvalida(f'{campo} inválido: {valor}')
+    return numero.quantize(Decimal('0.01'))
+
+
+def _texto_copy(valor):
+    """Valor en el formato de texto de COPY"""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, bool):
+        return 't' if valor else 'f'
+    return str(valor).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class Command(BaseCommand):
+    help = 'Importa ventas históricas (CSV o JSONL) directo a la base, sin efectos sobre el stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Archivo .csv o .jsonl')
+        parser.add_argument('--sucursal', type=int, required=True, help='Id de la sucursal de las ventas')
+        parser.add_argument('--usuario', required=True, help='Usuario al que se atribuyen las ventas')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Por defecto según la extensión')
+        parser.add_argument('--metodo-pago', default='efectivo', help='Método de pago si la fila no trae uno')
+        parser.add_argument('--lote', type=int, default=5000, help='Ventas por lote (un commit por lote)')
+        parser.add_argument('--desde', metavar='VENTA', help='Saltear las ventas anteriores a esta (para retomar)')
+        parser.add_argument('--simular', action='store_true', help='Leer y validar sin escribir nada')
+
+    def handle(self, *args, **options):
+        try:
+            self.sucursal_id = Sucursal.objects.values_list('id', flat=True).get(pk=options['sucursal'])
+        except Sucursal.DoesNotExist:
+            raise CommandError(f"No existe la sucursal {options['sucursal']}")
+        try:
+            self.usuario_id = User.objects.values_list('id', flat=True).get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario {options['usuario']}")
+        if options['metodo_pago'] not in dict(Venta.METODO_PAGO_CHOICES):
+            raise CommandError(f"Método de pago inválido: {options['metodo_pago']}")
+
+        self.conexion = connections[DEFAULT_DB_ALIAS]  # La conexión real: el proxy `connection` se resuelve en cada uso
+        self.metodo_pago = options['metodo_pago']
+        self.simular = options['simular']
+        self.verbosity = options['verbosity']
+        self.zona = timezone.get_current_timezone()
+        self.productos = self.diccionario_codigos()
+        self.por_codigo = {}  # código tal como viene en el archivo -> producto_id (o None)
+        self.desconocidos = Counter()
+        self.errores = []
+        self.cantidad_errores = 0
+        self.rechazadas = 0
+        self.ventas = self.detalles = self.repetidas = 0
+
+        formato = options['formato'] or ('jsonl' if options['archivo'].endswith(('.jsonl', '.json')) else 'csv')
+        inicio = time.monotonic()
+        with open(options['archivo'], newline='', encoding='utf-8-sig') as archivo:
+            lote = []
+            for venta in self.agrupar_ventas(leer_filas(archivo, formato), options['desde']):
+                lote.append(venta)
+                if len(lote) >= options['lote']:
+                    self.guardar(lote)
+                    lote = []
+            if lote:
+                self.guardar(lote)
+
+        self.reportar(time.monotonic() - inicio)
+
+    def diccionario_codigos(self):
+        """{código normalizado: producto_id} de todos los productos y sus códigos alternativos"""
+        productos = dict(CodigoBarras.objects.values_list('codigo_normalizado', 'producto_id').iterator())
+        productos.update(
+            Producto.objects.exclude(codigo_normalizado=None).values_list('codigo_normalizado', 'id').iterator()
+        )
+        return productos
+
+    def producto(self, codigo):
+        if codigo not in self.por_codigo:
+            self.por_codigo[codigo] = self.productos.get(normalizar_codigo(codigo))
+        return self.por_codigo[codigo]
+
+    def agrupar_ventas(self, filas, desde):
+        """
+        Junta las filas contiguas de una misma venta y devuelve (fila de venta, detalles).
+        Una fila inválida rechaza la venta entera: sus demás filas se saltean.
+        """
+        actual, venta, detalles, rechazada = None, None, [], False
+        salteando = desde is not None
+        for numero, fila in enumerate(filas, start=1):
+            externa = str(fila.get('venta') or '').strip()
+            if salteando:
+                if externa != desde:
+                    continue
+                salteando = False
+            if externa != actual:
+                if not rechazada and venta is not None and venta['lineas']:
+                    yield self.completar(venta, detalles)
+                actual, venta, detalles, rechazada = externa, None, [], False
+            if rechazada:
+                continue
+            try:
+                if venta is None:
+                    venta = self.venta(externa, fila)
+                self.linea(venta, detalles, fila)
+            except (FilaInvalida, KeyError) as e:
+                motivo = f'falta la columna {e}' if isinstance(e, KeyError) else e
+                rechazada = True
+                self.rechazadas += 1
+                self.cantidad_errores += 1
+                if len(self.errores) < 20:
+                    self.errores.append(f'Fila {numero} (venta {externa}): {motivo}')
+        if not rechazada and venta is not None and venta['lineas']:
+            yield self.completar(venta, detalles)
+        if salteando:
+            raise CommandError(f'No se encontró la venta {desde} en el archivo')
+
+    def completar(self, venta, detalles):
+        """Venta aceptada: recién ahora cuentan sus códigos desconocidos"""
+        self.desconocidos.update(venta.pop('desconocidos'))
+        return venta, detalles
+
+    def venta(self, externa, fila):
+        if not externa:
+            raise FilaInvalida('falta el número de venta')
+        if len(externa) > Venta._meta.get_field('venta_externa').max_length:
+            raise FilaInvalida(f'número de venta demasiado largo: {externa}')
+        fecha = parse_datetime(str(fila.get('fecha') or '').strip())
+        if fecha is None:
+            raise FilaInvalida(f"fecha inválida: {fila.get('fecha')}")
+        if timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha, self.zona)
+        metodo_pago = (fila.get('metodo_pago') or '').strip() or self.metodo_pago
+        if metodo_pago not in dict(Venta.METODO_PAGO_CHOICES):
+            raise FilaInvalida(f'método de pago inválido: {metodo_pago}')
+        return {
+            'externa': externa,
+            'lineas': 0,
+            'desconocidos': [],
+            'fecha': fecha,
+            'sucursal': self.sucursal_id,
+            'usuario': self.usuario_id,
+            'metodo_pago': metodo_pago,
+            'total': CERO,
+            'monto_recibido': None,
+            'vuelto': CERO,
+            'recargo_tarjeta': CERO,
+            'monto_manual': CERO,
+            'observaciones': f'Importada del sistema anterior (venta {externa})',
+            'total_devuelto': CERO,
+            'anulada': False,
+            'venta_externa': externa,
+        }
+
+    def linea(self, venta, detalles, fila):
+        cantidad = str(fila['cantidad']).strip()
+        if not cantidad.lstrip('-').isdigit() or int(cantidad) <= 0:
+            raise FilaInvalida(f'cantidad inválida: {cantidad}')
+        cantidad = int(cantidad)
+        precio = _decimal(fila['precio_unitario'], 'precio_unitario')
+        if precio is None:
+            raise FilaInvalida('falta precio_unitario')
+        descuento = _decimal(fila.get('descuento'), 'descuento') or CERO
+        subtotal = _decimal(fila.get('subtotal'), 'subtotal')
+        if subtotal is None:
+            subtotal = precio * cantidad - descuento
+
+        venta['total'] += subtotal
+        venta['lineas'] += 1
+        codigo = str(fila.get('codigo') or '').strip()
+        producto_id = self.producto(codigo) if codigo else None
+        if producto_id is None:
+            venta['desconocidos'].append(codigo)
+            venta['monto_manual'] += subtotal
+            return
+        detalles.append({
+            'producto': producto_id,
+            'cantidad': cantidad,
+            'precio_unitario': precio,
+            'subtotal': subtotal,
+            'descuento': descuento,
+            'promocion': None,
+            'cantidad_devuelta': 0,
+        })
+
+    def guardar(self, lote):
+        if not self.simular:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                lote = self.nuevas(lote)
+                if lote:
+                    self.insertar_ventas(lote)
+                    filas_detalle = []
+                    for venta, detalles in lote:
+                        for detalle in detalles:
+                            detalle['venta'] = venta['id']
+                            filas_detalle.append(detalle)
+                    self.insertar(DetalleVenta, CAMPOS_DETALLE, filas_detalle)
+            if not lote:
+                return
+
+        antes = self.ventas
+        self.ventas += len(lote)
+        self.detalles += sum(len(detalles) for _, detalles in lote)
+        if self.ventas // 100_000 != antes // 100_000 or self.verbosity > 1:
+            self.stdout.write(f"{self.ventas} ventas, {self.detalles} detalles (última: {lote[-1][0]['externa']})")
+
+    def nuevas(self, lote):
+        """Las ventas del lote que no están en la base (ni repetidas más arriba en el mismo lote)"""
+        importadas = set(self.ids_importadas([venta['externa'] for venta, _ in lote]))
+        nuevas = []
+        for venta, detalles in lote:
+            if venta['externa'] in importadas:
+                self.repetidas += 1
+                continue
+            importadas.add(venta['externa'])
+            nuevas.append((venta, detalles))
+        return nuevas
+
+    def ids_importadas(self, externas):
+        """{número original: id} de las ventas de la sucursal que ya están en la base"""
+        ids = {}
+        for inicio in range(0, len(externas), 500):  # Pocos parámetros por consulta (límite de SQLite)
+            ids.update(
+                Venta.objects.filter(sucursal_id=self.sucursal_id, venta_externa__in=externas[inicio:inicio + 500])
+                .values_list('venta_externa', 'id')
+            )
+        return ids
+
+    def insertar_ventas(self, lote):
+        """Inserta las ventas y completa su id: los detalles lo necesitan"""
+        ventas = [venta for venta, _ in lote]
+        if self.conexion.vendor == 'postgresql':
+            tabla = Venta._meta.db_table
+            with self.conexion.cursor() as cursor:
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                    [tabla, len(ventas)],
+                )
+                for venta, (venta_id,) in zip(ventas, cursor.fetchall()):
+                    venta['id'] = venta_id
+            self.insertar(Venta, CAMPOS_VENTA, ventas)
+            return
+        # Otros motores: el id lo asigna la base y se recupera por el número original
+        self.insertar(Venta, CAMPOS_VENTA[1:], ventas)
+        ids = self.ids_importadas([venta['externa'] for venta in ventas])
+        for venta in ventas:
+            venta['id'] = ids[venta['externa']]
+
+    def insertar(self, modelo, campos, filas):
+        campos = [modelo._meta.get_field(nombre) for nombre in campos]
+        tabla = self.conexion.ops.quote_name(modelo._meta.db_table)
+        columnas = ', '.join(self.conexion.ops.quote_name(campo.column) for campo in campos)
+
+        with self.conexion.cursor() as cursor:
+            if self.conexion.vendor == 'postgresql':
+                self.copiar(cursor, f'COPY {tabla} ({columnas}) FROM STDIN', campos, filas)
+                return
+            marcadores = ', '.join(['%s'] * len(campos))
+            cursor.executemany(
+                f'INSERT INTO {tabla} ({columnas}) VALUES ({marcadores})',
+                [[campo.get_db_prep_save(fila[campo.name], self.conexion) for campo in campos] for fila in filas],
+            )
+
+    def copiar(self, cursor, sql, campos, filas):
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+        if is_psycopg3:
+            with cursor.cursor.copy(sql) as copia:
+                for fila in filas:
+                    copia.write_row([fila[campo.name] for campo in campos])
+            return
+        texto = io.StringIO()
+        for fila in filas:
+            texto.write('\t'.join(_texto_copy(fila[campo.name]) for campo in campos))
+            texto.write('\n')
+        texto.seek(0)
+        cursor.cursor.copy_expert(sql, texto)
+
+    def reportar(self, segundos):
+        accion = 'Se leyeron' if self.simular else 'Se importaron'
+        por_segundo = self.ventas / segundos if segundos else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{accion} {self.ventas} ventas y {self.detalles} detalles en {segundos:.1f} s ({por_segundo:.0f} ventas/s)'
+        ))
+        if self.repetidas:
+            self.stdout.write(self.style.WARNING(f'{self.repetidas} ventas salteadas porque ya estaban importadas'))
+        if self.desconocidos:
+            self.stdout.write(self.style.WARNING(
+                f'{sum(self.desconocidos.values())} líneas con {len(self.desconocidos)} códigos desconocidos '
+                '(su importe quedó como monto manual). Los más frecuentes:'
+            ))
+            for codigo, veces in self.desconocidos.most_common(10):
+                self.stdout.write(f'  {codigo or "(sin código)"}: {veces}')
+        if self.cantidad_errores:
+            self.stdout.write(self.style.ERROR(
+                f'{self.cantidad_errores} filas con errores: {self.rechazadas} ventas no importadas (ninguna de sus filas):'
+            ))
+            for error in self.errores:
+                self.stdout.write(f'  {error}')
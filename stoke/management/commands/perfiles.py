@@ -0,0 +1,128 @@
+"""
+Comando para revisar las capturas del perfilado de requests
+Uso:
+    python manage.py perfiles                    # las 20 más lentas
+    python manage.py perfiles --ruta /ventas/    # solo esa ruta (prefijo)
+    python manage.py perfiles --resumen          # agrupadas por vista
+    python manage.py perfiles --detalle <id>     # funciones y SQL de una captura
+
+El archivo <id>.folded se puede abrir en speedscope.app o pasar a flamegraph.pl.
+"""
+import os
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from stoke.perfilado import leer_capturas, leer_pilas
+
+
+def porcentajes(captura):
+    muestras = captura['muestras']
+    if not muestras:
+        return 'sin muestras'
+    categorias = captura['categorias']
+    return ' '.join(
+        f"{nombre} {categorias.get(nombre, 0) * 100 // muestras}%"
+        for nombre in ('sql', 'plantillas', 'python')
+    )
+
+
+def percentil(valores, fraccion):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * fraccion))]
+
+
+class Command(BaseCommand):
+    help = 'Lista y resume las capturas más lentas del perfilado de requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Cantidad de capturas a mostrar')
+        parser.add_argument('--ruta', help='Solo capturas cuya ruta empieza con este prefijo')
+        parser.add_argument('--resumen', action='store_true', help='Agrupar por vista')
+        parser.add_argument('--detalle', metavar='ID', help='Funciones y consultas de una captura')
+        parser.add_argument('--dir', default=None, help='Directorio de capturas (por defecto STOKE_PERFILADO_DIR)')
+
+    def handle(self, *args, **options):
+        directorio = options['dir'] or settings.STOKE_PERFILADO_DIR
+        capturas = leer_capturas(directorio)
+        if options['ruta']:
+            capturas = [c for c in capturas if c['ruta'].startswith(options['ruta'])]
+        if not capturas:
+            self.stdout.write(f'No hay capturas en {directorio}')
+            return
+
+        if options['detalle']:
+            self.detalle(directorio, capturas, options['detalle'], options['top'])
+        elif options['resumen']:
+            self.resumen(capturas)
+        else:
+            self.listar(capturas, options['top'])
+
+    def listar(self, capturas, top):
+        capturas.sort(key=lambda c: c['duracion_ms'], reverse=True)
+        self.stdout.write(f"{'ms':>9} {'sql':>5} {'sql ms':>8}  {'muestras':<30} {'request':<40} id")
+        for c in capturas[:top]:
+            request = f"{c['metodo']} {c['ruta']} [{c['estado']}]"
+            self.stdout.write(
+                f"{c['duracion_ms']:9.1f} {c['sql_cantidad']:5d} {c['sql_ms']:8.1f}  "
+                f"{porcentajes(c):<30} {request:<40} {c['id']}"
+            )
+
+    def resumen(self, capturas):
+        por_vista = defaultdict(list)
+        for c in capturas:
+            por_vista[c['vista'] or c['ruta']].append(c)
+
+        filas = []
+        for vista, grupo in por_vista.items():
+            duraciones = [c['duracion_ms'] for c in grupo]
+            filas.append((
+                vista, len(grupo), percentil(duraciones, 0.5), percentil(duraciones, 0.95), max(duraciones),
+                sum(c['sql_cantidad'] for c in grupo) / len(grupo),
+                sum(c['sql_ms'] for c in grupo) / sum(duraciones) * 100 if sum(duraciones) else 0,
+            ))
+        filas.sort(key=lambda fila: fila[3], reverse=True)
+
+        self.stdout.write(f"{'vista':<32} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'sql/req':>8} {'%sql':>6}")
+        for vista, n, p50, p95, maximo, sql, sql_pct in filas:
+            self.stdout.write(f'{vista:<32} {n:5d} {p50:9.1f} {p95:9.1f} {maximo:9.1f} {sql:8.1f} {sql_pct:5.0f}%')
+
+    def detalle(self, directorio, capturas, captura_id, top):
+        captura = next((c for c in capturas if c['id'] == captura_id), None)
+        if captura is None:
+            raise CommandError(f'No existe la captura {captura_id}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{captura['metodo']} {captura['ruta']} [{captura['estado']}] — {captura['duracion_ms']:.1f} ms, {captura['fecha']}"
+        ))
+        self.stdout.write(f"Muestras: {captura['muestras']} cada {captura['intervalo_ms']:g} ms ({porcentajes(captura)})")
+        self.stdout.write(f"SQL: {captura['sql_cantidad']} consultas, {captura['sql_ms']:.1f} ms")
+
+        pilas = leer_pilas(captura_id, directorio)
+        propias, inclusivas = Counter(), Counter()
+        for pila, cantidad in pilas.items():
+            propias[pila[-1]] += cantidad
+            for etiqueta in set(pila):
+                inclusivas[etiqueta] += cantidad
+        total = sum(pilas.values()) or 1
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nFunciones (tiempo propio)'))
+        for etiqueta, cantidad in propias.most_common(top):
+            self.stdout.write(f'{cantidad * 100 / total:5.1f}%  {etiqueta}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nFunciones del proyecto (tiempo incluido)'))
+        del_proyecto = [(e, n) for e, n in inclusivas.most_common() if '(stoke' in e]
+        for etiqueta, cantidad in del_proyecto[:top]:
+            self.stdout.write(f'{cantidad * 100 / total:5.1f}%  {etiqueta}')
+
+        # Las consultas repetidas (mismo SQL, distintos parámetros) delatan un N+1
+        consultas = defaultdict(lambda: [0, 0.0])
+        for consulta in captura['sql']:
+            consultas[consulta['sql']][0] += 1
+            consultas[consulta['sql']][1] += consulta['ms']
+        self.stdout.write(self.style.MIGRATE_HEADING('\nSQL (por tiempo total)'))
+        for sql, (veces, ms) in sorted(consultas.items(), key=lambda item: item[1][1], reverse=True)[:top]:
+            self.stdout.write(f'{ms:8.1f} ms  x{veces:<4d} {sql[:160]}')
+
+        self.stdout.write(f"\nFlamegraph: {os.path.join(directorio, captura_id + '.folded')}")
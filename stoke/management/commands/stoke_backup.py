@@ -0,0 +1,116 @@
+"""
+Comando para respaldar los datos de stoke (ventas, productos, stock, usuarios...)
+Uso:
+    python manage.py stoke_backup                                # en respaldos/<fecha y hora>
+    python manage.py stoke_backup /backups/hoy --procesos 8      # 8 hilos volcando a la vez
+    python manage.py stoke_backup /backups/hoy --filas 1000000   # filas por archivo
+
+Se restaura con `manage.py stoke_restore <directorio>` (ver stoke/respaldos.py).
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from stoke import respaldos
+
+
+class Command(BaseCommand):
+    help = 'Respalda las tablas de stoke en archivos comprimidos, en paralelo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('destino', nargs='?', help='Directorio del respaldo (por defecto respaldos/<fecha y hora>)')
+        parser.add_argument('--procesos', type=int, default=min(8, os.cpu_count() or 1), help='Hilos de volcado (solo PostgreSQL)')
+        parser.add_argument('--filas', type=int, default=500_000, help='Filas por archivo')
+        parser.add_argument('--compresion', type=int, default=3, choices=range(1, 10), help='Nivel de gzip (1 = más rápido)')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        destino = options['destino'] or os.path.join(
+            settings.BASE_DIR, 'respaldos', timezone.localtime().strftime('%Y%m%d-%H%M%S')
+        )
+        if os.path.exists(os.path.join(destino, respaldos.MANIFIESTO)):
+            raise CommandError(f'{destino} ya tiene un respaldo')
+        os.makedirs(destino, exist_ok=True)
+
+        conexion = connections[DEFAULT_DB_ALIAS]
+        ops = conexion.ops
+        extension = 'csv' if conexion.vendor == 'postgresql' else 'jsonl'
+        inicio = time.monotonic()
+
+        # Todo se lee dentro de esta transacción (y de su foto, en los hilos)
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            with conexion.cursor() as cursor:
+                foto = None
+                if conexion.vendor == 'postgresql':
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                    cursor.execute('SELECT pg_export_snapshot()')
+                    foto = cursor.fetchone()[0]
+                permisos = respaldos.nombres_permisos()
+
+                tablas, tareas = [], []
+                for modelo in respaldos.modelos():
+                    tabla, pk = modelo._meta.db_table, modelo._meta.pk.column
+                    lista_columnas = respaldos.columnas(modelo)
+                    archivos = []
+                    for numero, (desde, hasta, filas) in enumerate(
+                        respaldos.cortes(cursor, ops.quote_name(tabla), ops.quote_name(pk), options['filas'])
+                    ):
+                        archivo = {'archivo': f'{tabla}.{numero:05d}.{extension}.gz', 'filas': filas}
+                        archivos.append(archivo)
+                        tareas.append((archivo, tabla, lista_columnas, pk, desde, hasta))
+                    tablas.append({
+                        'tabla': tabla,
+                        'modelo': modelo._meta.label,
+                        'columnas': lista_columnas,
+                        'filas': sum(archivo['filas'] for archivo in archivos),
+                        'archivos': archivos,
+                    })
+
+            def volcar(tarea):
+                archivo, tabla, lista_columnas, pk, desde, hasta = tarea
+                ruta = os.path.join(destino, archivo['archivo'])
+                archivo['sha256'] = respaldos.volcar(
+                    connections[DEFAULT_DB_ALIAS], tabla, lista_columnas, pk, desde, hasta, ruta, options['compresion']
+                )
+
+            if foto is None or options['procesos'] <= 1:
+                for tarea in tareas:
+                    volcar(tarea)
+            else:
+                def volcar_en_hilo(tarea):
+                    # Cada hilo tiene su propia conexión: se engancha a la foto del hilo principal
+                    conexion_hilo = connections[DEFAULT_DB_ALIAS]
+                    try:
+                        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                            with conexion_hilo.cursor() as cursor:
+                                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                                cursor.execute('SET TRANSACTION SNAPSHOT %s', [foto])
+                            volcar(tarea)
+                    finally:
+                        conexion_hilo.close()
+
+                # Las tareas más grandes primero para repartir mejor los hilos
+                tareas.sort(key=lambda tarea: tarea[0]['filas'], reverse=True)
+                with ThreadPoolExecutor(max_workers=options['procesos']) as hilos:
+                    list(hilos.map(volcar_en_hilo, tareas))
+
+        respaldos.escribir_manifiesto(destino, {
+            'version': 1,
+            'fecha': timezone.now().isoformat(),
+            'motor': conexion.vendor,
+            'migraciones': respaldos.migraciones(conexion),
+            'permisos': permisos,
+            'tablas': tablas,
+        })
+
+        segundos = time.monotonic() - inicio
+        filas = sum(tabla['filas'] for tabla in tablas)
+        for tabla in tablas:
+            if self.verbosity > 1 or tabla['filas']:
+                self.stdout.write(f"{tabla['tabla']:<32} {tabla['filas']:>12} filas {len(tabla['archivos']):>5} archivos")
+        self.stdout.write(self.style.SUCCESS(f'✅ Respaldo de {filas} filas en {destino} ({segundos:.1f} s)'))
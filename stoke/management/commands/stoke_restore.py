@@ -0,0 +1,117 @@
+"""
+Comando para restaurar un respaldo hecho con stoke_backup
+Uso:
+    python manage.py stoke_restore respaldos/20261019-030000            # base migrada y vacía
+    python manage.py stoke_restore respaldos/20261019-030000 --vaciar   # borra antes los datos actuales
+
+Todo se carga en una sola transacción: si falla un checksum o una cantidad de
+filas no coincide, la base queda como estaba. --vaciar borra (DELETE, sin
+cascada) solo las tablas del respaldo: lo que otras tablas tengan apuntando a
+ellas (el historial del admin, por ejemplo) se conserva si las filas a las que
+apunta vuelven con el respaldo, y si no, la restauración se cancela.
+"""
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+from stoke import autenticacion, promociones, respaldos
+from stoke.catalogo import invalidar_catalogo
+
+
+class Command(BaseCommand):
+    help = 'Restaura un respaldo de stoke_backup verificando filas y checksums'
+
+    def add_arguments(self, parser):
+        parser.add_argument('origen', help='Directorio del respaldo')
+        parser.add_argument(
+            '--vaciar', action='store_true',
+            help='Borrar antes los datos de las tablas respaldadas (solo esas)',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        origen = options['origen']
+        try:
+            manifiesto = respaldos.leer_manifiesto(origen)
+        except FileNotFoundError:
+            raise CommandError(f'{origen} no tiene un {respaldos.MANIFIESTO}')
+
+        conexion = connections[DEFAULT_DB_ALIAS]
+        if manifiesto['motor'] != conexion.vendor:
+            raise CommandError(f"El respaldo es de {manifiesto['motor']} y la base es {conexion.vendor}")
+        actuales = respaldos.migraciones(conexion)
+        if manifiesto['migraciones'] != actuales:
+            raise CommandError(
+                f"El respaldo se hizo con las migraciones {manifiesto['migraciones']} y la base tiene {actuales}: "
+                'migrá la base a la misma versión antes de restaurar'
+            )
+
+        modelos = {modelo._meta.db_table: modelo for modelo in respaldos.modelos()}
+        for tabla in manifiesto['tablas']:
+            modelo = modelos.get(tabla['tabla'])
+            if modelo is None or respaldos.columnas(modelo) != tabla['columnas']:
+                raise CommandError(f"La tabla {tabla['tabla']} no coincide con la del respaldo")
+        permisos = manifiesto.get('permisos', {})
+        actuales = respaldos.nombres_permisos(permisos)
+        distintos = sorted(nombre for permiso_id, nombre in permisos.items() if actuales.get(permiso_id) != nombre)
+        if distintos:
+            raise CommandError(f"Los permisos {', '.join(distintos)} tienen otro id en esta base que en el respaldo")
+        nombres = [tabla['tabla'] for tabla in manifiesto['tablas']]
+        ops = conexion.ops
+        inicio = time.monotonic()
+
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            with conexion.cursor() as cursor:
+                if conexion.vendor == 'postgresql':
+                    # Las FK de Django son DEFERRABLE: se verifican todas juntas al final
+                    cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+                if options['vaciar']:
+                    # Hijos primero; sin TRUNCATE ... CASCADE, que vaciaría también tablas que no están en el respaldo
+                    for tabla in reversed(nombres):
+                        cursor.execute(f'DELETE FROM {ops.quote_name(tabla)}')
+                else:
+                    con_datos = []
+                    for tabla in nombres:
+                        cursor.execute(f'SELECT 1 FROM {ops.quote_name(tabla)} LIMIT 1')
+                        if cursor.fetchone():
+                            con_datos.append(tabla)
+                    if con_datos:
+                        raise CommandError(f"Hay datos en {', '.join(con_datos)}: usá --vaciar para reemplazarlos")
+
+            # En el orden del manifiesto (padres primero)
+            for tabla in manifiesto['tablas']:
+                inicio_tabla = time.monotonic()
+                for archivo in tabla['archivos']:
+                    suma = respaldos.cargar(conexion, tabla['tabla'], tabla['columnas'], os.path.join(origen, archivo['archivo']))
+                    if suma != archivo['sha256']:
+                        raise CommandError(f"Checksum inválido en {archivo['archivo']}: el respaldo está dañado")
+                with conexion.cursor() as cursor:
+                    cursor.execute(f"SELECT COUNT(*) FROM {ops.quote_name(tabla['tabla'])}")
+                    cargadas = cursor.fetchone()[0]
+                if cargadas != tabla['filas']:
+                    raise CommandError(f"{tabla['tabla']}: se esperaban {tabla['filas']} filas y hay {cargadas}")
+                if self.verbosity > 1 or cargadas:
+                    self.stdout.write(f"{tabla['tabla']:<32} {cargadas:>12} filas {time.monotonic() - inicio_tabla:>8.1f} s")
+
+            try:
+                # Con --vaciar, también las tablas de afuera que apuntaban a las filas borradas
+                conexion.check_constraints(table_names=None if options['vaciar'] else nombres)
+            except IntegrityError as e:
+                raise CommandError(f'El respaldo deja referencias rotas: {e}')
+            with conexion.cursor() as cursor:
+                for sql in ops.sequence_reset_sql(no_style(), [modelos[tabla] for tabla in nombres]):
+                    cursor.execute(sql)
+
+        # Catálogo, promociones y usuarios cambiaron por debajo de las señales
+        invalidar_catalogo()
+        promociones.invalidar()
+        autenticacion.invalidar_todos()
+
+        filas = sum(tabla['filas'] for tabla in manifiesto['tablas'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Restauradas {filas} filas de {origen} ({time.monotonic() - inicio:.1f} s). '
+            'Corré `manage.py configurar_permisos` para recrear los permisos de los grupos.'
+        ))
@@ -0,0 +1,91 @@
+"""
+Comando para simular localmente el receptor de eventos de contabilidad
+Uso:
+    python manage.py stub_contabilidad                     # escucha en 127.0.0.1:8099
+    python manage.py stub_contabilidad --fallas 0.3        # responde 503 al 30% de los envíos
+
+Con STOKE_EVENTOS_URL=http://127.0.0.1:8099/eventos, `despachar_eventos` le
+envía los eventos; los repetidos (misma Idempotency-Key) se cuentan pero no se
+vuelven a registrar, como haría el sistema real.
+"""
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class Receptor(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Conexiones persistentes, como el enviador
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if random.random() < self.server.fallas:
+            self.responder(503, {'error': 'falla simulada'})
+            return
+        evento = json.loads(cuerpo)
+        clave = self.headers.get('Idempotency-Key', '')
+        with self.server.candado:
+            repetido = clave in self.server.recibidos
+            if repetido:
+                self.server.repetidos += 1
+            else:
+                self.server.recibidos[clave] = evento
+        if self.server.salida is not None:
+            if repetido:
+                self.server.salida.write(f"repetido {clave}")
+            else:
+                self.server.salida.write(f"{evento['tipo']} {evento['clave']} ({clave})")
+        self.responder(200, {'ok': True, 'repetido': repetido})
+
+    def responder(self, estado, datos):
+        contenido = json.dumps(datos).encode()
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+class ServidorContabilidad(ThreadingHTTPServer):
+    """
+    Receptor de prueba: guarda cada evento bajo su Idempotency-Key y solo cuenta
+    los repetidos. Con puerto 0 elige uno libre (lo usan los tests).
+    """
+
+    def __init__(self, puerto=8099, fallas=0.0, salida=None):
+        super().__init__(('127.0.0.1', puerto), Receptor)
+        self.fallas = fallas
+        self.salida = salida
+        self.recibidos = {}
+        self.repetidos = 0
+        self.candado = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/eventos'
+
+
+class Command(BaseCommand):
+    help = 'Servidor HTTP de prueba que recibe los eventos de despachar_eventos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puerto', type=int, default=8099)
+        parser.add_argument('--fallas', type=float, default=0.0, help='Fracción de envíos que responden 503')
+
+    def handle(self, *args, **options):
+        servidor = ServidorContabilidad(options['puerto'], options['fallas'], salida=self.stdout)
+        self.stdout.write(f"Escuchando en http://127.0.0.1:{servidor.server_port}/ (Ctrl+C para salir)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {len(servidor.recibidos)} eventos distintos recibidos, {servidor.repetidos} repetidos'
+        ))
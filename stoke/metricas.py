@@ -0,0 +1,197 @@
+"""
+Métricas operativas en formato de texto de Prometheus (ver la vista `metricas`).
+
+Cada proceso lleva sus contadores e histogramas en memoria (un dict y un lock,
+sin consultas ni red). Con STOKE_METRICAS_DIR configurado, cada worker de
+gunicorn vuelca su foto a <dir>/<pid>.json como mucho una vez cada
+STOKE_METRICAS_INTERVALO segundos y /metrics suma las fotos de todos los
+workers, así que da lo mismo qué worker atienda el scrape. Los archivos de
+workers que terminaron se suman a acumulado.json (ver archivar_proceso), para
+que los contadores no bajen cuando gunicorn recicla un worker.
+
+Sin directorio (desarrollo, un solo proceso) /metrics muestra solo el proceso actual.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# nombre -> (tipo, ayuda, cubetas)
+METRICAS = {
+    'stoke_http_requests_total': ('counter', 'Requests atendidas por vista, método y código de estado', None),
+    'stoke_http_request_duration_seconds': ('histogram', 'Duración de las requests por vista', SEGUNDOS),
+    'stoke_http_request_db_queries': ('histogram', 'Consultas SQL por request, por vista', CONSULTAS),
+    'stoke_cobros_total': ('counter', 'Intentos de cobro en el POS por resultado (ok, rechazado, sin_stock, error)', None),
+    'stoke_sin_stock_total': ('counter', 'Cobros rechazados por falta de stock', None),
+    'stoke_ventas_total': ('counter', 'Ventas registradas por método de pago', None),
+    'stoke_ventas_importe_total': ('counter', 'Importe vendido por método de pago', None),
+    'stoke_csv_filas_total': ('counter', 'Filas procesadas por la carga de CSV por resultado (creado, actualizado, error)', None),
+    'stoke_csv_duracion_seconds': ('histogram', 'Duración de cada carga de CSV', SEGUNDOS + (30, 60, 120)),
+    'stoke_admision_rechazos_total': ('counter', 'Requests rechazadas con 503 por clase y motivo (latencia, concurrencia, timeout)', None),
+}
+
+ACUMULADO = 'acumulado.json'
+
+
+class Registro:
+    """Valores de las métricas de este proceso"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.pid = os.getpid()
+        self.contadores = {}  # (nombre, etiquetas) -> valor
+        self.histogramas = {}  # (nombre, etiquetas) -> [cuentas por cubeta..., +Inf, suma]
+        self.ultima_escritura = 0
+
+    def _revisar_fork(self):
+        # Un worker nuevo arranca en cero aunque herede la memoria del master
+        if self.pid != os.getpid():
+            self.reiniciar()
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self.lock:
+            self._revisar_fork()
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+        self.quizas_escribir()
+
+    def observar(self, nombre, valor, **etiquetas):
+        cubetas = METRICAS[nombre][2]
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self.lock:
+            self._revisar_fork()
+            cuentas = self.histogramas.get(clave)
+            if cuentas is None:
+                cuentas = self.histogramas[clave] = [0] * (len(cubetas) + 1) + [0.0]
+            cuentas[bisect_left(cubetas, valor)] += 1
+            cuentas[-1] += valor
+        self.quizas_escribir()
+
+    def foto(self):
+        with self.lock:
+            return {
+                'contadores': [[nombre, list(etiquetas), valor] for (nombre, etiquetas), valor in self.contadores.items()],
+                'histogramas': [[nombre, list(etiquetas), list(cuentas)] for (nombre, etiquetas), cuentas in self.histogramas.items()],
+            }
+
+    def quizas_escribir(self, forzar=False):
+        directorio = settings.STOKE_METRICAS_DIR
+        if not directorio:
+            return
+        ahora = time.monotonic()
+        if not forzar and ahora - self.ultima_escritura < settings.STOKE_METRICAS_INTERVALO:
+            return
+        self.ultima_escritura = ahora
+        escribir(os.path.join(directorio, f'{os.getpid()}.json'), self.foto())
+
+
+registro = Registro()
+incrementar = registro.incrementar
+observar = registro.observar
+
+
+def escribir(ruta, datos):
+    """Escritura atómica: quien lee nunca ve un archivo a medias"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporal, 'w') as archivo:
+        json.dump(datos, archivo)
+    os.replace(temporal, ruta)
+
+
+def leer(ruta):
+    try:
+        with open(ruta) as archivo:
+            return json.load(archivo)
+    except (FileNotFoundError, ValueError):
+        return {'contadores': [], 'histogramas': []}
+
+
+def sumar(fotos):
+    """Suma las fotos de varios procesos"""
+    contadores, histogramas = {}, {}
+    for foto in fotos:
+        for nombre, etiquetas, valor in foto['contadores']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            contadores[clave] = contadores.get(clave, 0) + valor
+        for nombre, etiquetas, cuentas in foto['histogramas']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            acumuladas = histogramas.get(clave)
+            if acumuladas is None or len(acumuladas) != len(cuentas):
+                histogramas[clave] = list(cuentas)
+            else:
+                histogramas[clave] = [a + b for a, b in zip(acumuladas, cuentas)]
+    return contadores, histogramas
+
+
+def archivar_proceso(pid, directorio=None):
+    """
+    Suma la foto de un worker que terminó a acumulado.json y la borra. Se llama
+    desde el hook child_exit de gunicorn, que corre en el master (un solo
+    proceso escribe el acumulado).
+    """
+    directorio = directorio or settings.STOKE_METRICAS_DIR
+    ruta = os.path.join(directorio, f'{pid}.json')
+    if not directorio or not os.path.exists(ruta):
+        return
+    contadores, histogramas = sumar([leer(os.path.join(directorio, ACUMULADO)), leer(ruta)])
+    escribir(os.path.join(directorio, ACUMULADO), {
+        'contadores': [[nombre, list(etiquetas), valor] for (nombre, etiquetas), valor in contadores.items()],
+        'histogramas': [[nombre, list(etiquetas), cuentas] for (nombre, etiquetas), cuentas in histogramas.items()],
+    })
+    os.remove(ruta)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(etiquetas, extra=()):
+    pares = [*etiquetas, *extra]
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{clave}="{_escapar(valor)}"' for clave, valor in pares) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def exponer():
+    """Texto de exposición de Prometheus con las métricas de todos los workers"""
+    directorio = settings.STOKE_METRICAS_DIR
+    if directorio:
+        registro.quizas_escribir(forzar=True)
+        archivos = [nombre for nombre in os.listdir(directorio) if nombre.endswith('.json')]
+        contadores, histogramas = sumar(leer(os.path.join(directorio, nombre)) for nombre in archivos)
+    else:
+        contadores, histogramas = sumar([registro.foto()])
+
+    lineas = []
+    for nombre, (tipo, ayuda, cubetas) in METRICAS.items():
+        lineas.append(f'# HELP {nombre} {ayuda}')
+        lineas.append(f'# TYPE {nombre} {tipo}')
+        if tipo == 'counter':
+            for (metrica, etiquetas), valor in sorted(contadores.items()):
+                if metrica == nombre:
+                    lineas.append(f'{nombre}{_etiquetas(etiquetas)} {_numero(valor)}')
+            continue
+        for (metrica, etiquetas), cuentas in sorted(histogramas.items()):
+            if metrica != nombre:
+                continue
+            acumulado = 0
+            for limite, cuenta in zip((*cubetas, '+Inf'), cuentas[:-1]):
+                acumulado += cuenta
+                lineas.append(f'{nombre}_bucket{_etiquetas(etiquetas, [("le", limite)])} {acumulado}')
+            lineas.append(f'{nombre}_sum{_etiquetas(etiquetas)} {_numero(cuentas[-1])}')
+            lineas.append(f'{nombre}_count{_etiquetas(etiquetas)} {acumulado}')
+    return '\n'.join(lineas) + '\n'
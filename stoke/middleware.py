@@ -0,0 +1,277 @@
+"""
+Middleware de stoke.
+"""
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, OperationalError, connections
+from django.http import HttpResponse
+
+from . import metricas, perfilado
+from .routers import _leer_de_replica, replica_configurada
+
+
+def solo_lectura(vista):
+    """Marca una vista cuyos GET pueden leerse desde la réplica"""
+    vista.stoke_solo_lectura = True
+    return vista
+
+
+def critica(vista):
+    """Marca una vista del camino de cobro: nunca se rechaza por carga (ver AdmisionMiddleware)"""
+    vista.stoke_clase = 'critica'
+    return vista
+
+
+def diferible(vista):
+    """Marca una vista de reportes o cargas masivas que puede esperar si las ventas van lentas"""
+    vista.stoke_clase = 'diferible'
+    return vista
+
+
+class ReplicaMiddleware:
+    """
+    Envía a la réplica las lecturas de los GET de vistas de solo lectura y de los
+    listados del admin. Después de cualquier escritura exitosa (POST de una
+    venta, devolución, cierre, etc.) deja una cookie corta para que ese usuario
+    lea de la base principal y vea sus propios cambios aunque la réplica esté
+    atrasada.
+    """
+    COOKIE = 'stoke_escritura'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        token = getattr(request, '_stoke_token_replica', None)
+        if token is not None:
+            _leer_de_replica.reset(token)
+
+        if (
+            request.method not in ('GET', 'HEAD', 'OPTIONS') and
+            response.status_code < 400 and
+            replica_configurada()
+        ):
+            segundos = getattr(settings, 'STOKE_REPLICA_PEGAJOSO', 10)
+            response.set_cookie(self.COOKIE, '1', max_age=segundos, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD') or not replica_configurada():
+            return None
+        if request.COOKIES.get(self.COOKIE):
+            return None  # El usuario escribió hace poco: leer lo propio desde la principal
+
+        es_listado_admin = (
+            request.resolver_match is not None and
+            request.resolver_match.app_name == 'admin' and
+            (request.resolver_match.url_name or '').endswith('_changelist')
+        )
+        if getattr(view_func, 'stoke_solo_lectura', False) or es_listado_admin:
+            request._stoke_token_replica = _leer_de_replica.set(True)
+        return None
+
+
+class PerfiladoMiddleware:
+    """
+    Perfila una fracción de las requests (STOKE_PERFILADO_MUESTREO) y todas las
+    que tarden más de STOKE_PERFILADO_UMBRAL_MS, guardando pilas y SQL en
+    STOKE_PERFILADO_DIR (ver stoke/perfilado.py). Con STOKE_PERFILADO apagado
+    Django lo saca de la cadena al arrancar y no cuesta nada.
+
+    Con umbral, todas las requests se muestrean (es la única forma de tener la
+    pila de una request lenta después de que terminó), pero solo se escriben a
+    disco las lentas y las sorteadas.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STOKE_PERFILADO', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.fraccion = settings.STOKE_PERFILADO_MUESTREO
+        self.umbral_ms = settings.STOKE_PERFILADO_UMBRAL_MS
+
+    def __call__(self, request):
+        sorteada = random.random() < self.fraccion
+        if not sorteada and not self.umbral_ms:
+            return self.get_response(request)
+
+        with perfilado.Captura(perfilado.obtener_muestreador()) as captura:
+            response = self.get_response(request)
+
+        if sorteada or captura.duracion_ms >= self.umbral_ms:
+            captura.guardar(request, response)
+        return response
+
+
+class MetricasMiddleware:
+    """
+    Duración y cantidad de consultas SQL de cada request, por vista (ver
+    stoke/metricas.py). Solo suma números en memoria: no escribe a la base.
+    """
+    METODOS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STOKE_METRICAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        consultas = 0
+
+        def contar(execute, sql, params, many, context):
+            nonlocal consultas
+            consultas += 1
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(contar))
+            response = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        # Etiquetar por nombre de vista (no por ruta) para no crear una serie por id
+        match = request.resolver_match
+        vista = (match.view_name or match._func_path) if match else 'sin_ruta'
+        metodo = request.method if request.method in self.METODOS else 'otro'
+        metricas.incrementar('stoke_http_requests_total', vista=vista, metodo=metodo, estado=response.status_code)
+        metricas.observar('stoke_http_request_duration_seconds', duracion, vista=vista)
+        metricas.observar('stoke_http_request_db_queries', consultas, vista=vista)
+        return response
+
+
+class LatenciaCobro:
+    """
+    Promedio móvil exponencial de la duración de las requests críticas de este
+    worker. Una medición más vieja que `ventana` segundos no cuenta: sin ventas
+    recientes no hay nada que proteger.
+    """
+    ALFA = 0.2
+
+    def __init__(self, umbral_ms, ventana):
+        self.umbral = umbral_ms / 1000
+        self.ventana = ventana
+        self.promedio = None
+        self.ultima = 0
+
+    def observar(self, segundos):
+        ahora = time.monotonic()
+        if self.promedio is None or ahora - self.ultima > self.ventana:
+            self.promedio = segundos
+        else:
+            self.promedio += self.ALFA * (segundos - self.promedio)
+        self.ultima = ahora
+
+    def saturada(self):
+        return (
+            self.promedio is not None and
+            time.monotonic() - self.ultima <= self.ventana and
+            self.promedio > self.umbral
+        )
+
+
+class AdmisionMiddleware:
+    """
+    Control de admisión para que los reportes no frenen el cobro.
+
+    Cada request se clasifica por su vista: 'critica' (marcadas con @critica:
+    cobro, búsqueda y escaneo), 'diferible' (marcadas con @diferible y todo el
+    admin) o 'normal'. Las diferibles reciben un 503 inmediato con Retry-After:
+    - cuando el promedio de duración de las críticas de este worker supera
+      STOKE_ADMISION_LATENCIA_MS, o
+    - cuando el worker ya atiende STOKE_ADMISION_DIFERIBLES diferibles a la vez.
+    Las críticas y las normales nunca se rechazan.
+
+    En PostgreSQL además se fija statement_timeout por clase
+    (STOKE_TIMEOUT_CRITICA_MS, STOKE_TIMEOUT_DIFERIBLE_MS; 0 deja el de la base)
+    antes de la primera consulta de la request y se restaura al terminar.
+    """
+    MENSAJE = 'El sistema está priorizando las ventas. Probá de nuevo en unos segundos.'
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STOKE_ADMISION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.latencia = LatenciaCobro(settings.STOKE_ADMISION_LATENCIA_MS, settings.STOKE_ADMISION_VENTANA)
+        self.diferibles = threading.BoundedSemaphore(settings.STOKE_ADMISION_DIFERIBLES)
+        self.reintento = settings.STOKE_ADMISION_REINTENTO
+        self.timeouts = {
+            'critica': settings.STOKE_TIMEOUT_CRITICA_MS,
+            'diferible': settings.STOKE_TIMEOUT_DIFERIBLE_MS,
+        }
+
+    def __call__(self, request):
+        configuradas = []
+
+        def limitar(execute, sql, params, many, context):
+            conexion = context['connection']
+            milisegundos = self.timeouts.get(getattr(request, '_stoke_clase', None))
+            if milisegundos and conexion.vendor == 'postgresql' and conexion.alias not in configuradas:
+                configuradas.append(conexion.alias)  # Antes de ejecutar: el SET pasa otra vez por acá
+                with conexion.cursor() as cursor:
+                    cursor.execute('SET statement_timeout = %s', [milisegundos])
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(limitar))
+                response = self.get_response(request)
+        finally:
+            if getattr(request, '_stoke_diferible_admitida', False):
+                self.diferibles.release()
+            for alias in configuradas:
+                self._restaurar_timeout(alias)
+
+        if getattr(request, '_stoke_clase', None) == 'critica':
+            self.latencia.observar(time.perf_counter() - inicio)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        clase = getattr(view_func, 'stoke_clase', None)
+        if clase is None:
+            match = request.resolver_match
+            clase = 'diferible' if match is not None and match.app_name == 'admin' else 'normal'
+        request._stoke_clase = clase
+        if clase != 'diferible':
+            return None
+
+        if self.latencia.saturada():
+            return self._rechazar('latencia')
+        if not self.diferibles.acquire(blocking=False):
+            return self._rechazar('concurrencia')
+        request._stoke_diferible_admitida = True
+        return None
+
+    def process_exception(self, request, exception):
+        # Consulta cortada por statement_timeout (SQLSTATE 57014): 503 en lugar de 500
+        if not isinstance(exception, OperationalError):
+            return None
+        causa = exception.__cause__
+        if getattr(causa, 'sqlstate', None) != '57014' and getattr(causa, 'pgcode', None) != '57014':
+            return None
+        return self._rechazar('timeout', getattr(request, '_stoke_clase', 'normal'))
+
+    def _rechazar(self, motivo, clase='diferible'):
+        metricas.incrementar('stoke_admision_rechazos_total', clase=clase, motivo=motivo)
+        response = HttpResponse(self.MENSAJE, status=503, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(self.reintento)
+        return response
+
+    def _restaurar_timeout(self, alias):
+        """Las conexiones persistentes (CONN_MAX_AGE) no deben arrastrar el timeout a la próxima request"""
+        conexion = connections[alias]
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute('SET statement_timeout = DEFAULT')
+        except DatabaseError:
+            # Transacción abortada u otra falla: descartar la conexión y que la próxima request abra una nueva
+            conexion.close()
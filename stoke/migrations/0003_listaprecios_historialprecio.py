@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('stoke', '0002_cierrecaja_detalleventa_remove_venta_cantidad_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='producto',
+            name='precio',
+            field=models.DecimalField(decimal_places=2, help_text='Precio vigente (los cambios quedan en el historial de precios)', max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='ListaPrecios',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(help_text='Ej: Aumento bebidas marzo', max_length=100)),
+                ('tipo', models.CharField(choices=[('porcentaje', 'Porcentaje'), ('absoluto', 'Monto fijo')], default='porcentaje', max_length=20)),
+                ('valor', models.DecimalField(decimal_places=2, help_text='Porcentaje (ej: 12.5) o monto a sumar. Negativo para bajar precios', max_digits=10)),
+                ('filtro_nombre', models.CharField(blank=True, help_text='Solo productos cuyo nombre contenga este texto', max_length=100)),
+                ('solo_activos', models.BooleanField(default=True, help_text='Ignorar productos inactivos')),
+                ('fecha_vigencia', models.DateTimeField(default=django.utils.timezone.now, help_text='Desde cuándo rigen los nuevos precios')),
+                ('fecha_aplicacion', models.DateTimeField(blank=True, editable=False, help_text='Cuándo se aplicó efectivamente', null=True)),
+                ('productos_actualizados', models.IntegerField(default=0, editable=False)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('categoria', models.ForeignKey(blank=True, help_text='Solo productos de esta categoría', null=True, on_delete=django.db.models.deletion.PROTECT, to='stoke.categoria')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='listas_precios', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Lista de Precios',
+                'verbose_name_plural': 'Listas de Precios',
+                'ordering': ['-fecha_vigencia'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HistorialPrecio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precio_anterior', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('precio_nuevo', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lista', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cambios', to='stoke.listaprecios')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_precios', to='stoke.producto')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Historial de Precio',
+                'verbose_name_plural': 'Historial de Precios',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='listaprecios',
+            index=models.Index(fields=['fecha_aplicacion', 'fecha_vigencia'], name='stoke_lista_fecha_a_c41873_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialprecio',
+            index=models.Index(fields=['producto', '-fecha'], name='stoke_histo_product_8ecd9c_idx'),
+        ),
+    ]
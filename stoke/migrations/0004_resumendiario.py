@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('stoke', '0003_listaprecios_historialprecio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('total_efectivo', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_tarjeta_debito', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_tarjeta_credito', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_transferencia', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_mercado_pago', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total_ventas', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('cantidad_ventas', models.IntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='resumenes_diarios', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario',
+                'verbose_name_plural': 'Resúmenes Diarios',
+                'ordering': ['-fecha'],
+                'unique_together': {('fecha', 'usuario')},
+            },
+        ),
+    ]
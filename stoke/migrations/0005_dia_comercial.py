@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:33
+
+from django.db import migrations, models
+import stoke.jornada
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stoke', '0004_resumendiario'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cierrecaja',
+            name='fecha',
+            field=models.DateField(default=stoke.jornada.dia_comercial, help_text='Día comercial del cierre'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['usuario', 'fecha'], name='stoke_venta_usuario_dec8a9_idx'),
+        ),
+    ]
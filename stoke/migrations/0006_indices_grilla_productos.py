@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stoke', '0005_dia_comercial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='producto',
+            name='stoke_produ_nombre_463431_idx',
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['nombre', 'id'], name='stoke_produ_nombre_21794b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'nombre', 'id'], name='stoke_produ_categor_bde097_idx'),
+        ),
+    ]
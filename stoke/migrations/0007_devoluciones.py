@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('stoke', '0006_indices_grilla_productos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detalleventa',
+            name='cantidad_devuelta',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='anulada',
+            field=models.BooleanField(default=False, help_text='Venta anulada por completo'),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='total_devuelto',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Monto reintegrado por devoluciones', max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='Devolucion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('total', models.DecimalField(decimal_places=2, default=0, help_text='Monto reintegrado', max_digits=10)),
+                ('es_anulacion', models.BooleanField(default=False)),
+                ('motivo', models.TextField(blank=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='devoluciones', to=settings.AUTH_USER_MODEL)),
+                ('venta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='devoluciones', to='stoke.venta')),
+            ],
+            options={
+                'verbose_name': 'Devolución',
+                'verbose_name_plural': 'Devoluciones',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DetalleDevolucion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField()),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('detalle_venta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='devoluciones', to='stoke.detalleventa')),
+                ('devolucion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detalles', to='stoke.devolucion')),
+            ],
+            options={
+                'verbose_name': 'Detalle de Devolución',
+                'verbose_name_plural': 'Detalles de Devolución',
+                'ordering': ['devolucion', 'id'],
+            },
+        ),
+    ]
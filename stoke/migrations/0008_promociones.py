@@ -0,0 +1,80 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:40
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+import django.db.models.deletion
+
+
+def completar_monto_manual(apps, schema_editor):
+    """
+    Las ventas anteriores guardaban el importe manual solo dentro del total (el
+    que mandaba la caja): pasa a monto_manual lo que el total tiene de más sobre
+    los detalles y el recargo, así el total sigue cuadrando con la fórmula nueva.
+    """
+    Venta = apps.get_model('stoke', 'Venta')
+    DetalleVenta = apps.get_model('stoke', 'DetalleVenta')
+    dinero = DecimalField(max_digits=10, decimal_places=2)
+    cero = Value(0, output_field=dinero)
+
+    subtotales = DetalleVenta.objects.filter(venta_id=OuterRef('pk')).values('venta_id').annotate(
+        suma=Sum('subtotal')
+    ).values('suma')
+    Venta.objects.update(monto_manual=Greatest(
+        F('total') - Coalesce(Subquery(subtotales, output_field=dinero), cero) - F('recargo_tarjeta'),
+        cero,
+        output_field=dinero,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stoke', '0007_devoluciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detalleventa',
+            name='descuento',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Descuento aplicado por promoción (ya restado del subtotal)', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='monto_manual',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Importe cargado a mano (sin producto)', max_digits=10),
+        ),
+        migrations.RunPython(completar_monto_manual, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='Promocion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('tipo', models.CharField(choices=[('nxm', 'Lleva N, paga M (ej: 2x1)'), ('combo', 'N unidades a precio fijo'), ('descuento', 'Descuento porcentual'), ('recargo', 'Recargo porcentual por método de pago')], max_length=20)),
+                ('metodo_pago', models.CharField(blank=True, choices=[('efectivo', 'Efectivo'), ('tarjeta_debito', 'Tarjeta Débito'), ('tarjeta_credito', 'Tarjeta Crédito'), ('transferencia', 'Transferencia'), ('mercado_pago', 'Mercado Pago')], help_text='Solo con este método de pago (obligatorio para recargos)', max_length=20)),
+                ('cantidad', models.PositiveIntegerField(blank=True, help_text='N: unidades que lleva (nxm y combo)', null=True)),
+                ('cantidad_paga', models.PositiveIntegerField(blank=True, help_text='M: unidades que paga (nxm)', null=True)),
+                ('precio', models.DecimalField(blank=True, decimal_places=2, help_text='Precio de las N unidades (combo)', max_digits=10, null=True)),
+                ('porcentaje', models.DecimalField(blank=True, decimal_places=2, help_text='Porcentaje de descuento o recargo', max_digits=5, null=True)),
+                ('activa', models.BooleanField(default=True)),
+                ('fecha_desde', models.DateTimeField(blank=True, null=True)),
+                ('fecha_hasta', models.DateTimeField(blank=True, null=True)),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promociones', to='stoke.categoria')),
+                ('producto', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promociones', to='stoke.producto')),
+            ],
+            options={
+                'verbose_name': 'Promoción',
+                'verbose_name_plural': 'Promociones',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.AddField(
+            model_name='detalleventa',
+            name='promocion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='detalles_venta', to='stoke.promocion'),
+        ),
+        migrations.AddIndex(
+            model_name='promocion',
+            index=models.Index(fields=['activa'], name='stoke_promo_activa_7034f0_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('stoke', '0008_promociones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sucursal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('direccion', models.CharField(blank=True, max_length=200)),
+                ('activa', models.BooleanField(default=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('usuarios', models.ManyToManyField(blank=True, help_text='Usuarios que venden en esta sucursal. Los usuarios sin sucursal asignada trabajan en la principal', related_name='sucursales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sucursal',
+                'verbose_name_plural': 'Sucursales',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.AddField(
+            model_name='cierrecaja',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='cierres_caja', to='stoke.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='resumendiario',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='resumenes_diarios', to='stoke.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ventas', to='stoke.sucursal'),
+        ),
+        migrations.CreateModel(
+            name='Existencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(default=0)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='existencias', to='stoke.producto')),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='existencias', to='stoke.sucursal')),
+            ],
+            options={
+                'verbose_name': 'Existencia',
+                'verbose_name_plural': 'Existencias',
+                'ordering': ['sucursal', 'producto'],
+                'unique_together': {('sucursal', 'producto')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Sum
+
+
+def crear_sucursal_principal(apps, schema_editor):
+    """Pasa el stock global a la sucursal principal y le asigna las ventas, cierres y resúmenes existentes"""
+    Sucursal = apps.get_model('stoke', 'Sucursal')
+    Existencia = apps.get_model('stoke', 'Existencia')
+    Producto = apps.get_model('stoke', 'Producto')
+
+    principal = Sucursal.objects.order_by('id').first() or Sucursal.objects.create(nombre='Principal')
+
+    existencias = [
+        Existencia(sucursal=principal, producto_id=producto_id, stock=stock)
+        for producto_id, stock in Producto.objects.values_list('id', 'stock').iterator()
+    ]
+    Existencia.objects.bulk_create(existencias, batch_size=1000, ignore_conflicts=True)
+
+    for modelo in ('Venta', 'CierreCaja', 'ResumenDiario'):
+        apps.get_model('stoke', modelo).objects.filter(sucursal__isnull=True).update(sucursal=principal)
+
+
+def volver_a_stock_global(apps, schema_editor):
+    """El stock global pasa a ser la suma de todas las sucursales"""
+    Existencia = apps.get_model('stoke', 'Existencia')
+    Producto = apps.get_model('stoke', 'Producto')
+
+    totales = Existencia.objects.values('producto_id').annotate(total=Sum('stock'))
+    productos = [Producto(id=fila['producto_id'], stock=fila['total']) for fila in totales]
+    Producto.objects.bulk_update(productos, ['stock'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stoke', '0009_sucursales'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_sucursal_principal, volver_a_stock_global),
+    ]
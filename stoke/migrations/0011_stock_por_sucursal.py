@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('stoke', '0010_sucursal_principal'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='venta',
+            name='stoke_venta_usuario_dec8a9_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='cierrecaja',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='resumendiario',
+            unique_together=set(),
+        ),
+        migrations.RemoveField(
+            model_name='producto',
+            name='stock',
+        ),
+        migrations.AlterField(
+            model_name='cierrecaja',
+            name='sucursal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='cierres_caja', to='stoke.sucursal'),
+        ),
+        migrations.AlterField(
+            model_name='resumendiario',
+            name='sucursal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='resumenes_diarios', to='stoke.sucursal'),
+        ),
+        migrations.AlterField(
+            model_name='venta',
+            name='sucursal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ventas', to='stoke.sucursal'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cierrecaja',
+            unique_together={('sucursal', 'fecha', 'usuario')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='resumendiario',
+            unique_together={('sucursal', 'fecha', 'usuario')},
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['sucursal', 'fecha'], name='stoke_venta_sucursa_a3a2b7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['sucursal', 'usuario', 'fecha'], name='stoke_venta_sucursa_8d3d3b_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.apps import apps as global_apps
+from django.contrib.auth.management import create_permissions
+from django.db import migrations
+
+# Copia fija de los grupos de esta versión: los cambios posteriores van en
+# stoke/permisos.py (comando configurar_permisos), no cambian esta migración
+GRUPOS = {
+    'Vendedores': ['add_venta', 'view_venta', 'view_producto'],
+}
+
+
+def crear_grupos(apps, schema_editor):
+    Group = apps.get_model('auth', 'Group')
+    Permission = apps.get_model('auth', 'Permission')
+
+    # Los permisos se crean recién después de migrar: forzarlos para poder asignarlos acá
+    create_permissions(global_apps.get_app_config('stoke'), apps=apps, verbosity=0)
+    codenames = {codename for permisos in GRUPOS.values() for codename in permisos}
+    permisos = dict(
+        Permission.objects.filter(content_type__app_label='stoke', codename__in=codenames).values_list('codename', 'pk')
+    )
+    faltantes = codenames - set(permisos)
+    if faltantes:
+        raise LookupError(f'Permisos inexistentes: {", ".join(sorted(faltantes))}')
+
+    for nombre, codenames_grupo in GRUPOS.items():
+        grupo, _ = Group.objects.get_or_create(name=nombre)
+        grupo.permissions.add(*(permisos[codename] for codename in codenames_grupo))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('stoke', '0011_stock_por_sucursal'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_grupos, migrations.RunPython.noop),
+    ]
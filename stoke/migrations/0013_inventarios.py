@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('stoke', '0012_grupo_vendedores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Inventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('abierto', 'Abierto'), ('cerrado', 'Cerrado'), ('cancelado', 'Cancelado')], default='abierto', max_length=20)),
+                ('descripcion', models.CharField(blank=True, help_text='Ej: Inventario anual, góndola de bebidas', max_length=200)),
+                ('no_contados_en_cero', models.BooleanField(default=False, help_text='Al cerrar, los productos con stock que no se contaron quedan en 0')),
+                ('fecha_apertura', models.DateTimeField(auto_now_add=True)),
+                ('fecha_cierre', models.DateTimeField(blank=True, null=True)),
+                ('productos_ajustados', models.IntegerField(default=0, editable=False)),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='inventarios', to='stoke.sucursal')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='inventarios', to=settings.AUTH_USER_MODEL)),
+                ('usuario_cierre', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Inventario',
+                'verbose_name_plural': 'Inventarios',
+                'ordering': ['-fecha_apertura'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ConteoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField(default=0)),
+                ('stock_inicial', models.IntegerField(help_text='Stock de la sucursal al contar el producto por primera vez')),
+                ('fecha_actualizacion', models.DateTimeField(default=django.utils.timezone.now)),
+                ('inventario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conteos', to='stoke.inventario')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='stoke.producto')),
+            ],
+            options={
+                'verbose_name': 'Conteo de Inventario',
+                'verbose_name_plural': 'Conteos de Inventario',
+                'ordering': ['inventario', 'producto'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventario',
+            index=models.Index(fields=['sucursal', 'estado'], name='stoke_inven_sucursa_9312cf_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conteoinventario',
+            unique_together={('inventario', 'producto')},
+        ),
+    ]
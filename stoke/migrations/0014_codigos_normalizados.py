@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stoke', '0013_inventarios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodigoBarras',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=50)),
+                ('codigo_normalizado', models.CharField(editable=False, max_length=50, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Código de Barras',
+                'verbose_name_plural': 'Códigos de Barras',
+                'ordering': ['producto', 'codigo'],
+            },
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='codigo_normalizado',
+            field=models.CharField(blank=True, editable=False, help_text='Código de barras en forma canónica (GTIN-14), para las búsquedas', max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='codigobarras',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos', to='stoke.producto'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+import re
+
+from django.db import migrations
+
+SEPARADORES = re.compile(r'[\s-]+')
+
+
+def normalizar_codigo(codigo):
+    """Copia fija de stoke.codigos.normalizar_codigo al momento de esta migración"""
+    codigo = SEPARADORES.sub('', str(codigo)).upper()
+    if not codigo:
+        return None
+    if codigo.isdigit() and len(codigo) <= 14:
+        return codigo.zfill(14)
+    return codigo
+
+
+def normalizar(apps, schema_editor):
+    """
+    Calcula el código normalizado de los productos existentes. Si dos productos
+    quedan con el mismo código (ej: "7790310981238" y "07790310981238"), el más
+    viejo conserva el código y al otro se le renombra a "REPETIDO<id>:<código>"
+    para buscarlo y corregirlo desde el admin (así se puede volver a guardar).
+    """
+    Producto = apps.get_model('stoke', 'Producto')
+
+    usados = set()
+    productos = []
+    for producto in Producto.objects.exclude(codigo_barras__isnull=True).only('id', 'codigo_barras').order_by('id').iterator():
+        normalizado = normalizar_codigo(producto.codigo_barras)
+        if normalizado is not None and normalizado in usados:
+            producto.codigo_barras = f'REPETIDO{producto.id}:{producto.codigo_barras}'[:50]
+            normalizado = normalizar_codigo(producto.codigo_barras)
+        usados.add(normalizado)
+        producto.codigo_normalizado = normalizado
+        productos.append(producto)
+    Producto.objects.bulk_update(productos, ['codigo_barras', 'codigo_normalizado'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stoke', '0014_codigos_normalizados'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalizar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stoke', '0015_normalizar_codigos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='producto',
+            name='codigo_normalizado',
+            field=models.CharField(blank=True, editable=False, help_text='Código de barras en forma canónica (GTIN-14), para las búsquedas', max_length=50, null=True, unique=True),
+        ),
+        migrations.RemoveIndex(
+            model_name='producto',
+            name='stoke_produ_codigo__d7bfca_idx',
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='codigo_barras',
+            field=models.CharField(blank=True, help_text='Código de barras del producto (EAN/UPC con dígito verificador, o un código interno)', max_length=50, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stoke', '0017_eventos_salida'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='existencia',
+            name='dia_vendidas',
+            field=models.DateField(blank=True, help_text='Día comercial de vendidas_hoy', null=True),
+        ),
+        migrations.AddField(
+            model_name='existencia',
+            name='vendidas_30_dias',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='existencia',
+            name='vendidas_hoy',
+            field=models.PositiveIntegerField(default=0, help_text='Unidades vendidas en dia_vendidas'),
+        ),
+        migrations.AddField(
+            model_name='existencia',
+            name='vendidas_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='existencia',
+            index=models.Index(fields=['sucursal', '-vendidas_30_dias'], name='stoke_existencia_popular_idx'),
+        ),
+    ]
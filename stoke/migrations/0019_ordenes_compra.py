@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('stoke', '0018_existencia_vendidas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='costo',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Último costo unitario de compra (se actualiza al recibir una orden de compra)', max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='OrdenCompra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('proveedor', models.CharField(max_length=200)),
+                ('remito', models.CharField(blank=True, help_text='Número de remito o factura del proveedor', max_length=50)),
+                ('estado', models.CharField(choices=[('abierta', 'Abierta'), ('recibida', 'Recibida'), ('cancelada', 'Cancelada')], default='abierta', max_length=20)),
+                ('actualizar_costos', models.BooleanField(default=True, help_text='Al recibir, el costo de cada línea pasa a ser el costo del producto')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_recepcion', models.DateTimeField(blank=True, null=True)),
+                ('productos_recibidos', models.IntegerField(default=0, editable=False)),
+                ('unidades_recibidas', models.IntegerField(default=0, editable=False)),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ordenes_compra', to='stoke.sucursal')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ordenes_compra', to=settings.AUTH_USER_MODEL)),
+                ('usuario_recepcion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Orden de Compra',
+                'verbose_name_plural': 'Órdenes de Compra',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LineaOrdenCompra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField(default=0)),
+                ('costo_unitario', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('orden', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='stoke.ordencompra')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='stoke.producto')),
+            ],
+            options={
+                'verbose_name': 'Línea de Orden de Compra',
+                'verbose_name_plural': 'Líneas de Orden de Compra',
+                'ordering': ['orden', 'producto'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ordencompra',
+            index=models.Index(fields=['sucursal', 'estado'], name='stoke_orden_sucursa_a69ecb_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='lineaordencompra',
+            unique_together={('orden', 'producto')},
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-19 01:11
+
+from django.db import migrations, models
+
+PREFIJO = 'Importada del sistema anterior (venta '
+
+
+def completar_venta_externa(apps, schema_editor):
+    """
+    Las ventas ya importadas quedan marcadas con su número original (sacado de
+    las observaciones) para que reimportar el archivo no las duplique. Si ya se
+    importaron dos veces, solo se marca la primera.
+    """
+    Venta = apps.get_model('stoke', 'Venta')
+    vistas = set()
+    importadas = (
+        Venta.objects.filter(observaciones__startswith=PREFIJO, observaciones__endswith=')')
+        .order_by('id').values_list('id', 'sucursal_id', 'observaciones')
+    )
+    for venta_id, sucursal_id, observaciones in importadas.iterator():
+        externa = observaciones[len(PREFIJO):-1]
+        if len(externa) <= 50 and (sucursal_id, externa) not in vistas:
+            vistas.add((sucursal_id, externa))
+            Venta.objects.filter(pk=venta_id).update(venta_externa=externa)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stoke', '0019_ordenes_compra'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='venta_externa',
+            field=models.CharField(blank=True, editable=False, help_text='Número de la venta en el sistema anterior', max_length=50, null=True),
+        ),
+        migrations.RunPython(completar_venta_externa, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='venta',
+            unique_together={('sucursal', 'venta_externa')},
+        ),
+    ]
@@ -1,6 +1,16 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Round
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .catalogo import invalidar_catalogo
+from .codigos import normalizar_codigo, validar_codigo
+from .jornada import dia_comercial, filtro_dia
 
 
 class Categoria(models.Model):
@@ -17,12 +27,47 @@ class Categoria(models.Model):
         return self.nombre
 
 
+class Sucursal(models.Model):
+    """Kiosco o punto de venta. El stock, las ventas y los cierres son por sucursal"""
+    nombre = models.CharField(max_length=100, unique=True)
+    direccion = models.CharField(max_length=200, blank=True)
+    activa = models.BooleanField(default=True)
+    usuarios = models.ManyToManyField(User, blank=True, related_name='sucursales', help_text="Usuarios que venden en esta sucursal. Los usuarios sin sucursal asignada trabajan en la principal")
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Sucursal'
+        verbose_name_plural = 'Sucursales'
+        ordering = ['nombre']
+    
+    def __str__(self):
+        return self.nombre
+    
+    @classmethod
+    def principal(cls):
+        """Sucursal por defecto: la primera activa que se creó"""
+        return cls.objects.filter(activa=True).order_by('id').first()
+    
+    @classmethod
+    def de_usuario(cls, usuario):
+        """Sucursales en las que puede trabajar el usuario"""
+        sucursales = cls.objects.filter(activa=True)
+        if usuario.is_superuser:
+            return sucursales
+        asignadas = sucursales.filter(usuarios=usuario)
+        if asignadas.exists():
+            return asignadas
+        principal = cls.principal()
+        return sucursales.filter(pk=principal.pk if principal else None)
+
+
 class Producto(models.Model):
     """Modelo de producto para kiosco"""
     nombre = models.CharField(max_length=200)
-    codigo_barras = models.CharField(max_length=50, unique=True, blank=True, null=True, help_text="Código de barras del producto")
-    precio = models.DecimalField(max_digits=10, decimal_places=2)
-    stock = models.IntegerField(default=0)
+    codigo_barras = models.CharField(max_length=50, blank=True, null=True, help_text="Código de barras del producto (EAN/UPC con dígito verificador, o un código interno)")
+    codigo_normalizado = models.CharField(max_length=50, unique=True, blank=True, null=True, editable=False, help_text="Código de barras en forma canónica (GTIN-14), para las búsquedas")
+    precio = models.DecimalField(max_digits=10, decimal_places=2, help_text="Precio vigente (los cambios quedan en el historial de precios)")
+    costo = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Último costo unitario de compra (se actualiza al recibir una orden de compra)")
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True)
     tamaño = models.CharField(max_length=50, blank=True, null=True, help_text="Tamaño o presentación (ej: 500ml, 1L, etc.)")
     activo = models.BooleanField(default=True, help_text="Producto activo para ventas")
@@ -34,22 +79,142 @@ class Producto(models.Model):
         verbose_name_plural = 'Productos'
         ordering = ['nombre']
         indexes = [
-            models.Index(fields=['codigo_barras']),
-            models.Index(fields=['nombre']),
+            models.Index(fields=['nombre', 'id']),  # Grilla de ventas (paginación por cursor)
+            models.Index(fields=['categoria', 'nombre', 'id']),  # Grilla filtrada por categoría
         ]
     
     def __str__(self):
         tamaño_str = f" - {self.tamaño}" if self.tamaño else ""
         return f"{self.nombre}{tamaño_str} - ${self.precio}"
     
-    def descontar_stock(self, cantidad):
-        """Descuenta stock del producto"""
-        if self.stock >= cantidad:
-            self.stock -= cantidad
-            self.save()
-            return True
-        else:
-            raise ValidationError(f'Stock insuficiente. Disponible: {self.stock}, Solicitado: {cantidad}')
+    def clean(self):
+        super().clean()
+        try:
+            normalizado = validar_codigo(self.codigo_barras)
+        except ValidationError as e:
+            raise ValidationError({'codigo_barras': e.messages})
+        if not normalizado:
+            return
+        # codigo_normalizado no está en el formulario: sin esto, el índice único terminaría en un IntegrityError
+        if Producto.objects.filter(codigo_normalizado=normalizado).exclude(pk=self.pk).exists():
+            raise ValidationError({'codigo_barras': 'Otro producto ya tiene este código (o una variante con ceros a la izquierda)'})
+        if CodigoBarras.objects.filter(codigo_normalizado=normalizado).exclude(producto_id=self.pk).exists():
+            raise ValidationError({'codigo_barras': 'Este código ya es un código alternativo de otro producto'})
+    
+    def save(self, *args, **kwargs):
+        self.codigo_normalizado = normalizar_codigo(self.codigo_barras)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'codigo_barras' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'codigo_normalizado'}
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def ids_por_codigo(cls, codigos):
+        """
+        Resuelve códigos leídos por el escáner a ids de producto: {codigo: producto_id}.
+        Una consulta por igualdad sobre el índice único y, solo para los que no
+        aparecen, otra sobre los códigos alternativos.
+        """
+        normalizados = {codigo: normalizar_codigo(codigo) for codigo in codigos}
+        buscados = {normalizado for normalizado in normalizados.values() if normalizado}
+        if not buscados:
+            return {}
+        encontrados = dict(cls.objects.filter(codigo_normalizado__in=buscados).values_list('codigo_normalizado', 'id'))
+        faltantes = buscados.difference(encontrados)
+        if faltantes:
+            encontrados.update(
+                CodigoBarras.objects.filter(codigo_normalizado__in=faltantes).values_list('codigo_normalizado', 'producto_id')
+            )
+        return {
+            codigo: encontrados[normalizado]
+            for codigo, normalizado in normalizados.items()
+            if normalizado in encontrados
+        }
+
+
+class CodigoBarras(models.Model):
+    """Código de barras alternativo de un producto (otro envase, código del proveedor, etc.)"""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='codigos')
+    codigo = models.CharField(max_length=50)
+    codigo_normalizado = models.CharField(max_length=50, unique=True, editable=False)
+    
+    class Meta:
+        verbose_name = 'Código de Barras'
+        verbose_name_plural = 'Códigos de Barras'
+        ordering = ['producto', 'codigo']
+    
+    def __str__(self):
+        return self.codigo
+    
+    def clean(self):
+        super().clean()
+        try:
+            normalizado = validar_codigo(self.codigo)
+        except ValidationError as e:
+            raise ValidationError({'codigo': e.messages})
+        if not normalizado:
+            return
+        if Producto.objects.filter(codigo_normalizado=normalizado).exclude(pk=self.producto_id).exists():
+            raise ValidationError({'codigo': 'Este código ya es el código principal de otro producto'})
+        if CodigoBarras.objects.filter(codigo_normalizado=normalizado).exclude(pk=self.pk).exists():
+            raise ValidationError({'codigo': 'Este código ya está cargado como alternativo'})
+    
+    def save(self, *args, **kwargs):
+        self.codigo_normalizado = normalizar_codigo(self.codigo)
+        super().save(*args, **kwargs)
+
+
+class Existencia(models.Model):
+    """Stock de un producto en una sucursal"""
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name='existencias')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='existencias')
+    stock = models.IntegerField(default=0)
+
+    # Unidades vendidas en la sucursal: las suma cada cobro y `manage.py actualizar_popularidad`
+    # descarta a diario lo que salió de la ventana de 30 días. La grilla y la búsqueda ordenan por vendidas_30_dias
+    vendidas_hoy = models.PositiveIntegerField(default=0, help_text="Unidades vendidas en dia_vendidas")
+    dia_vendidas = models.DateField(null=True, blank=True, help_text="Día comercial de vendidas_hoy")
+    vendidas_30_dias = models.PositiveIntegerField(default=0)
+    vendidas_total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Existencia'
+        verbose_name_plural = 'Existencias'
+        ordering = ['sucursal', 'producto']
+        unique_together = ['sucursal', 'producto']  # Índice (sucursal, producto): cada venta solo toca filas de su sucursal
+        indexes = [
+            models.Index(fields=['sucursal', '-vendidas_30_dias'], name='stoke_existencia_popular_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.producto.nombre} en {self.sucursal}: {self.stock}"
+
+    def contar_venta(self, cantidad, dia):
+        """Suma `cantidad` unidades vendidas en el día comercial `dia` (sin guardar)"""
+        if self.dia_vendidas != dia:
+            self.dia_vendidas = dia
+            self.vendidas_hoy = 0
+        self.vendidas_hoy += cantidad
+        self.vendidas_30_dias += cantidad
+        self.vendidas_total += cantidad
+
+    @classmethod
+    def descontar(cls, sucursal_id, producto_id, cantidad):
+        """Descuenta stock de una sucursal, solo si alcanza (controlado en el mismo UPDATE)"""
+        actualizadas = cls.objects.filter(
+            sucursal_id=sucursal_id,
+            producto_id=producto_id,
+            stock__gte=cantidad
+        ).update(stock=F('stock') - cantidad)
+        if not actualizadas:
+            disponible = cls.disponible(sucursal_id, producto_id)
+            raise ValidationError(f'Stock insuficiente. Disponible: {disponible}, Solicitado: {cantidad}')
+    
+    @classmethod
+    def disponible(cls, sucursal_id, producto_id):
+        """Stock de un producto en una sucursal (0 si nunca tuvo)"""
+        stock = cls.objects.filter(sucursal_id=sucursal_id, producto_id=producto_id).values_list('stock', flat=True).first()
+        return stock or 0
 
 
 class Venta(models.Model):
@@ -63,21 +228,33 @@ class Venta(models.Model):
     ]
     
     fecha = models.DateTimeField(auto_now_add=True)
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.PROTECT, related_name='ventas')
     usuario = models.ForeignKey(User, on_delete=models.PROTECT, related_name='ventas')
     metodo_pago = models.CharField(max_length=20, choices=METODO_PAGO_CHOICES, default='efectivo')
     total = models.DecimalField(max_digits=10, decimal_places=2)
     monto_recibido = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Monto recibido del cliente (solo para efectivo)")
     vuelto = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Vuelto a entregar (solo para efectivo)")
     recargo_tarjeta = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Recargo aplicado por pago con tarjeta")
+    monto_manual = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Importe cargado a mano (sin producto)")
     observaciones = models.TextField(blank=True, null=True)
     
+    # Devoluciones y anulaciones
+    total_devuelto = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Monto reintegrado por devoluciones")
+    anulada = models.BooleanField(default=False, help_text="Venta anulada por completo")
+    
+    # Ventas importadas de un sistema anterior
+    venta_externa = models.CharField(max_length=50, null=True, blank=True, editable=False, help_text="Número de la venta en el sistema anterior")
+    
     class Meta:
         verbose_name = 'Venta'
         verbose_name_plural = 'Ventas'
         ordering = ['-fecha']
+        unique_together = ['sucursal', 'venta_externa']  # Reimportar el mismo archivo no duplica ventas
         indexes = [
             models.Index(fields=['fecha']),
             models.Index(fields=['metodo_pago']),
+            models.Index(fields=['sucursal', 'fecha']),  # Reportes de una sucursal
+            models.Index(fields=['sucursal', 'usuario', 'fecha']),  # Ventas del día de un usuario (cierre, historial)
         ]
     
     def __str__(self):
@@ -96,6 +273,11 @@ class Venta(models.Model):
             self.calcular_vuelto()
         
         super().save(*args, **kwargs)
+    
+    @property
+    def total_neto(self):
+        """Total descontando lo devuelto"""
+        return self.total - self.total_devuelto
 
 
 class DetalleVenta(models.Model):
@@ -105,6 +287,9 @@ class DetalleVenta(models.Model):
     cantidad = models.IntegerField(default=1)
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Descuento aplicado por promoción (ya restado del subtotal)")
+    promocion = models.ForeignKey('Promocion', on_delete=models.SET_NULL, null=True, blank=True, related_name='detalles_venta')
+    cantidad_devuelta = models.IntegerField(default=0)
     
     class Meta:
         verbose_name = 'Detalle de Venta'
@@ -114,15 +299,21 @@ class DetalleVenta(models.Model):
     def __str__(self):
         return f"{self.venta} - {self.producto.nombre} x{self.cantidad}"
     
+    @property
+    def cantidad_pendiente(self):
+        """Unidades que todavía se pueden devolver"""
+        return self.cantidad - self.cantidad_devuelta
+    
     def clean(self):
         """Validar antes de guardar"""
         if self.cantidad <= 0:
             raise ValidationError({'cantidad': 'La cantidad debe ser mayor a 0'})
         
         if self.pk is None:  # Solo validar stock para nuevos detalles
-            if self.producto.stock < self.cantidad:
+            disponible = Existencia.disponible(self.venta.sucursal_id, self.producto_id)
+            if disponible < self.cantidad:
                 raise ValidationError({
-                    'cantidad': f'Stock insuficiente. Disponible: {self.producto.stock}, Solicitado: {self.cantidad}'
+                    'cantidad': f'Stock insuficiente. Disponible: {disponible}, Solicitado: {self.cantidad}'
                 })
     
     def save(self, *args, **kwargs):
@@ -133,16 +324,17 @@ class DetalleVenta(models.Model):
         if not self.subtotal:
             self.subtotal = self.precio_unitario * self.cantidad
         
-        # Descontar stock automáticamente
+        # Descontar stock de la sucursal de la venta automáticamente
         if self.pk is None:  # Solo si es un nuevo detalle
-            self.producto.descontar_stock(self.cantidad)
+            Existencia.descontar(self.venta.sucursal_id, self.producto_id, self.cantidad)
         
         super().save(*args, **kwargs)
 
 
 class CierreCaja(models.Model):
     """Cierre de caja diario"""
-    fecha = models.DateField(auto_now_add=True)
+    fecha = models.DateField(default=dia_comercial, help_text="Día comercial del cierre")
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.PROTECT, related_name='cierres_caja')
     usuario = models.ForeignKey(User, on_delete=models.PROTECT, related_name='cierres_caja')
     fecha_hora_cierre = models.DateTimeField(auto_now_add=True)
     
@@ -167,34 +359,751 @@ class CierreCaja(models.Model):
         verbose_name = 'Cierre de Caja'
         verbose_name_plural = 'Cierres de Caja'
         ordering = ['-fecha_hora_cierre']
-        unique_together = ['fecha', 'usuario']  # Un cierre por usuario por día
+        unique_together = ['sucursal', 'fecha', 'usuario']  # Un cierre por usuario por día en cada sucursal
     
     def __str__(self):
         return f"Cierre {self.fecha} - ${self.total_ventas} - {self.cantidad_ventas} ventas"
     
     def calcular_totales(self):
-        """Calcula los totales desde las ventas del día"""
-        from django.utils import timezone
+        """Calcula los totales desde las ventas del día (re-agregación completa)"""
         from django.db.models import Sum, Count, Q
         
-        inicio_dia = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        fin_dia = timezone.now().replace(hour=23, minute=59, second=59, microsecond=999999)
-        
         ventas = Venta.objects.filter(
-            fecha__gte=inicio_dia,
-            fecha__lte=fin_dia,
-            usuario=self.usuario
+            sucursal_id=self.sucursal_id,
+            usuario=self.usuario,
+            **filtro_dia(self.fecha)
         )
         
-        self.cantidad_ventas = ventas.count()
-        self.total_ventas = ventas.aggregate(Sum('total'))['total__sum'] or 0
-        
-        self.total_efectivo = ventas.filter(metodo_pago='efectivo').aggregate(Sum('total'))['total__sum'] or 0
-        self.total_tarjeta_debito = ventas.filter(metodo_pago='tarjeta_debito').aggregate(Sum('total'))['total__sum'] or 0
-        self.total_tarjeta_credito = ventas.filter(metodo_pago='tarjeta_credito').aggregate(Sum('total'))['total__sum'] or 0
-        self.total_transferencia = ventas.filter(metodo_pago='transferencia').aggregate(Sum('total'))['total__sum'] or 0
-        self.total_mercado_pago = ventas.filter(metodo_pago='mercado_pago').aggregate(Sum('total'))['total__sum'] or 0
+        # Una sola consulta para todos los totales (neto de devoluciones)
+        neto = F('total') - F('total_devuelto')
+        totales = ventas.aggregate(
+            cantidad_ventas=Count('id', filter=Q(anulada=False)),
+            total_ventas=Sum(neto),
+            **{campo: Sum(neto, filter=Q(metodo_pago=metodo)) for metodo, campo in CAMPOS_TOTAL_METODO.items()}
+        )
+        for campo, valor in totales.items():
+            setattr(self, campo, valor or 0)
         
-        # Calcular diferencia
+        self.calcular_diferencia()
+    
+    def calcular_diferencia(self):
         dinero_esperado = self.dinero_inicial + self.total_efectivo
         self.diferencia = self.dinero_final - dinero_esperado
+    
+    def cargar_resumen(self, resumen):
+        """Copia los totales del resumen incremental del día (vista previa, sin guardar)"""
+        for campo in ResumenDiario.CAMPOS_TOTALES:
+            setattr(self, campo, getattr(resumen, campo))
+        self.calcular_diferencia()
+    
+    def conciliar_resumen(self):
+        """
+        Compara los totales recalculados (calcular_totales) contra el resumen
+        incremental del día y corrige el resumen si no coinciden.
+        Devuelve la lista de campos que diferían.
+        """
+        resumen = ResumenDiario.del_dia(self.sucursal_id, self.usuario, self.fecha)
+        diferencias = [
+            campo for campo in ResumenDiario.CAMPOS_TOTALES
+            if getattr(resumen, campo) != getattr(self, campo)
+        ]
+        if diferencias:
+            ResumenDiario.objects.update_or_create(
+                sucursal_id=self.sucursal_id,
+                fecha=self.fecha,
+                usuario=self.usuario,
+                defaults={campo: getattr(self, campo) for campo in ResumenDiario.CAMPOS_TOTALES}
+            )
+        return diferencias
+
+
+# Campo de CierreCaja/ResumenDiario que acumula cada método de pago
+CAMPOS_TOTAL_METODO = {metodo: f'total_{metodo}' for metodo, _ in Venta.METODO_PAGO_CHOICES}
+
+
+class ResumenDiario(models.Model):
+    """
+    Totales del día por sucursal y usuario, actualizados en cada venta.
+    Permite mostrar la vista previa del cierre de caja sin re-agregar las ventas.
+    """
+    CAMPOS_TOTALES = ['cantidad_ventas', 'total_ventas', *CAMPOS_TOTAL_METODO.values()]
+    
+    fecha = models.DateField()
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.PROTECT, related_name='resumenes_diarios')
+    usuario = models.ForeignKey(User, on_delete=models.PROTECT, related_name='resumenes_diarios')
+    
+    total_efectivo = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_tarjeta_debito = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_tarjeta_credito = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_transferencia = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total_mercado_pago = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    
+    total_ventas = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    cantidad_ventas = models.IntegerField(default=0)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Resumen Diario'
+        verbose_name_plural = 'Resúmenes Diarios'
+        ordering = ['-fecha']
+        unique_together = ['sucursal', 'fecha', 'usuario']
+    
+    def __str__(self):
+        return f"Resumen {self.fecha} - {self.sucursal} - {self.usuario} - ${self.total_ventas}"
+    
+    @classmethod
+    def del_dia(cls, sucursal_id, usuario, fecha):
+        """Resumen del día, o uno en cero (sin guardar) si todavía no hubo ventas"""
+        resumen = cls.objects.filter(sucursal_id=sucursal_id, fecha=fecha, usuario=usuario).first()
+        return resumen or cls(sucursal_id=sucursal_id, fecha=fecha, usuario=usuario)
+    
+    @classmethod
+    def acumular(cls, sucursal_id, fecha, usuario_id, metodo_pago, total, cantidad=1):
+        """
+        Suma una venta (o resta, con valores negativos) al resumen del día.
+        Se hace con UPDATE ... SET campo = campo + x para no pisar ventas concurrentes.
+        """
+        campo_metodo = CAMPOS_TOTAL_METODO[metodo_pago]
+        incrementos = {
+            'cantidad_ventas': F('cantidad_ventas') + cantidad,
+            'total_ventas': F('total_ventas') + total,
+            campo_metodo: F(campo_metodo) + total,
+            'fecha_actualizacion': timezone.now(),
+        }
+        resumen = cls.objects.filter(sucursal_id=sucursal_id, fecha=fecha, usuario_id=usuario_id)
+        if resumen.update(**incrementos):
+            return
+        
+        try:
+            # Savepoint: si otra venta creó el resumen al mismo tiempo, se actualiza
+            with transaction.atomic():
+                cls.objects.create(
+                    sucursal_id=sucursal_id,
+                    fecha=fecha,
+                    usuario_id=usuario_id,
+                    cantidad_ventas=cantidad,
+                    total_ventas=total,
+                    **{campo_metodo: total}
+                )
+        except IntegrityError:
+            resumen.update(**incrementos)
+    
+    @classmethod
+    def registrar_venta(cls, venta):
+        total = Decimal(str(venta.total))
+        cls.acumular(venta.sucursal_id, dia_comercial(venta.fecha), venta.usuario_id, venta.metodo_pago, total)
+
+
+class Promocion(models.Model):
+    """Promoción o recargo que se aplica automáticamente al cobrar"""
+    TIPO_CHOICES = [
+        ('nxm', 'Lleva N, paga M (ej: 2x1)'),
+        ('combo', 'N unidades a precio fijo'),
+        ('descuento', 'Descuento porcentual'),
+        ('recargo', 'Recargo porcentual por método de pago'),
+    ]
+    
+    nombre = models.CharField(max_length=100)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    
+    # Alcance: producto, categoría o (sin ninguno) todos los productos
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, null=True, blank=True, related_name='promociones')
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, null=True, blank=True, related_name='promociones')
+    metodo_pago = models.CharField(max_length=20, choices=Venta.METODO_PAGO_CHOICES, blank=True, help_text="Solo con este método de pago (obligatorio para recargos)")
+    
+    cantidad = models.PositiveIntegerField(null=True, blank=True, help_text="N: unidades que lleva (nxm y combo)")
+    cantidad_paga = models.PositiveIntegerField(null=True, blank=True, help_text="M: unidades que paga (nxm)")
+    precio = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Precio de las N unidades (combo)")
+    porcentaje = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True, help_text="Porcentaje de descuento o recargo")
+    
+    activa = models.BooleanField(default=True)
+    fecha_desde = models.DateTimeField(null=True, blank=True)
+    fecha_hasta = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Promoción'
+        verbose_name_plural = 'Promociones'
+        ordering = ['nombre']
+        indexes = [
+            models.Index(fields=['activa']),
+        ]
+    
+    def __str__(self):
+        return f"{self.nombre} ({self.get_tipo_display()})"
+    
+    def clean(self):
+        if self.producto_id and self.categoria_id:
+            raise ValidationError('Elegí un producto o una categoría, no ambos')
+        if self.tipo == 'nxm' and not (self.cantidad and self.cantidad_paga is not None and self.cantidad_paga < self.cantidad):
+            raise ValidationError('Para "lleva N, paga M" indicá N y M, con M menor que N')
+        if self.tipo == 'combo' and not (self.cantidad and self.precio is not None):
+            raise ValidationError('Para combos indicá la cantidad y el precio')
+        if self.tipo in ('descuento', 'recargo') and not self.porcentaje:
+            raise ValidationError('Indicá el porcentaje')
+        if self.tipo == 'descuento' and self.porcentaje > 100:
+            raise ValidationError({'porcentaje': 'El descuento no puede superar el 100%'})
+        if self.tipo == 'recargo' and not self.metodo_pago:
+            raise ValidationError({'metodo_pago': 'Los recargos deben indicar el método de pago'})
+    
+    def vigente(self, momento):
+        return (
+            (self.fecha_desde is None or self.fecha_desde <= momento) and
+            (self.fecha_hasta is None or momento < self.fecha_hasta)
+        )
+
+
+class Devolucion(models.Model):
+    """Devolución parcial o anulación completa de una venta"""
+    venta = models.ForeignKey(Venta, on_delete=models.CASCADE, related_name='devoluciones')
+    usuario = models.ForeignKey(User, on_delete=models.PROTECT, related_name='devoluciones')
+    fecha = models.DateTimeField(auto_now_add=True)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Monto reintegrado")
+    es_anulacion = models.BooleanField(default=False)
+    motivo = models.TextField(blank=True)
+    
+    class Meta:
+        verbose_name = 'Devolución'
+        verbose_name_plural = 'Devoluciones'
+        ordering = ['-fecha']
+    
+    def __str__(self):
+        tipo = 'Anulación' if self.es_anulacion else 'Devolución'
+        return f"{tipo} de venta #{self.venta_id} - ${self.total}"
+
+
+class DetalleDevolucion(models.Model):
+    """Unidades devueltas de un detalle de venta"""
+    devolucion = models.ForeignKey(Devolucion, on_delete=models.CASCADE, related_name='detalles')
+    detalle_venta = models.ForeignKey(DetalleVenta, on_delete=models.CASCADE, related_name='devoluciones')
+    cantidad = models.IntegerField()
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    class Meta:
+        verbose_name = 'Detalle de Devolución'
+        verbose_name_plural = 'Detalles de Devolución'
+        ordering = ['devolucion', 'id']
+    
+    def __str__(self):
+        return f"{self.devolucion} - detalle #{self.detalle_venta_id} x{self.cantidad}"
+
+
+class ListaPrecios(models.Model):
+    """Actualización masiva de precios, programable a futuro"""
+    TIPO_CHOICES = [
+        ('porcentaje', 'Porcentaje'),
+        ('absoluto', 'Monto fijo'),
+    ]
+    
+    nombre = models.CharField(max_length=100, help_text="Ej: Aumento bebidas marzo")
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, default='porcentaje')
+    valor = models.DecimalField(max_digits=10, decimal_places=2, help_text="Porcentaje (ej: 12.5) o monto a sumar. Negativo para bajar precios")
+    
+    # Filtros: sin filtros se aplica a todos los productos
+    categoria = models.ForeignKey(Categoria, on_delete=models.PROTECT, null=True, blank=True, help_text="Solo productos de esta categoría")
+    filtro_nombre = models.CharField(max_length=100, blank=True, help_text="Solo productos cuyo nombre contenga este texto")
+    solo_activos = models.BooleanField(default=True, help_text="Ignorar productos inactivos")
+    
+    fecha_vigencia = models.DateTimeField(default=timezone.now, help_text="Desde cuándo rigen los nuevos precios")
+    fecha_aplicacion = models.DateTimeField(null=True, blank=True, editable=False, help_text="Cuándo se aplicó efectivamente")
+    productos_actualizados = models.IntegerField(default=0, editable=False)
+    usuario = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True, related_name='listas_precios')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Lista de Precios'
+        verbose_name_plural = 'Listas de Precios'
+        ordering = ['-fecha_vigencia']
+        indexes = [
+            models.Index(fields=['fecha_aplicacion', 'fecha_vigencia']),
+        ]
+    
+    def __str__(self):
+        signo = '%' if self.tipo == 'porcentaje' else '$'
+        return f"{self.nombre} ({self.valor}{signo}) - {self.fecha_vigencia.strftime('%d/%m/%Y %H:%M')}"
+    
+    @property
+    def aplicada(self):
+        return self.fecha_aplicacion is not None
+    
+    def productos(self):
+        """Productos alcanzados por la lista"""
+        productos = Producto.objects.all()
+        if self.solo_activos:
+            productos = productos.filter(activo=True)
+        if self.categoria_id:
+            productos = productos.filter(categoria_id=self.categoria_id)
+        if self.filtro_nombre:
+            productos = productos.filter(nombre__icontains=self.filtro_nombre)
+        return productos
+    
+    def expresion_precio(self):
+        """Nuevo precio como expresión SQL (redondeado a centavos, nunca negativo)"""
+        decimal = models.DecimalField(max_digits=10, decimal_places=2)
+        if self.tipo == 'porcentaje':
+            factor = 1 + Decimal(self.valor) / 100
+            nuevo = F('precio') * Value(factor, output_field=models.DecimalField(max_digits=12, decimal_places=6))
+        else:
+            nuevo = F('precio') + Value(Decimal(self.valor), output_field=decimal)
+        return Greatest(
+            Round(nuevo, 2, output_field=decimal),
+            Value(Decimal('0'), output_field=decimal),
+            output_field=decimal,
+        )
+    
+    def aplicar(self, usuario=None):
+        """
+        Aplica la lista con un único UPDATE sobre los productos alcanzados
+        y registra el historial. Devuelve la cantidad de productos modificados.
+        """
+        with transaction.atomic():
+            # Bloquear la lista para que dos procesos no la apliquen dos veces
+            lista = ListaPrecios.objects.select_for_update().get(pk=self.pk)
+            if lista.aplicada:
+                return 0
+            
+            nuevo_precio = self.expresion_precio()
+            cambios = list(
+                self.productos()
+                .select_for_update()
+                .annotate(precio_nuevo=nuevo_precio)
+                .exclude(precio=F('precio_nuevo'))
+                .values_list('id', 'precio', 'precio_nuevo')
+            )
+            ids = [producto_id for producto_id, _, _ in cambios]
+            
+            if ids:
+                Producto.objects.filter(id__in=ids).update(
+                    precio=nuevo_precio,
+                    fecha_actualizacion=timezone.now(),
+                )
+                HistorialPrecio.objects.bulk_create([
+                    HistorialPrecio.cambio(producto_id, anterior, nuevo, usuario or lista.usuario, lista=lista)
+                    for producto_id, anterior, nuevo in cambios
+                ], batch_size=1000)
+            
+            if ids:
+                # El UPDATE en bloque no dispara señales
+                transaction.on_commit(invalidar_catalogo)
+            
+            lista.fecha_aplicacion = timezone.now()
+            lista.productos_actualizados = len(ids)
+            lista.save(update_fields=['fecha_aplicacion', 'productos_actualizados'])
+        
+        self.fecha_aplicacion = lista.fecha_aplicacion
+        self.productos_actualizados = lista.productos_actualizados
+        return len(ids)
+    
+    @classmethod
+    def aplicar_pendientes(cls, ahora=None):
+        """Aplica, en orden, las listas cuya fecha de vigencia ya llegó"""
+        ahora = ahora or timezone.now()
+        pendientes = cls.objects.filter(
+            fecha_aplicacion__isnull=True,
+            fecha_vigencia__lte=ahora
+        ).order_by('fecha_vigencia', 'id')
+        return {lista: lista.aplicar() for lista in pendientes}
+
+
+class HistorialPrecio(models.Model):
+    """Registro de cada cambio de precio de un producto"""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='historial_precios')
+    precio_anterior = models.DecimalField(max_digits=10, decimal_places=2)
+    precio_nuevo = models.DecimalField(max_digits=10, decimal_places=2)
+    lista = models.ForeignKey(ListaPrecios, on_delete=models.SET_NULL, null=True, blank=True, related_name='cambios')
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    fecha = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Historial de Precio'
+        verbose_name_plural = 'Historial de Precios'
+        ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['producto', '-fecha']),
+        ]
+    
+    def __str__(self):
+        return f"{self.producto.nombre}: ${self.precio_anterior} → ${self.precio_nuevo}"
+    
+    @classmethod
+    def cambio(cls, producto_id, anterior, nuevo, usuario=None, lista=None):
+        """
+        Fila del historial (sin guardar) para un cambio de precio; None si el precio
+        no cambió. La usan las listas de precios, el admin y la carga por CSV.
+        """
+        if anterior is None or Decimal(anterior) == Decimal(nuevo):
+            return None
+        return cls(producto_id=producto_id, precio_anterior=anterior, precio_nuevo=nuevo, usuario=usuario, lista=lista)
+
+
+class Inventario(models.Model):
+    """
+    Recuento físico del stock de una sucursal. Los escáneres mandan lotes de
+    códigos mientras se sigue vendiendo; al cerrar, la diferencia de cada
+    producto contado se aplica sobre su stock actual.
+    """
+    ESTADO_CHOICES = [
+        ('abierto', 'Abierto'),
+        ('cerrado', 'Cerrado'),
+        ('cancelado', 'Cancelado'),
+    ]
+    TAMAÑO_LOTE = 500  # Productos por consulta al registrar conteos
+    
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.PROTECT, related_name='inventarios')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='abierto')
+    descripcion = models.CharField(max_length=200, blank=True, help_text="Ej: Inventario anual, góndola de bebidas")
+    no_contados_en_cero = models.BooleanField(default=False, help_text="Al cerrar, los productos con stock que no se contaron quedan en 0")
+    usuario = models.ForeignKey(User, on_delete=models.PROTECT, related_name='inventarios')
+    fecha_apertura = models.DateTimeField(auto_now_add=True)
+    fecha_cierre = models.DateTimeField(null=True, blank=True)
+    usuario_cierre = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    productos_ajustados = models.IntegerField(default=0, editable=False)
+    
+    class Meta:
+        verbose_name = 'Inventario'
+        verbose_name_plural = 'Inventarios'
+        ordering = ['-fecha_apertura']
+        indexes = [
+            models.Index(fields=['sucursal', 'estado']),
+        ]
+    
+    def __str__(self):
+        return f"Inventario #{self.pk} {self.sucursal} ({self.get_estado_display()})"
+    
+    def _bloquear_abierto(self):
+        """Bloquea el inventario; falla si ya no está abierto"""
+        inventario = Inventario.objects.select_for_update().get(pk=self.pk)
+        if inventario.estado != 'abierto':
+            raise ValidationError(f'El inventario está {inventario.get_estado_display().lower()}')
+        return inventario
+    
+    def registrar_conteos(self, cantidades):
+        """
+        Suma unidades contadas. `cantidades` es un dict {codigo_barras: cantidad}
+        (ya agrupado en memoria; negativas para corregir escaneos de más).
+        Se procesa en lotes de TAMAÑO_LOTE con un INSERT y un UPDATE por lote.
+        La foto del stock de cada producto se toma la primera vez que se cuenta,
+        así las ventas posteriores no se descuentan dos veces al cerrar.
+        Devuelve (unidades registradas, códigos desconocidos).
+        """
+        codigos = [codigo for codigo, cantidad in cantidades.items() if cantidad]
+        unidades = 0
+        desconocidos = []
+        
+        with transaction.atomic():
+            self._bloquear_abierto()
+            for inicio in range(0, len(codigos), self.TAMAÑO_LOTE):
+                lote = codigos[inicio:inicio + self.TAMAÑO_LOTE]
+                ids = Producto.ids_por_codigo(lote)
+                desconocidos.extend(codigo for codigo in lote if codigo not in ids)
+                
+                por_producto = {}
+                for codigo, producto_id in ids.items():
+                    por_producto[producto_id] = por_producto.get(producto_id, 0) + cantidades[codigo]
+                if not por_producto:
+                    continue
+                
+                stock = dict(
+                    Existencia.objects
+                    .filter(sucursal_id=self.sucursal_id, producto_id__in=por_producto)
+                    .values_list('producto_id', 'stock')
+                )
+                ConteoInventario.objects.bulk_create([
+                    ConteoInventario(inventario_id=self.pk, producto_id=producto_id, stock_inicial=stock.get(producto_id, 0))
+                    for producto_id in por_producto
+                ], ignore_conflicts=True)
+                
+                suma = models.Case(
+                    *[models.When(producto_id=producto_id, then=Value(cantidad)) for producto_id, cantidad in por_producto.items()],
+                    default=Value(0),
+                    output_field=models.IntegerField(),
+                )
+                ConteoInventario.objects.filter(
+                    inventario_id=self.pk,
+                    producto_id__in=por_producto
+                ).update(cantidad=F('cantidad') + suma, fecha_actualizacion=timezone.now())
+                unidades += sum(por_producto.values())
+        
+        return unidades, desconocidos
+    
+    def cerrar(self, usuario=None):
+        """
+        Aplica las diferencias en un único UPDATE: stock = stock + (contado - foto).
+        Lo vendido durante el recuento queda descontado. Devuelve la cantidad de
+        productos cuyo stock cambió.
+        """
+        with transaction.atomic():
+            inventario = self._bloquear_abierto()
+            conteos = ConteoInventario.objects.filter(inventario_id=self.pk)
+            
+            if inventario.no_contados_en_cero:
+                no_contados = (
+                    Existencia.objects
+                    .filter(sucursal_id=self.sucursal_id)
+                    .exclude(stock=0)
+                    .exclude(producto_id__in=conteos.values('producto_id'))
+                    .values_list('producto_id', 'stock')
+                )
+                ConteoInventario.objects.bulk_create([
+                    ConteoInventario(inventario_id=self.pk, producto_id=producto_id, stock_inicial=stock)
+                    for producto_id, stock in no_contados.iterator()
+                ], batch_size=1000)
+            
+            con_diferencia = conteos.exclude(cantidad=F('stock_inicial'))
+            
+            # Productos que la sucursal nunca tuvo: crear su fila en cero
+            sin_existencia = con_diferencia.exclude(producto__existencias__sucursal_id=self.sucursal_id)
+            Existencia.objects.bulk_create([
+                Existencia(sucursal_id=self.sucursal_id, producto_id=producto_id)
+                for producto_id in sin_existencia.values_list('producto_id', flat=True)
+            ], ignore_conflicts=True)
+            
+            diferencia = con_diferencia.filter(producto_id=models.OuterRef('producto_id')).annotate(
+                diferencia=F('cantidad') - F('stock_inicial')
+            ).values('diferencia')[:1]
+            ajustados = Existencia.objects.filter(
+                sucursal_id=self.sucursal_id,
+                producto_id__in=con_diferencia.values('producto_id')
+            ).update(stock=F('stock') + models.Subquery(diferencia))
+            
+            inventario.estado = 'cerrado'
+            inventario.fecha_cierre = timezone.now()
+            inventario.productos_ajustados = ajustados
+            inventario.usuario_cierre = usuario
+            inventario.save(update_fields=['estado', 'fecha_cierre', 'productos_ajustados', 'usuario_cierre'])
+        
+        self.estado = inventario.estado
+        self.fecha_cierre = inventario.fecha_cierre
+        self.usuario_cierre = usuario
+        self.productos_ajustados = ajustados
+        return ajustados
+    
+    def cancelar(self, usuario=None):
+        """Descarta el recuento sin tocar el stock"""
+        with transaction.atomic():
+            inventario = self._bloquear_abierto()
+            inventario.estado = self.estado = 'cancelado'
+            inventario.fecha_cierre = self.fecha_cierre = timezone.now()
+            inventario.usuario_cierre = self.usuario_cierre = usuario
+            inventario.save(update_fields=['estado', 'fecha_cierre', 'usuario_cierre'])
+
+
+class ConteoInventario(models.Model):
+    """Unidades contadas de un producto en un inventario"""
+    inventario = models.ForeignKey(Inventario, on_delete=models.CASCADE, related_name='conteos')
+    producto = models.ForeignKey(Producto, on_delete=models.PROTECT, related_name='+')
+    cantidad = models.IntegerField(default=0)
+    stock_inicial = models.IntegerField(help_text="Stock de la sucursal al contar el producto por primera vez")
+    fecha_actualizacion = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Conteo de Inventario'
+        verbose_name_plural = 'Conteos de Inventario'
+        ordering = ['inventario', 'producto']
+        unique_together = ['inventario', 'producto']
+    
+    def __str__(self):
+        return f"{self.producto.nombre}: {self.cantidad} (sistema: {self.stock_inicial})"
+    
+    @property
+    def diferencia(self):
+        return self.cantidad - self.stock_inicial
+
+
+class OrdenCompra(models.Model):
+    """
+    Mercadería recibida de un proveedor en una sucursal. Las líneas se cargan
+    escaneando o subiendo un CSV mientras se sigue vendiendo; al recibirla, todo
+    se suma al stock en una transacción con `stock = stock + cantidad` en la
+    base, sin pisar las ventas que entren mientras tanto.
+    """
+    ESTADO_CHOICES = [
+        ('abierta', 'Abierta'),
+        ('recibida', 'Recibida'),
+        ('cancelada', 'Cancelada'),
+    ]
+    TAMAÑO_LOTE = 500  # Productos por consulta al agregar líneas
+    
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.PROTECT, related_name='ordenes_compra')
+    proveedor = models.CharField(max_length=200)
+    remito = models.CharField(max_length=50, blank=True, help_text="Número de remito o factura del proveedor")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='abierta')
+    actualizar_costos = models.BooleanField(default=True, help_text="Al recibir, el costo de cada línea pasa a ser el costo del producto")
+    usuario = models.ForeignKey(User, on_delete=models.PROTECT, related_name='ordenes_compra')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_recepcion = models.DateTimeField(null=True, blank=True)
+    usuario_recepcion = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    productos_recibidos = models.IntegerField(default=0, editable=False)
+    unidades_recibidas = models.IntegerField(default=0, editable=False)
+    
+    class Meta:
+        verbose_name = 'Orden de Compra'
+        verbose_name_plural = 'Órdenes de Compra'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['sucursal', 'estado']),
+        ]
+    
+    def __str__(self):
+        return f"Compra #{self.pk} {self.proveedor} ({self.get_estado_display()})"
+    
+    def _bloquear_abierta(self):
+        """Bloquea la orden; falla si ya no está abierta"""
+        orden = OrdenCompra.objects.select_for_update().get(pk=self.pk)
+        if orden.estado != 'abierta':
+            raise ValidationError(f'La orden de compra está {orden.get_estado_display().lower()}')
+        return orden
+    
+    def agregar_lineas(self, cantidades, costos=None):
+        """
+        Suma unidades a las líneas. `cantidades` es un dict {codigo_barras: cantidad}
+        (negativas para corregir escaneos de más) y `costos` un dict opcional
+        {codigo_barras: costo unitario}. Se procesa en lotes de TAMAÑO_LOTE con un
+        INSERT y un UPDATE por lote. Devuelve (unidades agregadas, códigos desconocidos).
+        """
+        costos = costos or {}
+        codigos = [codigo for codigo in cantidades if cantidades[codigo] or codigo in costos]
+        unidades = 0
+        desconocidos = []
+        
+        with transaction.atomic():
+            self._bloquear_abierta()
+            for inicio in range(0, len(codigos), self.TAMAÑO_LOTE):
+                lote = codigos[inicio:inicio + self.TAMAÑO_LOTE]
+                ids = Producto.ids_por_codigo(lote)
+                desconocidos.extend(codigo for codigo in lote if codigo not in ids)
+                
+                por_producto, costo_por_producto = {}, {}
+                for codigo, producto_id in ids.items():
+                    por_producto[producto_id] = por_producto.get(producto_id, 0) + cantidades.get(codigo, 0)
+                    if codigo in costos:
+                        costo_por_producto[producto_id] = costos[codigo]
+                if not por_producto:
+                    continue
+                
+                LineaOrdenCompra.objects.bulk_create([
+                    LineaOrdenCompra(orden_id=self.pk, producto_id=producto_id)
+                    for producto_id in por_producto
+                ], ignore_conflicts=True)
+                
+                cambios = {'cantidad': F('cantidad') + models.Case(
+                    *[models.When(producto_id=producto_id, then=Value(cantidad)) for producto_id, cantidad in por_producto.items()],
+                    default=Value(0),
+                    output_field=models.IntegerField(),
+                )}
+                if costo_por_producto:
+                    cambios['costo_unitario'] = models.Case(
+                        *[models.When(producto_id=producto_id, then=Value(costo)) for producto_id, costo in costo_por_producto.items()],
+                        default=F('costo_unitario'),
+                        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+                    )
+                LineaOrdenCompra.objects.filter(orden_id=self.pk, producto_id__in=por_producto).update(**cambios)
+                unidades += sum(por_producto.values())
+        
+        return unidades, desconocidos
+    
+    def recibir(self, usuario=None):
+        """
+        Suma al stock de la sucursal las líneas con cantidad positiva, con una
+        cantidad fija de consultas sin importar cuántas líneas tenga, y copia los
+        costos a los productos si corresponde. Devuelve la cantidad de productos
+        cuyo stock cambió.
+        """
+        with transaction.atomic():
+            orden = self._bloquear_abierta()
+            lineas = LineaOrdenCompra.objects.filter(orden_id=self.pk, cantidad__gt=0)
+            
+            # Productos que la sucursal nunca tuvo: crear su fila en cero
+            sin_existencia = lineas.exclude(producto__existencias__sucursal_id=self.sucursal_id)
+            Existencia.objects.bulk_create([
+                Existencia(sucursal_id=self.sucursal_id, producto_id=producto_id)
+                for producto_id in sin_existencia.values_list('producto_id', flat=True)
+            ], ignore_conflicts=True)
+            
+            # Bloquear en el mismo orden que el cobro (por producto) para no trabarse con una venta
+            existencias = Existencia.objects.filter(sucursal_id=self.sucursal_id, producto_id__in=lineas.values('producto_id'))
+            list(existencias.select_for_update().order_by('producto_id').values_list('id', flat=True))
+            
+            cantidad = lineas.filter(producto_id=models.OuterRef('producto_id')).values('cantidad')[:1]
+            recibidos = existencias.update(stock=F('stock') + models.Subquery(cantidad))
+            
+            if orden.actualizar_costos:
+                con_costo = lineas.filter(costo_unitario__isnull=False)
+                costo = con_costo.filter(producto_id=models.OuterRef('pk')).values('costo_unitario')[:1]
+                Producto.objects.filter(id__in=con_costo.values('producto_id')).update(costo=models.Subquery(costo))
+            
+            totales = lineas.aggregate(unidades=models.Sum('cantidad'))
+            orden.estado = 'recibida'
+            orden.fecha_recepcion = timezone.now()
+            orden.usuario_recepcion = usuario
+            orden.productos_recibidos = recibidos
+            orden.unidades_recibidas = totales['unidades'] or 0
+            orden.save(update_fields=['estado', 'fecha_recepcion', 'usuario_recepcion', 'productos_recibidos', 'unidades_recibidas'])
+        
+        self.estado = orden.estado
+        self.fecha_recepcion = orden.fecha_recepcion
+        self.usuario_recepcion = usuario
+        self.productos_recibidos = orden.productos_recibidos
+        self.unidades_recibidas = orden.unidades_recibidas
+        return recibidos
+    
+    def cancelar(self, usuario=None):
+        """Descarta la orden sin tocar el stock"""
+        with transaction.atomic():
+            orden = self._bloquear_abierta()
+            orden.estado = self.estado = 'cancelada'
+            orden.fecha_recepcion = self.fecha_recepcion = timezone.now()
+            orden.usuario_recepcion = self.usuario_recepcion = usuario
+            orden.save(update_fields=['estado', 'fecha_recepcion', 'usuario_recepcion'])
+
+
+class LineaOrdenCompra(models.Model):
+    """Unidades recibidas de un producto en una orden de compra"""
+    orden = models.ForeignKey(OrdenCompra, on_delete=models.CASCADE, related_name='lineas')
+    producto = models.ForeignKey(Producto, on_delete=models.PROTECT, related_name='+')
+    cantidad = models.IntegerField(default=0)
+    costo_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Línea de Orden de Compra'
+        verbose_name_plural = 'Líneas de Orden de Compra'
+        ordering = ['orden', 'producto']
+        unique_together = ['orden', 'producto']
+    
+    def __str__(self):
+        return f"{self.producto.nombre}: {self.cantidad}"
+
+
+class EventoSalida(models.Model):
+    """
+    Evento para sistemas externos (contabilidad, facturación), guardado en la
+    misma transacción que lo origina (outbox): si la venta se confirma, el evento
+    también. Lo entrega `manage.py despachar_eventos` (ver stoke/eventos.py).
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('entregado', 'Entregado'),
+        ('fallido', 'Fallido'),
+    ]
+    
+    tipo = models.CharField(max_length=50)
+    clave = models.CharField(max_length=50, help_text="Id del objeto del evento (la venta, la devolución)")
+    datos = models.JSONField(encoder=DjangoJSONEncoder)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(default=timezone.now)
+    fecha_entrega = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Evento de Salida'
+        verbose_name_plural = 'Eventos de Salida'
+        ordering = ['id']
+        indexes = [
+            # La cola del despachador y la compactación solo recorren su parte de la tabla
+            models.Index(fields=['proximo_intento'], condition=models.Q(estado='pendiente'), name='stoke_evento_pendiente_idx'),
+            models.Index(fields=['fecha_entrega'], condition=models.Q(estado='entregado'), name='stoke_evento_entregado_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo} {self.clave} ({self.get_estado_display()})"
@@ -0,0 +1,230 @@
+"""
+Perfilado estadístico de requests (opt-in, ver PerfiladoMiddleware).
+
+Un hilo por proceso toma cada STOKE_PERFILADO_INTERVALO_MS la pila de los hilos
+que están atendiendo una request perfilada (sys._current_frames), así que el
+costo no depende de cuántas funciones se llamen. Cada captura se guarda en
+STOKE_PERFILADO_DIR como:
+
+- <id>.folded: pilas en formato "colapsado" (raíz;...;hoja cantidad), para
+  flamegraph.pl, speedscope o inferno.
+- <id>.json: ruta, duración, consultas SQL con su tiempo y cuántas muestras
+  cayeron en SQL, plantillas o Python.
+
+El comando `perfiles` lista y resume las capturas más lentas.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections
+
+MAXIMO_SQL = 2000  # Caracteres que se guardan de cada consulta
+
+# Categoría de una muestra según el primer módulo conocido desde la hoja
+CATEGORIAS = [
+    ('sql', ('django/db/backends/', 'psycopg', 'sqlite3')),
+    ('plantillas', ('django/template/', 'django/templatetags/')),
+]
+
+
+class Muestreador:
+    """Hilo que acumula las pilas de los hilos registrados"""
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self.hilos = {}  # id de hilo -> Counter de pilas
+        self.lock = threading.Lock()
+        self.activo = threading.Event()
+        self.etiquetas = {}  # código -> "funcion (archivo:linea)"
+        self._hilo = None
+        self._pid = None
+
+    def iniciar(self):
+        """Arranca el hilo (también después de un fork, donde el hilo no sobrevive)"""
+        if self._hilo is not None and self._hilo.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._hilo = threading.Thread(target=self._correr, name='stoke-perfilado', daemon=True)
+        self._hilo.start()
+
+    def registrar(self, hilo_id):
+        with self.lock:
+            self.hilos[hilo_id] = Counter()
+            self.activo.set()
+
+    def terminar(self, hilo_id):
+        with self.lock:
+            pilas = self.hilos.pop(hilo_id, Counter())
+            if not self.hilos:
+                self.activo.clear()
+        return pilas
+
+    def _correr(self):
+        propio = threading.get_ident()
+        while True:
+            self.activo.wait()
+            time.sleep(self.intervalo)
+            frames = sys._current_frames()
+            with self.lock:
+                for hilo_id, pilas in self.hilos.items():
+                    frame = frames.get(hilo_id)
+                    if frame is not None and hilo_id != propio:
+                        pilas[self.pila(frame)] += 1
+
+    def pila(self, frame):
+        """Pila desde la raíz hasta la hoja, como tupla de etiquetas"""
+        pila = []
+        while frame is not None:
+            codigo = frame.f_code
+            etiqueta = self.etiquetas.get(codigo)
+            if etiqueta is None:
+                etiqueta = self.etiquetas[codigo] = f'{codigo.co_name} ({nombre_archivo(codigo.co_filename)}:{codigo.co_firstlineno})'
+            pila.append(etiqueta)
+            frame = frame.f_back
+        pila.reverse()
+        return tuple(pila)
+
+
+def nombre_archivo(ruta):
+    """Ruta corta: relativa al proyecto o desde site-packages"""
+    base = str(settings.BASE_DIR)
+    if ruta.startswith(base):
+        return os.path.relpath(ruta, base)
+    indice = ruta.find('site-packages' + os.sep)
+    if indice != -1:
+        return ruta[indice + len('site-packages') + 1:]
+    return os.path.basename(ruta)
+
+
+_muestreador = None
+
+
+def obtener_muestreador():
+    global _muestreador
+    if _muestreador is None:
+        _muestreador = Muestreador(settings.STOKE_PERFILADO_INTERVALO_MS / 1000)
+    _muestreador.iniciar()
+    return _muestreador
+
+
+def categoria(pila):
+    for etiqueta in reversed(pila):
+        for nombre, modulos in CATEGORIAS:
+            if any(modulo in etiqueta for modulo in modulos):
+                return nombre
+    return 'python'
+
+
+class Captura:
+    """Muestras de pila y log SQL de la request que atiende el hilo actual"""
+
+    def __init__(self, muestreador):
+        self.muestreador = muestreador
+        self.hilo_id = threading.get_ident()
+        self.consultas = []
+        self.pilas = Counter()
+        self.duracion_ms = 0
+        self._pila_contextos = ExitStack()
+
+    def registrar_sql(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append({
+                'alias': context['connection'].alias,
+                'sql': sql[:MAXIMO_SQL],
+                'ms': round((time.perf_counter() - inicio) * 1000, 3),
+                'many': many,
+            })
+
+    def __enter__(self):
+        for conexion in connections.all():
+            self._pila_contextos.enter_context(conexion.execute_wrapper(self.registrar_sql))
+        self.muestreador.registrar(self.hilo_id)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duracion_ms = (time.perf_counter() - self._inicio) * 1000
+        self.pilas = self.muestreador.terminar(self.hilo_id)
+        self._pila_contextos.close()
+        return False
+
+    def guardar(self, request, response, directorio=None):
+        """Escribe <id>.folded y <id>.json; devuelve el id de la captura"""
+        directorio = directorio or settings.STOKE_PERFILADO_DIR
+        os.makedirs(directorio, exist_ok=True)
+        ahora = datetime.now()
+        captura_id = f'{ahora:%Y%m%d-%H%M%S-%f}-{os.getpid()}'
+
+        categorias = Counter()
+        for pila, cantidad in self.pilas.items():
+            categorias[categoria(pila)] += cantidad
+
+        with open(os.path.join(directorio, f'{captura_id}.folded'), 'w') as archivo:
+            for pila, cantidad in self.pilas.most_common():
+                archivo.write(f"{';'.join(pila)} {cantidad}\n")
+
+        datos = {
+            'id': captura_id,
+            'fecha': ahora.isoformat(timespec='seconds'),
+            'metodo': request.method,
+            'ruta': request.path,
+            'vista': getattr(getattr(request, 'resolver_match', None), 'view_name', None),
+            'estado': response.status_code,
+            'duracion_ms': round(self.duracion_ms, 3),
+            'intervalo_ms': self.muestreador.intervalo * 1000,
+            'muestras': sum(self.pilas.values()),
+            'categorias': dict(categorias),
+            'sql_cantidad': len(self.consultas),
+            'sql_ms': round(sum(consulta['ms'] for consulta in self.consultas), 3),
+            'sql': self.consultas,
+        }
+        with open(os.path.join(directorio, f'{captura_id}.json'), 'w') as archivo:
+            json.dump(datos, archivo, ensure_ascii=False, indent=1)
+
+        podar(directorio)
+        return captura_id
+
+
+def podar(directorio, maximo=None):
+    """Borra las capturas más viejas si hay más de STOKE_PERFILADO_MAXIMO"""
+    maximo = maximo or settings.STOKE_PERFILADO_MAXIMO
+    capturas = sorted(nombre[:-5] for nombre in os.listdir(directorio) if nombre.endswith('.json'))
+    for captura_id in capturas[:max(0, len(capturas) - maximo)]:
+        for extension in ('.json', '.folded'):
+            try:
+                os.remove(os.path.join(directorio, captura_id + extension))
+            except FileNotFoundError:
+                pass
+
+
+def leer_capturas(directorio=None):
+    """Metadatos de todas las capturas guardadas"""
+    directorio = directorio or settings.STOKE_PERFILADO_DIR
+    if not os.path.isdir(directorio):
+        return []
+    capturas = []
+    for nombre in os.listdir(directorio):
+        if nombre.endswith('.json'):
+            with open(os.path.join(directorio, nombre)) as archivo:
+                capturas.append(json.load(archivo))
+    return capturas
+
+
+def leer_pilas(captura_id, directorio=None):
+    directorio = directorio or settings.STOKE_PERFILADO_DIR
+    pilas = Counter()
+    with open(os.path.join(directorio, f'{captura_id}.folded')) as archivo:
+        for linea in archivo:
+            pila, _, cantidad = linea.rstrip('\n').rpartition(' ')
+            pilas[tuple(pila.split(';'))] += int(cantidad)
+    return pilas
@@ -0,0 +1,51 @@
+"""
+Grupos de usuarios y sus permisos.
+
+`configurar_grupos` es idempotente: crea los grupos que falten y les agrega los
+permisos que no tengan, con una consulta para todos los permisos y un INSERT por
+grupo. La usan el comando configurar_permisos y create_user; la migración 0012
+tiene su propia copia fija de los grupos de entonces.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+# Permisos de cada grupo, como 'app_label.codename'
+GRUPOS = {
+    'Vendedores': [
+        'stoke.add_venta',
+        'stoke.view_venta',
+        'stoke.view_producto',
+    ],
+}
+
+
+def configurar_grupos(Group, Permission):
+    """
+    Crea los grupos de GRUPOS y les asigna sus permisos.
+    Recibe los modelos para poder usarse desde una migración.
+    Devuelve {nombre_grupo: permisos agregados}.
+    """
+    nombres = {permiso for permisos in GRUPOS.values() for permiso in permisos}
+    filtro = reduce(or_, (
+        Q(content_type__app_label=app_label, codename=codename)
+        for app_label, codename in (nombre.split('.') for nombre in nombres)
+    ))
+    permisos = {
+        f'{app_label}.{codename}': pk
+        for pk, app_label, codename in Permission.objects.filter(filtro).values_list('pk', 'content_type__app_label', 'codename')
+    }
+    faltantes = nombres - set(permisos)
+    if faltantes:
+        raise LookupError(f'Permisos inexistentes: {", ".join(sorted(faltantes))}')
+    
+    agregados = {}
+    for nombre, permisos_grupo in GRUPOS.items():
+        grupo, _ = Group.objects.get_or_create(name=nombre)
+        actuales = set(grupo.permissions.values_list('pk', flat=True))
+        nuevos = {permisos[permiso] for permiso in permisos_grupo} - actuales
+        if nuevos:
+            grupo.permissions.add(*nuevos)
+        agregados[nombre] = len(nuevos)
+    return agregados
@@ -0,0 +1,106 @@
+"""
+Contadores de unidades vendidas por sucursal (Existencia.vendidas_*).
+
+Cada cobro suma sus unidades a los contadores de las filas de Existencia que ya
+bloquea para descontar el stock, así la grilla y la búsqueda ordenan por
+popularidad sin agregar DetalleVenta en cada request.
+
+La ventana de 30 días se corre una vez por día con `manage.py
+actualizar_popularidad`: recalcula la parte de los días cerrados desde las
+ventas (una sola consulta agrupada) y le suma lo vendido hoy, que se lee de la
+propia fila en el UPDATE para no pisar los cobros que entren mientras corre.
+
+Las unidades que cuentan son las vendidas menos las devueltas, sin las ventas
+anuladas. Los cobros no restan las devoluciones al momento: quedan descontadas
+cuando el recálculo pasa por el día de la venta (y del total, con --reconstruir).
+"""
+from datetime import timedelta
+
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .jornada import dia_comercial, rango_dia
+from .models import DetalleVenta, Existencia
+
+DIAS = 30
+LOTE = 1000
+
+
+def unidades(**filtro_venta):
+    """{(sucursal_id, producto_id): unidades vendidas y no devueltas} de las ventas no anuladas que cumplen el filtro"""
+    detalles = DetalleVenta.objects.filter(
+        venta__anulada=False, **{f'venta__{campo}': valor for campo, valor in filtro_venta.items()}
+    )
+    return {
+        (fila['venta__sucursal_id'], fila['producto_id']): fila['unidades']
+        for fila in detalles.values('venta__sucursal_id', 'producto_id').annotate(
+            unidades=Sum(F('cantidad') - F('cantidad_devuelta'))
+        ).order_by()
+    }
+
+
+def dias_anteriores(hoy):
+    """Unidades de los DIAS - 1 días comerciales cerrados que entran en la ventana de hoy"""
+    inicio, _ = rango_dia(hoy - timedelta(days=DIAS - 1))
+    fin, _ = rango_dia(hoy)
+    return unidades(fecha__gte=inicio, fecha__lt=fin)
+
+
+def actualizar(hoy=None):
+    """
+    Corre la ventana de 30 días a `hoy` y pone en cero los contadores del día de
+    las filas que no vendieron hoy. Solo escribe las filas que cambian.
+    Devuelve la cantidad de filas actualizadas.
+    """
+    hoy = hoy or dia_comercial()
+    anteriores = dias_anteriores(hoy)
+    # Lo vendido hoy se toma de la fila en el momento del UPDATE
+    de_hoy = Case(When(dia_vendidas=hoy, then=F('vendidas_hoy')), default=Value(0), output_field=IntegerField())
+
+    cambios = []
+    filas = Existencia.objects.order_by().values_list(
+        'id', 'sucursal_id', 'producto_id', 'vendidas_30_dias', 'vendidas_hoy', 'dia_vendidas'
+    )
+    for id, sucursal_id, producto_id, vendidas_30_dias, vendidas_hoy, dia_vendidas in filas.iterator(chunk_size=5000):
+        previas = anteriores.get((sucursal_id, producto_id), 0)
+        hoy_fila = vendidas_hoy if dia_vendidas == hoy else 0
+        if vendidas_30_dias == previas + hoy_fila and vendidas_hoy == hoy_fila:
+            continue
+        cambios.append(Existencia(id=id, vendidas_30_dias=Value(previas) + de_hoy, vendidas_hoy=de_hoy))
+
+    Existencia.objects.bulk_update(cambios, ['vendidas_30_dias', 'vendidas_hoy'], batch_size=LOTE)
+    return len(cambios)
+
+
+def reconstruir(hoy=None):
+    """
+    Recalcula los tres contadores desde todas las ventas (al instalar, o después
+    de importar ventas históricas). Pisa lo que sumen los cobros mientras corre:
+    conviene hacerlo con las cajas cerradas. Devuelve la cantidad de filas actualizadas.
+    """
+    hoy = hoy or dia_comercial()
+    totales = unidades()
+    anteriores = dias_anteriores(hoy)
+    inicio, fin = rango_dia(hoy)
+    de_hoy = unidades(fecha__gte=inicio, fecha__lt=fin)
+
+    cambios = []
+    for existencia in Existencia.objects.order_by().only(
+        'id', 'sucursal_id', 'producto_id', 'vendidas_hoy', 'dia_vendidas', 'vendidas_30_dias', 'vendidas_total'
+    ).iterator(chunk_size=5000):
+        clave = (existencia.sucursal_id, existencia.producto_id)
+        nuevos = {
+            'vendidas_hoy': de_hoy.get(clave, 0),
+            'dia_vendidas': hoy,
+            'vendidas_30_dias': anteriores.get(clave, 0) + de_hoy.get(clave, 0),
+            'vendidas_total': totales.get(clave, 0),
+        }
+        if all(getattr(existencia, campo) == valor for campo, valor in nuevos.items()):
+            continue
+        for campo, valor in nuevos.items():
+            setattr(existencia, campo, valor)
+        cambios.append(existencia)
+
+    Existencia.objects.bulk_update(
+        cambios, ['vendidas_hoy', 'dia_vendidas', 'vendidas_30_dias', 'vendidas_total'], batch_size=LOTE
+    )
+    return len(cambios)
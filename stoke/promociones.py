@@ -0,0 +1,184 @@
+"""
+Motor de promociones.
+
+Las promociones activas se compilan una vez en un índice en memoria
+(por producto, por categoría, generales y recargos por método de pago), así que
+cotizar una canasta cuesta O(líneas) sin consultas extra.
+
+El índice se invalida al guardar o borrar una Promocion (se cambia su versión en
+la caché de Django, compartida entre workers si se configura una caché común) y
+además se recompila cada STOKE_PROMOCIONES_TTL segundos como respaldo.
+"""
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Promocion
+
+CLAVE_VERSION = 'stoke:promociones:version'
+CENTAVO = Decimal('0.01')
+
+_indice = None
+
+
+class IndicePromociones:
+    """Promociones activas agrupadas por alcance"""
+
+    def __init__(self, promociones, version):
+        self.version = version
+        self.compilado = time.monotonic()
+        self.por_producto = defaultdict(list)
+        self.por_categoria = defaultdict(list)
+        self.generales = []
+        self.recargos = defaultdict(list)
+
+        for promocion in promociones:
+            if promocion.tipo == 'recargo':
+                self.recargos[promocion.metodo_pago].append(promocion)
+            elif promocion.producto_id:
+                self.por_producto[promocion.producto_id].append(promocion)
+            elif promocion.categoria_id:
+                self.por_categoria[promocion.categoria_id].append(promocion)
+            else:
+                self.generales.append(promocion)
+
+    def candidatas(self, producto_id, categoria_id):
+        yield from self.por_producto.get(producto_id, ())
+        if categoria_id:
+            yield from self.por_categoria.get(categoria_id, ())
+        yield from self.generales
+
+
+def invalidar():
+    """Marca el índice como desactualizado en todos los procesos que compartan la caché"""
+    global _indice
+    _indice = None
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, None)
+
+
+@receiver(post_save, sender=Promocion)
+@receiver(post_delete, sender=Promocion)
+def _promocion_modificada(sender, **kwargs):
+    invalidar()
+
+
+def obtener_indice():
+    """Índice vigente; se recompila si cambió la versión o venció el TTL"""
+    global _indice
+    version = cache.get(CLAVE_VERSION)
+    ttl = getattr(settings, 'STOKE_PROMOCIONES_TTL', 60)
+    if (
+        _indice is None or
+        _indice.version != version or
+        time.monotonic() - _indice.compilado > ttl
+    ):
+        _indice = IndicePromociones(Promocion.objects.filter(activa=True), version)
+    return _indice
+
+
+def descuento_linea(promocion, precio, cantidad):
+    """Descuento que da `promocion` a `cantidad` unidades de precio `precio`"""
+    if promocion.tipo == 'nxm':
+        grupos = cantidad // promocion.cantidad
+        return grupos * (promocion.cantidad - promocion.cantidad_paga) * precio
+    if promocion.tipo == 'combo':
+        grupos = cantidad // promocion.cantidad
+        return max(grupos * (promocion.cantidad * precio - promocion.precio), Decimal('0'))
+    if promocion.tipo == 'descuento':
+        return (precio * cantidad * promocion.porcentaje / 100).quantize(CENTAVO)
+    return Decimal('0')
+
+
+@dataclass
+class LineaCotizada:
+    producto_id: int
+    cantidad: int
+    precio_unitario: Decimal
+    descuento: Decimal = Decimal('0')
+    promocion: Promocion = None
+
+    @property
+    def subtotal(self):
+        return self.precio_unitario * self.cantidad - self.descuento
+
+
+@dataclass
+class Cotizacion:
+    lineas: list = field(default_factory=list)
+    monto_manual: Decimal = Decimal('0')
+    recargo: Decimal = Decimal('0')
+    recargo_promocion: Promocion = None
+
+    @property
+    def subtotal(self):
+        return sum((linea.subtotal for linea in self.lineas), Decimal('0')) + self.monto_manual
+
+    @property
+    def descuento(self):
+        return sum((linea.descuento for linea in self.lineas), Decimal('0'))
+
+    @property
+    def total(self):
+        return self.subtotal + self.recargo
+
+    def como_dict(self):
+        return {
+            'lineas': [{
+                'producto_id': linea.producto_id,
+                'cantidad': linea.cantidad,
+                'precio_unitario': linea.precio_unitario,
+                'descuento': linea.descuento,
+                'subtotal': linea.subtotal,
+                'promocion': linea.promocion.nombre if linea.promocion else None,
+            } for linea in self.lineas],
+            'monto_manual': self.monto_manual,
+            'descuento': self.descuento,
+            'recargo': self.recargo,
+            'recargo_promocion': self.recargo_promocion.nombre if self.recargo_promocion else None,
+            'total': self.total,
+        }
+
+
+def cotizar(productos, cantidades, metodo_pago, monto_manual=Decimal('0'), momento=None):
+    """
+    Precio final de una canasta.
+    `productos` es un dict {id: Producto} (con precio y categoria_id cargados) y
+    `cantidades` un dict {producto_id: cantidad}. Cada línea recibe la promoción
+    que más descuento le da; no se acumulan promociones sobre la misma línea.
+    """
+    indice = obtener_indice()
+    momento = momento or timezone.now()
+    cotizacion = Cotizacion(monto_manual=monto_manual)
+
+    for producto_id, cantidad in cantidades.items():
+        producto = productos[producto_id]
+        linea = LineaCotizada(producto_id, cantidad, producto.precio)
+        for promocion in indice.candidatas(producto_id, producto.categoria_id):
+            if promocion.metodo_pago and promocion.metodo_pago != metodo_pago:
+                continue
+            if not promocion.vigente(momento):
+                continue
+            descuento = min(descuento_linea(promocion, producto.precio, cantidad), producto.precio * cantidad)
+            if descuento > linea.descuento:
+                linea.descuento = descuento
+                linea.promocion = promocion
+        cotizacion.lineas.append(linea)
+
+    # Recargo por método de pago sobre el total ya descontado (se aplica el mayor)
+    for promocion in indice.recargos.get(metodo_pago, ()):
+        if not promocion.vigente(momento):
+            continue
+        recargo = (cotizacion.subtotal * promocion.porcentaje / 100).quantize(CENTAVO)
+        if recargo > cotizacion.recargo:
+            cotizacion.recargo = recargo
+            cotizacion.recargo_promocion = promocion
+
+    return cotizacion
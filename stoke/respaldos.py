@@ -0,0 +1,215 @@
+"""
+Respaldo lógico de los datos de stoke (ver `manage.py stoke_backup` y `stoke_restore`).
+
+Cada tabla se parte en archivos .gz de hasta N filas por rangos de clave
+primaria, así los archivos de una tabla grande se escriben en paralelo y ninguna
+tabla pasa entera por la memoria.
+
+- PostgreSQL: COPY ... TO STDOUT / FROM STDIN en CSV. Todos los hilos del
+  respaldo leen la misma foto de la base (pg_export_snapshot), como pg_dump -j.
+- Otros motores: filas como listas JSON (una por línea) leídas con un cursor,
+  todo dentro de una transacción en un solo hilo.
+
+El manifiesto (manifiesto.json) guarda el orden de las tablas, sus columnas, las
+filas y el sha256 de cada archivo (sin comprimir). La restauración lo usa para
+cargar padres antes que hijos y verificar cantidades y checksums.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+from django.apps import apps
+from django.contrib.auth.models import Group, Permission, User
+from django.db.migrations.recorder import MigrationRecorder
+
+MANIFIESTO = 'manifiesto.json'
+TAMAÑO_BLOQUE = 1 << 20
+
+
+def modelos():
+    """
+    Modelos a respaldar ordenados por dependencias (padres primero): los de
+    stoke, sus tablas intermedias y los usuarios con sus grupos y sus permisos
+    propios (las ventas y los cierres apuntan a ellos). Los permisos de los
+    grupos no se copian: los recrea `manage.py configurar_permisos`.
+    """
+    candidatos = [
+        Group, User, User.groups.through, User.user_permissions.through,
+        *apps.get_app_config('stoke').get_models(include_auto_created=True),
+    ]
+    incluidos = set(candidatos)
+    orden = []
+
+    def visitar(modelo):
+        if modelo in orden:
+            return
+        for campo in modelo._meta.concrete_fields:
+            relacionado = campo.related_model if campo.is_relation else None
+            if relacionado in incluidos and relacionado is not modelo:
+                visitar(relacionado)
+        orden.append(modelo)
+
+    for modelo in candidatos:
+        visitar(modelo)
+    return orden
+
+
+def nombres_permisos(ids=None):
+    """
+    {id: 'app.codigo'} de los permisos asignados a usuarios (o de los ids
+    pedidos). auth_permission no se respalda (la llena migrate), así que la
+    restauración verifica que los ids signifiquen lo mismo en la base de destino.
+    """
+    permisos = Permission.objects.filter(user__isnull=False) if ids is None else Permission.objects.filter(pk__in=ids)
+    return {
+        str(permiso_id): f'{app}.{codigo}'
+        for permiso_id, app, codigo in permisos.distinct().values_list('id', 'content_type__app_label', 'codename')
+    }
+
+
+def columnas(modelo):
+    return [campo.column for campo in modelo._meta.concrete_fields]
+
+
+def migraciones(conexion):
+    """Última migración aplicada de cada app respaldada"""
+    aplicadas = {}
+    for app, nombre in MigrationRecorder(conexion).applied_migrations():
+        if app in ('auth', 'stoke') and nombre > aplicadas.get(app, ''):
+            aplicadas[app] = nombre
+    return aplicadas
+
+
+def cortes(cursor, tabla, pk, filas_por_archivo):
+    """
+    Rangos (desde exclusivo, hasta inclusivo, filas) de clave primaria con
+    filas_por_archivo filas cada uno (el último, lo que quede).
+    """
+    cursor.execute(f'SELECT COUNT(*) FROM {tabla}')
+    total = cursor.fetchone()[0]
+    cursor.execute(
+        f'SELECT {pk} FROM (SELECT {pk}, ROW_NUMBER() OVER (ORDER BY {pk}) AS n FROM {tabla}) numeradas '
+        f'WHERE n %% %s = 0 ORDER BY {pk}',
+        [filas_por_archivo],
+    )
+    limites = [fila[0] for fila in cursor.fetchall()]
+
+    rangos, desde = [], None
+    for hasta in limites:
+        rangos.append((desde, hasta, filas_por_archivo))
+        desde = hasta
+    resto = total - filas_por_archivo * len(limites)
+    if resto:
+        rangos.append((desde, None, resto))
+    return rangos
+
+
+def filtro_rango(pk, desde, hasta):
+    """WHERE de un rango; los límites son enteros leídos de la propia base"""
+    condiciones = []
+    if desde is not None:
+        condiciones.append(f'{pk} > {int(desde)}')
+    if hasta is not None:
+        condiciones.append(f'{pk} <= {int(hasta)}')
+    return f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+
+
+class ArchivoConHash:
+    """Envuelve un archivo y calcula el sha256 de lo que se escribe o se lee"""
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.hash = hashlib.sha256()
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self.hash.update(datos)
+        return self.archivo.write(datos)
+
+    def read(self, tamaño=-1):
+        datos = self.archivo.read(tamaño)
+        self.hash.update(datos)
+        return datos
+
+    def readline(self, tamaño=-1):
+        datos = self.archivo.readline(tamaño)
+        self.hash.update(datos)
+        return datos
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+def volcar(conexion, tabla, lista_columnas, pk, desde, hasta, ruta, compresion):
+    """Escribe un rango de la tabla en `ruta` (.gz) y devuelve su sha256"""
+    ops = conexion.ops
+    consulta = (
+        f"SELECT {', '.join(ops.quote_name(c) for c in lista_columnas)} FROM {ops.quote_name(tabla)} "
+        f"{filtro_rango(ops.quote_name(pk), desde, hasta)} ORDER BY {ops.quote_name(pk)}"
+    )
+    with gzip.open(ruta, 'wb', compresslevel=compresion) as comprimido, conexion.cursor() as cursor:
+        archivo = ArchivoConHash(comprimido)
+        if conexion.vendor == 'postgresql':
+            copiar_hacia(cursor, f'COPY ({consulta}) TO STDOUT WITH (FORMAT csv)', archivo)
+        else:
+            cursor.execute(consulta)
+            while True:
+                filas = cursor.fetchmany(5000)
+                if not filas:
+                    break
+                archivo.write(''.join(json.dumps(list(fila), default=str) + '\n' for fila in filas).encode())
+    return archivo.hexdigest()
+
+
+def cargar(conexion, tabla, lista_columnas, ruta):
+    """Carga un archivo del respaldo en la tabla y devuelve el sha256 de lo leído"""
+    ops = conexion.ops
+    destino = f"{ops.quote_name(tabla)} ({', '.join(ops.quote_name(c) for c in lista_columnas)})"
+    with gzip.open(ruta, 'rb') as comprimido, conexion.cursor() as cursor:
+        archivo = ArchivoConHash(comprimido)
+        if conexion.vendor == 'postgresql':
+            copiar_desde(cursor, f'COPY {destino} FROM STDIN WITH (FORMAT csv)', archivo)
+        else:
+            insertar = f"INSERT INTO {destino} VALUES ({', '.join(['%s'] * len(lista_columnas))})"
+            filas = []
+            for linea in iter(archivo.readline, b''):
+                filas.append(json.loads(linea))
+                if len(filas) >= 5000:
+                    cursor.executemany(insertar, filas)
+                    filas = []
+            if filas:
+                cursor.executemany(insertar, filas)
+    return archivo.hexdigest()
+
+
+def copiar_hacia(cursor, sql, archivo):
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    if is_psycopg3:
+        with cursor.cursor.copy(sql) as copia:
+            for bloque in copia:
+                archivo.write(bloque)
+    else:
+        cursor.cursor.copy_expert(sql, archivo, TAMAÑO_BLOQUE)
+
+
+def copiar_desde(cursor, sql, archivo):
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    if is_psycopg3:
+        with cursor.cursor.copy(sql) as copia:
+            for bloque in iter(lambda: archivo.read(TAMAÑO_BLOQUE), b''):
+                copia.write(bloque)
+    else:
+        cursor.cursor.copy_expert(sql, archivo, TAMAÑO_BLOQUE)
+
+
+def leer_manifiesto(directorio):
+    with open(os.path.join(directorio, MANIFIESTO)) as archivo:
+        return json.load(archivo)
+
+
+def escribir_manifiesto(directorio, manifiesto):
+    with open(os.path.join(directorio, MANIFIESTO), 'w') as archivo:
+        json.dump(manifiesto, archivo, indent=2)
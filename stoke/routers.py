@@ -0,0 +1,58 @@
+"""
+Ruteo de lecturas a la réplica de solo lectura (opcional).
+
+Si settings.DATABASES tiene el alias 'replica', las lecturas de modelos de stoke
+hechas durante una vista de solo lectura (reportes, historial, vista previa del
+cierre, listados del admin) van a la réplica. Todo lo demás, incluidas todas las
+escrituras, sesiones y autenticación, queda en 'default'. Dentro de una
+transacción (atomic) también se lee de 'default', para ver lo que se acaba de
+escribir y leer con los bloqueos de la transacción.
+
+La marca de "vista de solo lectura" la pone stoke.middleware.ReplicaMiddleware.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ALIAS_REPLICA = 'replica'
+APPS_REPLICADAS = {'stoke'}
+
+_leer_de_replica = ContextVar('stoke_leer_de_replica', default=False)
+
+
+def replica_configurada():
+    return ALIAS_REPLICA in settings.DATABASES
+
+
+@contextmanager
+def lectura_en_replica():
+    """Dentro del bloque, las lecturas de stoke van a la réplica (si existe)"""
+    token = _leer_de_replica.set(True)
+    try:
+        yield
+    finally:
+        _leer_de_replica.reset(token)
+
+
+class RouterReplica:
+    def db_for_read(self, model, **hints):
+        if (
+            _leer_de_replica.get() and
+            model._meta.app_label in APPS_REPLICADAS and
+            replica_configurada() and
+            not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return ALIAS_REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # La réplica tiene los mismos datos que 'default'
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != ALIAS_REPLICA
@@ -0,0 +1,216 @@
+"""
+Serialización JSON compartida por los endpoints de stoke.
+
+- Los Decimal se codifican como string ("1234.50") para no perder centavos.
+- Si orjson está instalado se usa para codificar las respuestas; si no, se usa
+  el módulo json de la librería estándar con el mismo resultado.
+- Los cuerpos de los POST se decodifican siempre con la librería estándar, con
+  los números con decimales como Decimal (orjson solo sabe devolver float).
+- validar_venta() revisa el cuerpo del POST de ventas antes de tocar la base.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+
+def _codificar(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f'{type(obj).__name__} no es serializable a JSON')
+
+
+def dumps(data):
+    """Codifica `data` a JSON (bytes)"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_codificar)
+    return json.dumps(data, default=_codificar, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+# Un solo decodificador: json.loads(..., parse_float=...) arma uno nuevo en cada llamada
+_decodificador = json.JSONDecoder(parse_float=Decimal)
+
+
+def loads(contenido):
+    """Decodifica JSON; los números con decimales llegan siempre como Decimal"""
+    if isinstance(contenido, (bytes, bytearray)):
+        contenido = contenido.decode('utf-8')
+    return _decodificador.decode(contenido)
+
+
+class RespuestaJSON(HttpResponse):
+    """Como JsonResponse, pero con Decimal exactos y el backend más rápido disponible"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+# --- Validación del POST de ventas ---
+
+MAXIMO_DETALLES = 500
+MAXIMA_CANTIDAD = 10000
+MAXIMO_MONTO = Decimal('99999999.99')  # max_digits=10, decimal_places=2
+
+
+def _monto(valor, campo, opcional=False):
+    if valor is None or valor == '':
+        if opcional:
+            return None
+        raise ValidationError(f'Falta {campo}')
+    if isinstance(valor, bool) or not isinstance(valor, (int, float, str, Decimal)):
+        raise ValidationError(f'{campo} debe ser un número')
+    try:
+        monto = Decimal(str(valor))
+    except InvalidOperation:
+        raise ValidationError(f'{campo} debe ser un número')
+    if not monto.is_finite() or monto < 0 or monto > MAXIMO_MONTO:
+        raise ValidationError(f'{campo} fuera de rango')
+    if monto != monto.quantize(Decimal('0.01')):
+        raise ValidationError(f'{campo} no puede tener más de 2 decimales')
+    return monto.quantize(Decimal('0.01'))
+
+
+def _entero_positivo(valor, campo, maximo=None):
+    if isinstance(valor, bool) or not isinstance(valor, int) or valor <= 0:
+        raise ValidationError(f'{campo} debe ser un entero mayor a 0')
+    if maximo is not None and valor > maximo:
+        raise ValidationError(f'{campo} no puede superar {maximo}')
+    return valor
+
+
+def validar_venta(data):
+    """
+    Valida y normaliza el cuerpo del POST de ventas (y de la cotización).
+    Devuelve un dict con montos Decimal y los detalles agrupados por producto;
+    lanza ValidationError ante cualquier dato inválido.
+    El total lo calcula el servidor (precios vigentes y promociones): si el
+    cliente manda `total` o `recargo_tarjeta` se ignoran.
+    """
+    from .models import Venta
+
+    if not isinstance(data, dict):
+        raise ValidationError('El cuerpo debe ser un objeto JSON')
+
+    metodo_pago = data.get('metodo_pago', 'efectivo')
+    if metodo_pago not in dict(Venta.METODO_PAGO_CHOICES):
+        raise ValidationError('Método de pago inválido')
+
+    monto_recibido = _monto(data.get('monto_recibido'), 'monto_recibido', opcional=True)
+    monto_manual = _monto(data.get('monto_manual', 0), 'monto_manual')
+
+    detalles = data.get('detalles') or []
+    if not isinstance(detalles, list):
+        raise ValidationError('detalles debe ser una lista')
+    if len(detalles) > MAXIMO_DETALLES:
+        raise ValidationError(f'La venta no puede tener más de {MAXIMO_DETALLES} productos')
+
+    # Un mismo producto cargado dos veces se suma en una sola línea
+    cantidades = {}
+    for detalle in detalles:
+        if not isinstance(detalle, dict):
+            raise ValidationError('Cada detalle debe ser un objeto')
+        producto_id = _entero_positivo(detalle.get('producto_id'), 'producto_id')
+        cantidad = _entero_positivo(detalle.get('cantidad'), 'cantidad', MAXIMA_CANTIDAD)
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+
+    return {
+        'metodo_pago': metodo_pago,
+        'monto_recibido': monto_recibido,
+        'monto_manual': monto_manual,
+        'es_manual': bool(data.get('es_manual')) or monto_manual > 0,
+        'detalles': cantidades,
+    }
+
+
+def validar_devolucion(data):
+    """
+    Valida el cuerpo del POST de devoluciones:
+    {"anular": true} o {"detalles": [{"detalle_id": 1, "cantidad": 2}], "motivo": "..."}
+    """
+    if not isinstance(data, dict):
+        raise ValidationError('El cuerpo debe ser un objeto JSON')
+
+    motivo = data.get('motivo') or ''
+    if not isinstance(motivo, str):
+        raise ValidationError('motivo debe ser texto')
+
+    if data.get('anular'):
+        return {'anular': True, 'motivo': motivo, 'detalles': {}}
+
+    detalles = data.get('detalles')
+    if not isinstance(detalles, list) or not detalles:
+        raise ValidationError('Indicá qué detalles devolver')
+    if len(detalles) > MAXIMO_DETALLES:
+        raise ValidationError(f'No se pueden devolver más de {MAXIMO_DETALLES} detalles a la vez')
+
+    cantidades = {}
+    for detalle in detalles:
+        if not isinstance(detalle, dict):
+            raise ValidationError('Cada detalle debe ser un objeto')
+        detalle_id = _entero_positivo(detalle.get('detalle_id'), 'detalle_id')
+        cantidad = _entero_positivo(detalle.get('cantidad'), 'cantidad', MAXIMA_CANTIDAD)
+        cantidades[detalle_id] = cantidades.get(detalle_id, 0) + cantidad
+
+    return {'anular': False, 'motivo': motivo, 'detalles': cantidades}
+
+
+MAXIMO_ESCANEOS = 5000
+
+
+def validar_conteo(data):
+    """
+    Valida un lote de conteo de inventario y lo agrupa por código:
+    {"codigos": ["7790001", "7790001", ...]} (cada escaneo es una unidad) y/o
+    {"items": [{"codigo": "7790001", "cantidad": 12}]} (negativo para corregir).
+    """
+    if not isinstance(data, dict):
+        raise ValidationError('El cuerpo debe ser un objeto JSON')
+
+    codigos = data.get('codigos') or []
+    items = data.get('items') or []
+    if not isinstance(codigos, list) or not isinstance(items, list):
+        raise ValidationError('codigos e items deben ser listas')
+    if len(codigos) + len(items) > MAXIMO_ESCANEOS:
+        raise ValidationError(f'El lote no puede tener más de {MAXIMO_ESCANEOS} escaneos')
+
+    cantidades = {}
+    for codigo in codigos:
+        if not isinstance(codigo, str) or not codigo.strip():
+            raise ValidationError('Cada código debe ser texto')
+        codigo = codigo.strip()
+        cantidades[codigo] = cantidades.get(codigo, 0) + 1
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('codigo'), str) or not item['codigo'].strip():
+            raise ValidationError('Cada item debe tener un código')
+        cantidad = item.get('cantidad')
+        if isinstance(cantidad, bool) or not isinstance(cantidad, int) or abs(cantidad) > MAXIMA_CANTIDAD:
+            raise ValidationError(f'cantidad debe ser un entero entre -{MAXIMA_CANTIDAD} y {MAXIMA_CANTIDAD}')
+        codigo = item['codigo'].strip()
+        cantidades[codigo] = cantidades.get(codigo, 0) + cantidad
+
+    return cantidades
+
+
+def validar_recepcion(data):
+    """
+    Valida un lote de una orden de compra: el mismo formato que validar_conteo,
+    y cada item puede traer además "costo" (costo unitario, opcional).
+    Devuelve ({codigo: cantidad}, {codigo: costo}).
+    """
+    cantidades = validar_conteo(data)
+    costos = {}
+    for item in data.get('items') or []:
+        costo = _monto(item.get('costo'), 'costo', opcional=True)
+        if costo is not None:
+            costos[item['codigo'].strip()] = costo
+    return cantidades, costos
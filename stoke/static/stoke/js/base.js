@@ -0,0 +1,35 @@
+// Sistema de notificaciones
+function showNotification(message, type = 'success', duration = 3000) {
+    const container = document.getElementById('notification-container');
+    const notification = document.createElement('div');
+    notification.className = `notification ${type}`;
+
+    const icon = {
+        'success': '<i class="bi bi-check-circle-fill"></i>',
+        'error': '<i class="bi bi-x-circle-fill"></i>',
+        'warning': '<i class="bi bi-exclamation-triangle-fill"></i>',
+        'info': '<i class="bi bi-info-circle-fill"></i>'
+    }[type] || '';
+
+    notification.innerHTML = `
+        <div class="d-flex align-items-center">
+            <div class="me-3" style="font-size: 1.5rem;">${icon}</div>
+            <div class="flex-grow-1">${message}</div>
+            <button type="button" class="btn-close" onclick="this.parentElement.parentElement.remove()"></button>
+        </div>
+    `;
+
+    container.appendChild(notification);
+
+    // Auto-remover después de duration
+    setTimeout(() => {
+        notification.classList.add('slide-out');
+        setTimeout(() => notification.remove(), 300);
+    }, duration);
+}
+
+// Valor de una cookie (token CSRF para los fetch)
+function getCookie(name) {
+    const cookie = document.cookie.split(';').map(c => c.trim()).find(c => c.startsWith(name + '='));
+    return cookie ? decodeURIComponent(cookie.substring(name.length + 1)) : null;
+}
@@ -0,0 +1,47 @@
+// Devoluciones y anulaciones desde el detalle de la venta
+function enviarDevolucion(ventaId, datos) {
+    const url = document.getElementById('historial-ventas').dataset.urlDevolver.replace('/0/', `/${ventaId}/`);
+    return fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCookie('csrftoken')
+        },
+        body: JSON.stringify(datos)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            showNotification(data.anulada ? 'Venta anulada' : 'Devolución registrada', 'success', 3000);
+            setTimeout(() => window.location.reload(), 800);
+        } else {
+            showNotification('Error: ' + (data.error || 'Error desconocido'), 'error', 5000);
+        }
+    });
+}
+
+document.addEventListener('click', (e) => {
+    const btnDevolver = e.target.closest('.btn-devolver');
+    const btnAnular = e.target.closest('.btn-anular');
+    if (!btnDevolver && !btnAnular) {
+        return;
+    }
+    const modal = e.target.closest('.modal-content');
+    const motivo = modal.querySelector('.devolver-motivo').value;
+
+    if (btnAnular) {
+        if (confirm('¿Anular la venta completa? Se repone todo el stock.')) {
+            enviarDevolucion(btnAnular.dataset.ventaId, {anular: true, motivo: motivo});
+        }
+        return;
+    }
+
+    const detalles = Array.from(modal.querySelectorAll('.devolver-cantidad'))
+        .map(input => ({detalle_id: parseInt(input.dataset.detalleId), cantidad: parseInt(input.value) || 0}))
+        .filter(d => d.cantidad > 0);
+    if (detalles.length === 0) {
+        showNotification('Indicá cuántas unidades devolver', 'warning');
+        return;
+    }
+    enviarDevolucion(btnDevolver.dataset.ventaId, {detalles: detalles, motivo: motivo});
+});
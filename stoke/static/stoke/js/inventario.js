@@ -0,0 +1,104 @@
+// Escaneo de inventario y de órdenes de compra: los códigos se agrupan en memoria y se
+// envían en lotes (uno por vez) cada INTERVALO_ENVIO ms o al juntar MAXIMO_LOTE escaneos.
+// Lo pendiente se guarda en localStorage para no perderlo si se recarga la página.
+const INTERVALO_ENVIO = 2000;
+const MAXIMO_LOTE = 200;
+
+const contenedorInventario = document.getElementById('inventario-escaneo');
+
+if (contenedorInventario) {
+    const urlContar = contenedorInventario.dataset.urlContar;
+    const claveGuardado = 'stoke:inventario:' + urlContar;
+    const inputCodigo = document.getElementById('codigo-inventario');
+    const inputCantidad = document.getElementById('cantidad-inventario');
+    let pendientes = new Map(JSON.parse(localStorage.getItem(claveGuardado) || '[]'));
+    let escaneosPendientes = 0;
+    let enviadas = 0;
+    let enviando = false;
+
+    function guardarPendientes() {
+        localStorage.setItem(claveGuardado, JSON.stringify(Array.from(pendientes)));
+        let unidades = 0;
+        pendientes.forEach(cantidad => unidades += cantidad);
+        document.getElementById('pendientes-inventario').textContent = unidades;
+    }
+
+    function sumar(lote) {
+        lote.forEach((cantidad, codigo) => {
+            const total = (pendientes.get(codigo) || 0) + cantidad;
+            if (total) {
+                pendientes.set(codigo, total);
+            } else {
+                pendientes.delete(codigo);
+            }
+        });
+        guardarPendientes();
+    }
+
+    function enviar() {
+        if (enviando || pendientes.size === 0) {
+            return;
+        }
+        const lote = pendientes;
+        pendientes = new Map();
+        escaneosPendientes = 0;
+        enviando = true;
+
+        fetch(urlContar, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            body: JSON.stringify({
+                items: Array.from(lote, ([codigo, cantidad]) => ({codigo: codigo, cantidad: cantidad}))
+            })
+        })
+        .then(response => response.json().then(data => ({ok: response.ok, data: data})))
+        .then(({ok, data}) => {
+            if (!ok || !data.success) {
+                // Error de datos (inventario cerrado, lote inválido): no reintentar
+                showNotification('Error: ' + (data.error || 'Error desconocido'), 'error', 5000);
+                return;
+            }
+            enviadas += data.unidades;
+            document.getElementById('enviadas-inventario').textContent = enviadas;
+            const lista = document.getElementById('desconocidos-inventario');
+            data.desconocidos.forEach(codigo => {
+                const item = document.createElement('li');
+                item.textContent = `Código desconocido: ${codigo}`;
+                lista.prepend(item);
+            });
+        })
+        .catch(() => {
+            // Sin conexión: devolver el lote a la cola para el próximo envío
+            sumar(lote);
+        })
+        .finally(() => {
+            enviando = false;
+            guardarPendientes();
+        });
+    }
+
+    inputCodigo.addEventListener('keydown', (e) => {
+        if (e.key !== 'Enter') {
+            return;
+        }
+        e.preventDefault();
+        const codigo = inputCodigo.value.trim();
+        const cantidad = parseInt(inputCantidad.value) || 1;
+        inputCodigo.value = '';
+        inputCantidad.value = 1;
+        if (!codigo) {
+            return;
+        }
+        sumar(new Map([[codigo, cantidad]]));
+        if (++escaneosPendientes >= MAXIMO_LOTE) {
+            enviar();
+        }
+    });
+
+    guardarPendientes();
+    setInterval(enviar, INTERVALO_ENVIO);
+    window.addEventListener('beforeunload', enviar);
+}
@@ -0,0 +1,656 @@
+// URLs de la aplicación (ver #urls-ventas en ventas.html)
+const URLS = document.getElementById('urls-ventas').dataset;
+
+// Estado del carrito
+let carrito = [];
+let total = 0;
+let recargo = 0;  // Recargo por método de pago, según la última cotización
+
+// Elementos del DOM
+const buscarInput = document.getElementById('buscar-input');
+const btnBuscar = document.getElementById('btn-buscar');
+const resultadosBusqueda = document.getElementById('resultados-busqueda');
+const carritoItems = document.getElementById('carrito-items');
+const carritoVacio = document.getElementById('carrito-vacio');
+const carritoTotal = document.getElementById('carrito-total');
+const totalCarrito = document.getElementById('total-carrito');
+const displayTotal = document.getElementById('display-total');
+const montoRecibidoContainer = document.getElementById('monto-recibido-container');
+const montoRecibido = document.getElementById('monto-recibido');
+const displayVuelto = document.getElementById('display-vuelto');
+const btnVenta = document.getElementById('btn-venta');
+const btnLimpiar = document.getElementById('btn-limpiar');
+const metodoPagoRadios = document.querySelectorAll('input[name="metodo-pago"]');
+
+// Grilla de productos: se pide por páginas y solo se dibujan las filas visibles
+const grilla = {
+    contenedor: document.getElementById('grilla-productos'),
+    espaciador: document.getElementById('grilla-espaciador'),
+    ventana: document.getElementById('grilla-ventana'),
+    estado: document.getElementById('grilla-estado'),
+    productos: [],
+    siguiente: {},  // null cuando no hay más páginas
+    categoria: '',
+    cargando: false,
+    generacion: 0,  // descarta respuestas de una categoría anterior
+    altoFila: 86,
+    anchoMinimo: 190,
+};
+
+function escaparHtml(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto;
+    return div.innerHTML.replace(/"/g, '&quot;');
+}
+
+function cargarPaginaGrilla() {
+    if (grilla.cargando || grilla.siguiente === null) {
+        return;
+    }
+    grilla.cargando = true;
+    const generacion = grilla.generacion;
+    const params = new URLSearchParams(grilla.siguiente);
+    if (grilla.categoria) {
+        params.set('categoria', grilla.categoria);
+    }
+
+    fetch(`${URLS.listarProductos}?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            if (generacion !== grilla.generacion) {
+                return;
+            }
+            grilla.productos.push(...data.productos);
+            grilla.siguiente = data.siguiente;
+            grilla.estado.textContent = `${grilla.productos.length} productos${grilla.siguiente ? '…' : ''}`;
+            dibujarGrilla();
+        })
+        .finally(() => {
+            if (generacion === grilla.generacion) {
+                grilla.cargando = false;
+            }
+        });
+}
+
+function dibujarGrilla() {
+    const columnas = Math.max(1, Math.floor(grilla.contenedor.clientWidth / grilla.anchoMinimo));
+    const totalFilas = Math.ceil(grilla.productos.length / columnas);
+    const scrollTop = grilla.contenedor.scrollTop;
+    const primera = Math.max(0, Math.floor(scrollTop / grilla.altoFila) - 2);
+    const ultima = Math.min(totalFilas, Math.ceil((scrollTop + grilla.contenedor.clientHeight) / grilla.altoFila) + 2);
+
+    grilla.espaciador.style.height = `${totalFilas * grilla.altoFila}px`;
+    grilla.ventana.style.gridTemplateColumns = `repeat(${columnas}, 1fr)`;
+    grilla.ventana.style.transform = `translateY(${primera * grilla.altoFila}px)`;
+    grilla.ventana.innerHTML = grilla.productos
+        .slice(primera * columnas, ultima * columnas)
+        .map(p => `
+            <div class="grilla-producto producto-item ${p.stock <= 0 ? 'sin-stock' : ''}"
+                 data-producto-id="${p.id}"
+                 data-producto-nombre="${escaparHtml(p.nombre)}"
+                 data-producto-precio="${p.precio}"
+                 data-producto-stock="${p.stock}">
+                <div class="fw-bold text-truncate">${escaparHtml(p.nombre)}</div>
+                <div class="small text-muted text-truncate">${escaparHtml(p.tamaño || '')}</div>
+                <div class="d-flex justify-content-between">
+                    <strong>$${p.precio}</strong>
+                    <small class="text-muted">Stock: ${p.stock}</small>
+                </div>
+            </div>
+        `).join('');
+
+    // Pedir la página siguiente antes de llegar al final
+    if (ultima >= totalFilas - 5) {
+        cargarPaginaGrilla();
+    }
+}
+
+function cambiarCategoriaGrilla(categoria) {
+    grilla.generacion++;
+    grilla.categoria = categoria;
+    grilla.productos = [];
+    grilla.siguiente = {};
+    grilla.cargando = false;
+    grilla.contenedor.scrollTop = 0;
+    dibujarGrilla();
+}
+
+let dibujoPendiente = false;
+grilla.contenedor.addEventListener('scroll', () => {
+    if (!dibujoPendiente) {
+        dibujoPendiente = true;
+        requestAnimationFrame(() => {
+            dibujoPendiente = false;
+            dibujarGrilla();
+        });
+    }
+});
+window.addEventListener('resize', dibujarGrilla);
+
+document.getElementById('categorias-grilla').addEventListener('click', (e) => {
+    const link = e.target.closest('[data-categoria]');
+    if (!link) {
+        return;
+    }
+    e.preventDefault();
+    document.querySelectorAll('#categorias-grilla .nav-link').forEach(l => l.classList.remove('active'));
+    link.classList.add('active');
+    cambiarCategoriaGrilla(link.dataset.categoria);
+});
+
+cargarPaginaGrilla();
+
+// Búsqueda de productos por texto. Una búsqueda nueva cancela la anterior
+// si todavía no volvió, así una respuesta vieja nunca pisa a la última
+let busquedaEnCurso = null;
+
+function buscarProducto() {
+    const query = buscarInput.value.trim();
+    if (busquedaEnCurso) {
+        busquedaEnCurso.abort();
+        busquedaEnCurso = null;
+    }
+    if (!query) {
+        resultadosBusqueda.innerHTML = '';
+        return;
+    }
+
+    const busqueda = busquedaEnCurso = new AbortController();
+    fetch(`${URLS.buscarProducto}?q=${encodeURIComponent(query)}`, {signal: busqueda.signal})
+        .then(response => response.json())
+        .then(data => {
+            mostrarResultados(data.productos);
+        })
+        .catch(error => {
+            if (error.name !== 'AbortError') {
+                showNotification('Error al buscar productos', 'error');
+            }
+        })
+        .finally(() => {
+            if (busquedaEnCurso === busqueda) {
+                busquedaEnCurso = null;
+            }
+        });
+}
+
+// Escaneos: los códigos leídos en ráfaga (o mientras otro pedido está en
+// camino) se juntan y se resuelven en un solo pedido al servidor
+const PATRON_CODIGO = /^\d{8,14}$/;
+const VENTANA_ESCANEO = 40;  // ms que se espera por más códigos antes de pedir
+const ESPERA_TECLEO = 150;  // ms sin teclas para buscar (o dar por leído un código sin Enter)
+let escaneosPendientes = [];
+let temporizadorEscaneo = null;
+let temporizadorTecleo = null;
+let resolviendoEscaneos = false;
+
+function encolarEscaneo(codigo) {
+    escaneosPendientes.push(codigo);
+    buscarInput.value = '';
+    buscarProducto();  // Cancela una búsqueda por texto pendiente y limpia los resultados
+    clearTimeout(temporizadorEscaneo);
+    temporizadorEscaneo = setTimeout(resolverEscaneos, VENTANA_ESCANEO);
+}
+
+function resolverEscaneos() {
+    if (resolviendoEscaneos || escaneosPendientes.length === 0) {
+        return;
+    }
+    const codigos = escaneosPendientes;
+    escaneosPendientes = [];
+    resolviendoEscaneos = true;
+
+    const params = new URLSearchParams();
+    codigos.forEach(codigo => params.append('codigo', codigo));
+    fetch(`${URLS.resolverProductos}?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            const productos = new Map(data.productos.map(p => [p.id, p]));
+            codigos.forEach(codigo => {
+                const producto = productos.get(data.codigos[codigo]);
+                if (producto) {
+                    agregarAlCarrito(String(producto.id), producto.nombre, producto.precio, producto.stock, false);
+                } else {
+                    showNotification(`Código desconocido: ${escaparHtml(codigo)}`, 'warning');
+                }
+            });
+        })
+        .catch(() => {
+            showNotification('No se pudieron buscar los códigos escaneados', 'error');
+        })
+        .finally(() => {
+            resolviendoEscaneos = false;
+            resolverEscaneos();  // Lo que se escaneó mientras tanto
+        });
+}
+
+function mostrarResultados(productos) {
+    if (productos.length === 0) {
+        resultadosBusqueda.innerHTML = '<div class="list-group-item text-muted">No se encontraron productos</div>';
+        return;
+    }
+
+    resultadosBusqueda.innerHTML = productos.map(p => `
+        <a href="#" class="list-group-item list-group-item-action producto-item"
+           data-producto-id="${p.id}"
+           data-producto-nombre="${p.nombre}"
+           data-producto-precio="${p.precio}"
+           data-producto-stock="${p.stock}">
+            <div class="d-flex w-100 justify-content-between">
+                <h6 class="mb-1">${p.nombre}</h6>
+                <strong>$${p.precio}</strong>
+            </div>
+            <small class="text-muted">Stock: ${p.stock}</small>
+        </a>
+    `).join('');
+}
+
+// Agregar producto al carrito
+function agregarAlCarrito(productoId, nombre, precio, stock, limpiarBusqueda = true) {
+    if (productoId && stock !== undefined && stock <= 0) {
+        showNotification('No hay stock disponible', 'warning');
+        return;
+    }
+
+    // Si es un producto real (tiene ID)
+    if (productoId) {
+        const itemExistente = carrito.find(item => item.producto_id === productoId);
+        if (itemExistente) {
+            if (itemExistente.cantidad >= stock) {
+                showNotification('No hay suficiente stock disponible', 'warning');
+                return;
+            }
+            itemExistente.cantidad++;
+            showNotification(`${nombre} - Cantidad actualizada`, 'success', 2000);
+        } else {
+            carrito.push({
+                producto_id: productoId,
+                nombre: nombre,
+                precio: parseFloat(precio),
+                cantidad: 1,
+                stock: stock,
+                es_manual: false
+            });
+        }
+    } else {
+        // Es una venta manual
+        carrito.push({
+            producto_id: null,
+            nombre: nombre || 'Venta Manual',
+            precio: parseFloat(precio),
+            cantidad: 1,
+            stock: null,
+            es_manual: true
+        });
+        showNotification('Venta manual agregada', 'info', 2000);
+    }
+
+    actualizarCarrito();
+    if (limpiarBusqueda) {
+        buscarInput.value = '';
+        resultadosBusqueda.innerHTML = '';
+    }
+}
+
+// Agregar venta manual
+function agregarVentaManual() {
+    const descripcion = document.getElementById('manual-descripcion').value.trim();
+    const monto = parseFloat(document.getElementById('manual-monto').value);
+
+    if (!monto || monto <= 0) {
+        showNotification('Ingresa un monto válido', 'warning');
+        return;
+    }
+
+    agregarAlCarrito(null, descripcion || 'Venta Manual', monto, null);
+
+    // Limpiar campos
+    document.getElementById('manual-descripcion').value = '';
+    document.getElementById('manual-monto').value = '';
+    document.getElementById('manual-descripcion').focus();
+}
+
+// Actualizar vista del carrito
+function actualizarCarrito() {
+    dibujarCarrito();
+    cotizarCarrito();
+}
+
+// Dibuja el carrito con los descuentos de la última cotización del servidor
+function dibujarCarrito() {
+    total = carrito.reduce((sum, item) => sum + (item.precio * item.cantidad) - (item.descuento || 0), 0) + recargo;
+
+    if (carrito.length === 0) {
+        carritoVacio.style.display = 'block';
+        carritoItems.style.display = 'none';
+        carritoTotal.style.display = 'none';
+    } else {
+        carritoVacio.style.display = 'none';
+        carritoItems.style.display = 'block';
+        carritoTotal.style.display = 'block';
+
+        carritoItems.innerHTML = carrito.map((item, index) => `
+            <div class="carrito-item">
+                <div class="d-flex justify-content-between align-items-center">
+                    <div class="flex-grow-1">
+                        <strong>${item.nombre}</strong>
+                        ${item.es_manual ? '<span class="badge bg-info ms-2">Manual</span>' : ''}
+                        <br>
+                        <small class="text-muted">$${item.precio.toFixed(2)} c/u</small>
+                        ${item.descuento ? `<br><small class="text-success"><i class="bi bi-tag"></i> ${escaparHtml(item.promocion)}: -$${item.descuento.toFixed(2)}</small>` : ''}
+                    </div>
+                    <div class="d-flex align-items-center gap-2">
+                        <!-- Controles de cantidad -->
+                        <div class="input-group" style="width: 120px;">
+                            <button class="btn btn-sm btn-outline-secondary" type="button" onclick="cambiarCantidad(${index}, -1)">
+                                <i class="bi bi-dash"></i>
+                            </button>
+                            <input type="number" 
+                                   class="form-control form-control-sm text-center" 
+                                   value="${item.cantidad}" 
+                                   min="1" 
+                                   max="${item.stock || 999}"
+                                   onchange="cambiarCantidadInput(${index}, this.value)"
+                                   style="max-width: 50px;">
+                            <button class="btn btn-sm btn-outline-secondary" type="button" onclick="cambiarCantidad(${index}, 1)">
+                                <i class="bi bi-plus"></i>
+                            </button>
+                        </div>
+                        <div class="text-end" style="min-width: 80px;">
+                            <strong>$${(item.precio * item.cantidad - (item.descuento || 0)).toFixed(2)}</strong>
+                        </div>
+                        <button class="btn btn-sm btn-outline-danger" onclick="eliminarDelCarrito(${index})" title="Eliminar">
+                            <i class="bi bi-trash"></i>
+                        </button>
+                    </div>
+                </div>
+            </div>
+        `).join('');
+    }
+
+    totalCarrito.textContent = `$${total.toFixed(2)}`;
+    displayTotal.textContent = `$${total.toFixed(2)}`;
+
+    // Habilitar/deshabilitar botón de venta
+    btnVenta.disabled = carrito.length === 0;
+
+    // Actualizar vuelto si es efectivo
+    actualizarVuelto();
+}
+
+// Cambiar cantidad de un item
+function cambiarCantidad(index, cambio) {
+    const item = carrito[index];
+    const nuevaCantidad = item.cantidad + cambio;
+
+    if (nuevaCantidad < 1) {
+        showNotification('La cantidad mínima es 1', 'warning');
+        return;
+    }
+
+    // Validar stock si es producto real
+    if (item.producto_id && item.stock !== null && nuevaCantidad > item.stock) {
+        showNotification(`Stock disponible: ${item.stock} unidades`, 'warning');
+        return;
+    }
+
+    item.cantidad = nuevaCantidad;
+    actualizarCarrito();
+}
+
+// Cambiar cantidad desde input
+function cambiarCantidadInput(index, valor) {
+    const item = carrito[index];
+    const nuevaCantidad = parseInt(valor) || 1;
+
+    if (nuevaCantidad < 1) {
+        item.cantidad = 1;
+        actualizarCarrito();
+        showNotification('La cantidad mínima es 1', 'warning');
+        return;
+    }
+
+    // Validar stock si es producto real
+    if (item.producto_id && item.stock !== null && nuevaCantidad > item.stock) {
+        item.cantidad = item.stock;
+        actualizarCarrito();
+        showNotification(`Stock disponible: ${item.stock} unidades`, 'warning');
+        return;
+    }
+
+    item.cantidad = nuevaCantidad;
+    actualizarCarrito();
+}
+
+// Eliminar del carrito
+function eliminarDelCarrito(index) {
+    const item = carrito[index];
+    carrito.splice(index, 1);
+    actualizarCarrito();
+    showNotification(`${item.nombre} eliminado del carrito`, 'info', 2000);
+}
+
+// Actualizar vuelto
+function actualizarVuelto() {
+    const metodoPago = document.querySelector('input[name="metodo-pago"]:checked').value;
+
+    if (metodoPago === 'efectivo') {
+        montoRecibidoContainer.style.display = 'block';
+        const monto = parseFloat(montoRecibido.value) || 0;
+        const vuelto = monto - total;
+
+        if (vuelto >= 0) {
+            displayVuelto.style.display = 'block';
+            displayVuelto.textContent = `Vuelto: $${vuelto.toFixed(2)}`;
+            displayVuelto.style.color = '#198754';
+        } else {
+            displayVuelto.style.display = 'block';
+            displayVuelto.textContent = `Falta: $${Math.abs(vuelto).toFixed(2)}`;
+            displayVuelto.style.color = '#dc3545';
+        }
+    } else {
+        montoRecibidoContainer.style.display = 'none';
+        displayVuelto.style.display = 'none';
+    }
+}
+
+
+// Canasta en el formato que esperan cotizar y cobrar
+function datosCanasta() {
+    return {
+        metodo_pago: document.querySelector('input[name="metodo-pago"]:checked').value,
+        // Montos como string con 2 decimales (el servidor los valida como Decimal)
+        monto_manual: carrito
+            .filter(item => item.es_manual)
+            .reduce((sum, item) => sum + item.precio * item.cantidad, 0)
+            .toFixed(2),
+        detalles: carrito
+            .filter(item => item.producto_id) // Solo productos reales
+            .map(item => ({
+                producto_id: parseInt(item.producto_id),
+                cantidad: item.cantidad
+            })),
+        es_manual: carrito.some(item => item.es_manual) // Indicar si hay items manuales
+    };
+}
+
+// Promociones y recargos: el servidor cotiza la canasta con las mismas reglas que al cobrar
+let cotizacionPendiente = null;
+let cotizacionNumero = 0;
+
+function cotizarCarrito() {
+    clearTimeout(cotizacionPendiente);
+    if (carrito.length === 0) {
+        recargo = 0;
+        return;
+    }
+    cotizacionPendiente = setTimeout(() => {
+        const numero = ++cotizacionNumero;
+        fetch(URLS.cotizarVenta, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            body: JSON.stringify(datosCanasta())
+        })
+        .then(response => response.json())
+        .then(data => {
+            // Ignorar respuestas de una canasta que ya cambió
+            if (numero !== cotizacionNumero || !data.success) {
+                return;
+            }
+            const lineas = new Map(data.lineas.map(linea => [String(linea.producto_id), linea]));
+            carrito.forEach(item => {
+                const linea = item.producto_id ? lineas.get(String(item.producto_id)) : null;
+                item.descuento = linea ? Number(linea.descuento) : 0;
+                item.promocion = linea ? linea.promocion : null;
+            });
+            recargo = Number(data.recargo);
+            dibujarCarrito();
+        });
+    }, 150);
+}
+
+// Realizar venta
+function realizarVenta() {
+    if (carrito.length === 0) {
+        showNotification('El carrito está vacío', 'warning');
+        return;
+    }
+
+    const metodoPago = document.querySelector('input[name="metodo-pago"]:checked').value;
+    const montoRecibidoValor = metodoPago === 'efectivo' ? parseFloat(montoRecibido.value) || 0 : null;
+
+    if (metodoPago === 'efectivo' && (!montoRecibidoValor || montoRecibidoValor < total)) {
+        showNotification('El monto recibido debe ser mayor o igual al total', 'warning');
+        return;
+    }
+
+    // Deshabilitar botón mientras procesa
+    btnVenta.disabled = true;
+    btnVenta.innerHTML = '<i class="bi bi-hourglass-split"></i> Procesando...';
+
+    // El total y los descuentos los recalcula el servidor
+    const datos = {
+        ...datosCanasta(),
+        monto_recibido: montoRecibidoValor === null ? null : montoRecibidoValor.toFixed(2)
+    };
+    const csrftoken = getCookie('csrftoken');
+
+    fetch(URLS.ventas, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrftoken
+        },
+        body: JSON.stringify(datos)
+    })
+    .then(response => {
+        if (!response.ok) {
+            throw new Error('Error en la respuesta del servidor');
+        }
+        return response.json();
+    })
+    .then(data => {
+        btnVenta.disabled = false;
+        btnVenta.innerHTML = '<i class="bi bi-check-circle"></i> VENTA';
+
+        if (data.success) {
+            // Los montos llegan como string decimal exacto
+            const vuelto = Number(data.vuelto);
+            const vueltoMsg = metodoPago === 'efectivo' && vuelto > 0 
+                ? ` Vuelto: $${vuelto.toFixed(2)}` 
+                : '';
+            showNotification(`Venta realizada exitosamente!${vueltoMsg}`, 'success', 4000);
+            limpiarCarrito();
+        } else {
+            showNotification('Error: ' + (data.error || 'Error desconocido'), 'error', 5000);
+        }
+    })
+    .catch(error => {
+        btnVenta.disabled = false;
+        btnVenta.innerHTML = '<i class="bi bi-check-circle"></i> VENTA';
+        showNotification('Error al realizar la venta. Intenta de nuevo.', 'error', 5000);
+        console.error(error);
+    });
+}
+
+// Limpiar carrito
+function limpiarCarrito() {
+    carrito = [];
+    total = 0;
+    recargo = 0;
+    montoRecibido.value = '';
+    actualizarCarrito();
+}
+
+// Event listeners
+btnBuscar.addEventListener('click', buscarProducto);
+buscarInput.addEventListener('keypress', (e) => {
+    if (e.key === 'Enter') {
+        clearTimeout(temporizadorTecleo);
+        const valor = buscarInput.value.trim();
+        if (PATRON_CODIGO.test(valor)) {
+            encolarEscaneo(valor);
+        } else {
+            buscarProducto();
+        }
+    }
+});
+
+// Búsqueda en tiempo real cuando se deja de tipear. Un lector sin Enter
+// escribe el código entero de golpe: si lo escrito es un código, se agrega
+buscarInput.addEventListener('input', function() {
+    clearTimeout(temporizadorTecleo);
+    const valor = this.value.trim();
+    if (valor.length < 2) {
+        if (!valor) {
+            buscarProducto();  // Cancela la búsqueda pendiente y limpia los resultados
+        }
+        return;
+    }
+    temporizadorTecleo = setTimeout(() => {
+        if (PATRON_CODIGO.test(valor)) {
+            encolarEscaneo(valor);
+        } else {
+            buscarProducto();
+        }
+    }, ESPERA_TECLEO);
+});
+
+// Click en productos (resultados o lista)
+document.addEventListener('click', (e) => {
+    if (e.target.closest('.producto-item')) {
+        e.preventDefault();
+        const item = e.target.closest('.producto-item');
+        agregarAlCarrito(
+            item.dataset.productoId,
+            item.dataset.productoNombre,
+            item.dataset.productoPrecio,
+            item.dataset.productoStock
+        );
+    }
+});
+
+// Cambio de método de pago
+metodoPagoRadios.forEach(radio => {
+    radio.addEventListener('change', () => {
+        actualizarVuelto();
+        cotizarCarrito();
+    });
+});
+
+// Cambio en monto recibido
+montoRecibido.addEventListener('input', actualizarVuelto);
+
+// Botones
+btnVenta.addEventListener('click', realizarVenta);
+btnLimpiar.addEventListener('click', limpiarCarrito);
+document.getElementById('btn-agregar-manual').addEventListener('click', agregarVentaManual);
+
+// Enter en campos manuales
+document.getElementById('manual-monto').addEventListener('keypress', (e) => {
+    if (e.key === 'Enter') {
+        agregarVentaManual();
+    }
+});
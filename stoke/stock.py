@@ -0,0 +1,53 @@
+"""
+Movimientos de stock en bloque.
+
+El stock es por sucursal (modelo Existencia). Todos los cambios se aplican en la
+base con `stock = stock + delta` en un solo UPDATE sobre las filas de una
+sucursal, así que no pisan ventas concurrentes aunque no se bloqueen las filas
+y nunca tocan el stock de otras sucursales.
+"""
+from django.db.models import Case, F, FilteredRelation, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Existencia
+
+
+def sumar_stock(sucursal_id, cantidades):
+    """
+    Suma (o resta, con valores negativos) stock de una sucursal a varios productos en un solo UPDATE.
+    `cantidades` es un dict {producto_id: delta}. Devuelve la cantidad de filas actualizadas.
+    """
+    cantidades = {producto_id: delta for producto_id, delta in cantidades.items() if delta}
+    if not cantidades:
+        return 0
+    
+    # Lo que entra puede ser de productos que la sucursal nunca tuvo: crear su fila en cero
+    nuevos = [producto_id for producto_id, delta in cantidades.items() if delta > 0]
+    if nuevos:
+        Existencia.objects.bulk_create(
+            [Existencia(sucursal_id=sucursal_id, producto_id=producto_id) for producto_id in nuevos],
+            ignore_conflicts=True,
+        )
+    
+    delta = Case(
+        *[When(producto_id=producto_id, then=Value(delta)) for producto_id, delta in cantidades.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return Existencia.objects.filter(
+        sucursal_id=sucursal_id,
+        producto_id__in=cantidades
+    ).update(stock=F('stock') + delta)
+
+
+def anotar_stock(productos, sucursal_id):
+    """
+    Agrega a un queryset de productos las anotaciones `stock` y `vendidas`
+    (unidades de los últimos 30 días) de la sucursal, con un LEFT JOIN a su
+    fila de Existencia (0 si no tiene).
+    """
+    return productos.annotate(
+        existencia_sucursal=FilteredRelation('existencias', condition=Q(existencias__sucursal_id=sucursal_id)),
+        stock=Coalesce(F('existencia_sucursal__stock'), 0),
+        vendidas=Coalesce(F('existencia_sucursal__vendidas_30_dias'), 0),
+    )
@@ -0,0 +1,41 @@
+"""
+Sucursal en la que trabaja cada usuario.
+
+La sucursal elegida se guarda en la sesión (id y nombre), así que resolverla no
+cuesta consultas en cada request: solo la primera vez, o al cambiarla.
+"""
+from django.core.exceptions import PermissionDenied
+
+from .models import Sucursal
+
+CLAVE_SESION = 'stoke_sucursal'
+
+
+def guardar_sucursal(request, sucursal):
+    """Fija la sucursal de trabajo del usuario para el resto de la sesión"""
+    datos = {'id': sucursal.pk, 'nombre': sucursal.nombre, 'usuario': request.user.pk}
+    request.session[CLAVE_SESION] = datos
+    return datos
+
+
+def datos_sucursal(request):
+    """Id y nombre de la sucursal actual; si todavía no hay una, usa la primera permitida"""
+    datos = request.session.get(CLAVE_SESION)
+    if datos is None or datos.get('usuario') != request.user.pk:
+        sucursal = Sucursal.de_usuario(request.user).order_by('id').first()
+        if sucursal is None:
+            raise PermissionDenied('No tenés ninguna sucursal asignada')
+        datos = guardar_sucursal(request, sucursal)
+    return datos
+
+
+def sucursal_actual(request):
+    """Id de la sucursal en la que trabaja el usuario"""
+    return datos_sucursal(request)['id']
+
+
+def contexto(request):
+    """Context processor: nombre de la sucursal actual para la barra de navegación"""
+    if not request.user.is_authenticated:
+        return {}
+    return {'sucursal_actual': request.session.get(CLAVE_SESION)}
@@ -1,3 +1,1404 @@
-from django.test import TestCase
+import importlib
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.admin.models import ADDITION, LogEntry
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import metricas, promociones, views
+from .autenticacion import BackendConCache
+from .catalogo import version_catalogo
+from .codigos import digito_verificador, normalizar_codigo, validar_codigo
+from .devoluciones import anular_ventas, devolver
+from .eventos import EnviadorHTTP, despachar, reclamar
+from .jornada import dia_comercial, filtro_dia, rango_dia
+from .middleware import AdmisionMiddleware, LatenciaCobro
+from .management.commands.stub_contabilidad import ServidorContabilidad
+from .models import (
+    Categoria, CierreCaja, CodigoBarras, DetalleVenta, Devolucion, EventoSalida, Existencia, HistorialPrecio, Inventario, ListaPrecios, Producto,
+    OrdenCompra, Promocion, ResumenDiario, Sucursal, Venta,
+)
+from .perfilado import categoria, leer_capturas, leer_pilas, podar
+from .permisos import GRUPOS, configurar_grupos
+from .popularidad import actualizar, reconstruir
+from .routers import lectura_en_replica
+from .serializers import dumps, loads, validar_venta
+
+# Los tests dibujan plantillas sin haber corrido collectstatic
+sin_manifiesto = override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+
+
+@sin_manifiesto
+class CargaCSVTests(TestCase):
+    """Carga de productos por CSV (user-026)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='clave')
+        cls.producto = Producto.objects.create(nombre='Alfajor', codigo_barras='7790001000002', precio=Decimal('100.00'))
+
+    def cargar(self, contenido):
+        self.client.force_login(self.admin)
+        archivo = SimpleUploadedFile('productos.csv', contenido.encode('utf-8'))
+        return self.client.post('/cargar-csv/', {'archivo_csv': archivo})
+
+    def test_cambio_de_precio_queda_en_el_historial(self):
+        self.cargar('nombre,codigo_barras,precio,stock\nAlfajor,7790001000002,120.10,5\n')
+
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.precio, Decimal('120.10'))
+        cambio = HistorialPrecio.objects.get(producto=self.producto)
+        self.assertEqual((cambio.precio_anterior, cambio.precio_nuevo), (Decimal('100.00'), Decimal('120.10')))
+        self.assertEqual(cambio.usuario, self.admin)
+
+    def test_mismo_precio_o_producto_nuevo_no_registran_cambio(self):
+        self.cargar('nombre,codigo_barras,precio,stock\nAlfajor,7790001000002,100,5\nChicle,,50,3\n')
+
+        self.assertTrue(Producto.objects.filter(nombre='Chicle', precio=Decimal('50.00')).exists())
+        self.assertFalse(HistorialPrecio.objects.exists())
+
+    def test_precio_invalido(self):
+        self.cargar('nombre,codigo_barras,precio,stock\nAlfajor,7790001000002,abc,5\n')
+
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.precio, Decimal('100.00'))
+        self.assertEqual(self.client.session['csv_errores'], ['Fila 2: Precio o stock inválido'])
+
+    def test_stock_absoluto_y_vacio_no_lo_toca(self):
+        principal = Sucursal.principal()
+        self.cargar('nombre,codigo_barras,precio,stock\nAlfajor,7790001000002,100,5\n')
+        self.assertEqual(Existencia.disponible(principal.id, self.producto.id), 5)
+
+        self.cargar('nombre,codigo_barras,precio,stock\nAlfajor,7790001000002,110,\n')  # Solo cambia el precio
+        self.cargar('nombre,codigo_barras,precio\nAlfajor,7790001000002,120\n')
+
+        self.assertEqual(Existencia.disponible(principal.id, self.producto.id), 5)
+        self.cargar('nombre,codigo_barras,precio,stock\nAlfajor,7790001000002,120,2\n')
+        self.assertEqual(Existencia.disponible(principal.id, self.producto.id), 2)
+
+    def test_lista_de_precios_registra_el_historial(self):
+        lista = ListaPrecios.objects.create(nombre='Aumento', valor=Decimal('10'), usuario=self.admin)
+
+        self.assertEqual(lista.aplicar(), 1)
+        cambio = HistorialPrecio.objects.get(producto=self.producto)
+        self.assertEqual((cambio.precio_anterior, cambio.precio_nuevo, cambio.lista), (Decimal('100.00'), Decimal('110.00'), lista))
+
+
+@sin_manifiesto
+class VentaTestCase(TestCase):
+    """Sucursal, vendedor, dos productos con stock y uno sin; `cobrar` hace el POST de la caja"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sucursal = Sucursal.principal()  # La crea la migración 0010
+        cls.vendedor = User.objects.create_user('vendedor', password='clave')
+        cls.sucursal.usuarios.add(cls.vendedor)
+        cls.gaseosa = Producto.objects.create(nombre='Gaseosa', codigo_barras='7790001000019', precio=Decimal('250.00'))
+        cls.chicle = Producto.objects.create(nombre='Chicle', codigo_barras='7790001000026', precio=Decimal('33.33'))
+        cls.agua = Producto.objects.create(nombre='Agua', codigo_barras='7790001000033', precio=Decimal('120.00'))
+        Existencia.objects.bulk_create([
+            Existencia(sucursal=cls.sucursal, producto=cls.gaseosa, stock=10),
+            Existencia(sucursal=cls.sucursal, producto=cls.chicle, stock=10),
+        ])
+
+    def setUp(self):
+        promociones.invalidar()  # El índice en memoria sobrevive al rollback de cada test
+        self.client.force_login(self.vendedor)
+
+    def cobrar(self, detalles, **datos):
+        datos['detalles'] = [{'producto_id': producto.id, 'cantidad': cantidad} for producto, cantidad in detalles]
+        respuesta = self.client.post('/ventas/', dumps(datos), content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return Venta.objects.get(pk=respuesta.json()['venta_id'])
+
+    def stock(self, producto):
+        return Existencia.disponible(self.sucursal.id, producto.id)
+
+    def resumen(self):
+        return ResumenDiario.del_dia(self.sucursal.id, self.vendedor, dia_comercial())
+
+
+class ResumenDiarioTests(VentaTestCase):
+    """Totales del día incrementales y vista previa del cierre (user-027)"""
+
+    def test_cada_venta_suma_al_resumen_y_descuenta_stock(self):
+        self.cobrar([(self.gaseosa, 2), (self.chicle, 3)])
+        self.cobrar([(self.gaseosa, 1)], metodo_pago='transferencia')
+
+        resumen = self.resumen()
+        self.assertEqual(resumen.cantidad_ventas, 2)
+        self.assertEqual(resumen.total_efectivo, Decimal('599.99'))
+        self.assertEqual(resumen.total_transferencia, Decimal('250.00'))
+        self.assertEqual(resumen.total_ventas, Decimal('849.99'))
+        self.assertEqual((self.stock(self.gaseosa), self.stock(self.chicle)), (7, 7))
+
+    def test_venta_sin_stock_no_toca_nada(self):
+        respuesta = self.client.post(
+            '/ventas/', dumps({'detalles': [{'producto_id': self.gaseosa.id, 'cantidad': 11}]}), content_type='application/json'
+        )
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(Venta.objects.exists())
+        self.assertEqual(self.resumen().cantidad_ventas, 0)
+        self.assertEqual(self.stock(self.gaseosa), 10)
+
+    def test_vista_previa_del_cierre_no_escribe(self):
+        self.cobrar([(self.gaseosa, 1)])
+
+        respuesta = self.client.get('/cierre-caja/')
+
+        self.assertEqual(respuesta.context['cierre'].total_ventas, Decimal('250.00'))
+        self.assertFalse(CierreCaja.objects.exists())
+
+    def test_el_cierre_concilia_el_resumen(self):
+        self.cobrar([(self.gaseosa, 1)])
+        ResumenDiario.objects.update(total_ventas=0, total_efectivo=0)
+
+        self.client.post('/cierre-caja/', {'dinero_inicial': '0', 'dinero_final': '250'})
+
+        cierre = CierreCaja.objects.get()
+        self.assertEqual(cierre.total_ventas, Decimal('250.00'))
+        self.assertEqual(self.resumen().total_ventas, Decimal('250.00'))
+
+
+BUENOS_AIRES = ZoneInfo('America/Argentina/Buenos_Aires')
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+@override_settings(TIME_ZONE='America/Argentina/Buenos_Aires', STOKE_HORA_CORTE='04:00')
+class JornadaTests(SimpleTestCase):
+    """Día comercial con hora de corte y rangos semiabiertos en UTC (user-028)"""
+
+    def test_el_dia_cambia_en_la_hora_de_corte(self):
+        self.assertEqual(dia_comercial(datetime(2026, 5, 11, 3, 59, 59, tzinfo=BUENOS_AIRES)), date(2026, 5, 10))
+        self.assertEqual(dia_comercial(datetime(2026, 5, 11, 4, 0, tzinfo=BUENOS_AIRES)), date(2026, 5, 11))
+
+    def test_pasada_la_medianoche_cuenta_en_el_dia_anterior(self):
+        # 00:30 del 11 en Buenos Aires son las 03:30 UTC
+        self.assertEqual(dia_comercial(utc(2026, 5, 11, 3, 30)), date(2026, 5, 10))
+
+    @override_settings(STOKE_HORA_CORTE='00:00')
+    def test_sin_corte_el_dia_es_el_calendario_local(self):
+        self.assertEqual(dia_comercial(utc(2026, 5, 11, 3, 30)), date(2026, 5, 11))
+        self.assertEqual(dia_comercial(utc(2026, 5, 11, 2, 59)), date(2026, 5, 10))
+        self.assertEqual(rango_dia(date(2026, 5, 11)), (utc(2026, 5, 11, 3), utc(2026, 5, 12, 3)))
+
+    def test_rango_en_utc(self):
+        inicio, fin = rango_dia(date(2026, 5, 10))
+
+        self.assertEqual((inicio, fin), (utc(2026, 5, 10, 7), utc(2026, 5, 11, 7)))
+        self.assertEqual(inicio.utcoffset(), timedelta(0))
+
+    def test_rangos_consecutivos_no_se_superponen(self):
+        _, fin = rango_dia(date(2026, 5, 10))
+        inicio, _ = rango_dia(date(2026, 5, 11))
+
+        self.assertEqual(fin, inicio)
+        self.assertEqual(filtro_dia(date(2026, 5, 10)), {'fecha__gte': utc(2026, 5, 10, 7), 'fecha__lt': utc(2026, 5, 11, 7)})
+
+    @override_settings(TIME_ZONE='Europe/Madrid', STOKE_HORA_CORTE='00:00')
+    def test_cambio_de_horario(self):
+        inicio, fin = rango_dia(date(2026, 3, 29))  # Se adelanta una hora a las 02:00
+
+        self.assertEqual(fin - inicio, timedelta(hours=23))
+
+
+@override_settings(STOKE_HORA_CORTE='04:00')
+class JornadaVentasTests(VentaTestCase):
+    """Una venta de la madrugada en los filtros y el resumen del día comercial (user-028)"""
+
+    def test_venta_de_madrugada(self):
+        madrugada = utc(2026, 5, 11, 3, 30)  # 00:30 del 11 en Buenos Aires
+        venta = Venta.objects.create(sucursal=self.sucursal, usuario=self.vendedor, total=Decimal('10'))
+        Venta.objects.filter(pk=venta.pk).update(fecha=madrugada)
+        venta.refresh_from_db()
+
+        ResumenDiario.registrar_venta(venta)
+
+        self.assertTrue(Venta.objects.filter(pk=venta.pk, **filtro_dia(date(2026, 5, 10))).exists())
+        self.assertFalse(Venta.objects.filter(pk=venta.pk, **filtro_dia(date(2026, 5, 11))).exists())
+        self.assertEqual(ResumenDiario.objects.get().fecha, date(2026, 5, 10))
+
+    def test_limite_del_rango_es_del_dia_siguiente(self):
+        _, fin = rango_dia(date(2026, 5, 10))
+        venta = Venta.objects.create(sucursal=self.sucursal, usuario=self.vendedor, total=Decimal('10'))
+        Venta.objects.filter(pk=venta.pk).update(fecha=fin)
+
+        self.assertFalse(Venta.objects.filter(**filtro_dia(date(2026, 5, 10))).exists())
+        self.assertTrue(Venta.objects.filter(**filtro_dia(date(2026, 5, 11))).exists())
+
+
+class SerializacionTests(SimpleTestCase):
+    """Montos exactos en los cuerpos y las respuestas JSON (user-030)"""
+
+    def test_los_decimales_llegan_como_decimal(self):
+        datos = loads(b'{"monto_recibido": 1000.10, "monto_manual": "0.30"}')
+
+        self.assertEqual(datos['monto_recibido'], Decimal('1000.10'))
+        self.assertIsInstance(datos['monto_recibido'], Decimal)
+
+    def test_validar_venta_normaliza_montos_y_agrupa_lineas(self):
+        datos = validar_venta(loads(
+            b'{"monto_recibido": 0.1, "detalles": [{"producto_id": 1, "cantidad": 2}, {"producto_id": 1, "cantidad": 3}]}'
+        ))
+
+        self.assertEqual(datos['monto_recibido'], Decimal('0.10'))
+        self.assertEqual(datos['detalles'], {1: 5})
+
+    def test_los_decimales_salen_como_texto_exacto(self):
+        self.assertEqual(loads(dumps({'total': Decimal('0.30')})), {'total': '0.30'})
+
+
+class DevolucionesTests(VentaTestCase):
+    """Devoluciones parciales y anulaciones: stock, totales del día y eventos (user-031)"""
+
+    def devolver(self, venta, lineas=None, **datos):
+        if lineas is not None:
+            detalles = {detalle.producto_id: detalle.id for detalle in venta.detalles.all()}
+            datos['detalles'] = [{'detalle_id': detalles[producto.id], 'cantidad': cantidad} for producto, cantidad in lineas]
+        respuesta = self.client.post(f'/ventas/{venta.id}/devolver/', dumps(datos), content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        venta.refresh_from_db()
+
+    def test_venta_devolucion_parcial_y_anulacion(self):
+        venta = self.cobrar([(self.gaseosa, 2), (self.chicle, 3)])  # 500 + 99.99
+
+        self.devolver(venta, [(self.gaseosa, 1), (self.chicle, 1)])
+
+        self.assertEqual(venta.total_devuelto, Decimal('283.33'))
+        self.assertFalse(venta.anulada)
+        self.assertEqual((self.stock(self.gaseosa), self.stock(self.chicle)), (9, 8))
+        resumen = self.resumen()
+        self.assertEqual((resumen.cantidad_ventas, resumen.total_ventas, resumen.total_efectivo), (1, Decimal('316.66'), Decimal('316.66')))
+
+        self.devolver(venta, anular=True)
+
+        self.assertTrue(venta.anulada)
+        self.assertEqual(venta.total_devuelto, venta.total)
+        self.assertEqual((self.stock(self.gaseosa), self.stock(self.chicle)), (10, 10))
+        resumen = self.resumen()
+        self.assertEqual((resumen.cantidad_ventas, resumen.total_ventas, resumen.total_efectivo), (0, Decimal('0'), Decimal('0')))
+        self.assertEqual(
+            list(EventoSalida.objects.order_by('id').values_list('tipo', flat=True)),
+            ['venta.registrada', 'venta.devolucion', 'venta.anulada'],
+        )
+
+    def test_el_cierre_coincide_con_el_resumen_despues_de_devolver(self):
+        venta = self.cobrar([(self.gaseosa, 2), (self.chicle, 3)])
+        self.cobrar([(self.chicle, 1)])
+        self.devolver(venta, [(self.chicle, 2)])
+
+        cierre = CierreCaja(sucursal=self.sucursal, fecha=dia_comercial(), usuario=self.vendedor, dinero_inicial=0, dinero_final=0)
+        cierre.calcular_totales()
+
+        self.assertEqual(cierre.conciliar_resumen(), [])
+
+    def test_la_devolucion_incluye_el_recargo_por_tarjeta(self):
+        Promocion.objects.create(nombre='Recargo crédito', tipo='recargo', metodo_pago='tarjeta_credito', porcentaje=Decimal('10'))
+        venta = self.cobrar([(self.gaseosa, 2)], metodo_pago='tarjeta_credito')
+        self.assertEqual((venta.total, venta.recargo_tarjeta), (Decimal('550.00'), Decimal('50.00')))
+
+        self.devolver(venta, [(self.gaseosa, 1)])
+
+        self.assertEqual(venta.total_devuelto, Decimal('275.00'))
+
+    def test_devolver_todo_anula_la_venta_con_el_importe_manual(self):
+        venta = self.cobrar([(self.gaseosa, 1), (self.chicle, 1)], monto_manual='15.00')
+
+        self.devolver(venta, [(self.gaseosa, 1)])
+        self.devolver(venta, [(self.chicle, 1)])
+
+        self.assertTrue(venta.anulada)
+        self.assertEqual(venta.total_devuelto, Decimal('298.33'))
+        self.assertEqual(sum(Devolucion.objects.values_list('total', flat=True)), venta.total)
+        resumen = self.resumen()
+        self.assertEqual((resumen.cantidad_ventas, resumen.total_ventas), (0, Decimal('0')))
+
+    def test_las_ventas_no_se_borran_desde_el_admin(self):
+        admin = User.objects.create_superuser('admin', password='clave')
+        venta = self.cobrar([(self.gaseosa, 1)])
+        self.client.force_login(admin)
+
+        respuesta = self.client.post(f'/admin/stoke/venta/{venta.id}/delete/', {'post': 'yes'})
+
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertTrue(Venta.objects.filter(pk=venta.pk).exists())
+
+
+class RouterReplicaTests(TransactionTestCase):
+    """Ruteo de lecturas a la réplica (user-033). TransactionTestCase: TestCase envuelve todo en atomic()"""
+
+    def setUp(self):
+        configurada = mock.patch('stoke.routers.replica_configurada', return_value=True)
+        configurada.start()
+        self.addCleanup(configurada.stop)
+
+    def test_lecturas_de_solo_lectura_van_a_la_replica(self):
+        with lectura_en_replica():
+            self.assertEqual(Producto.objects.all().db, 'replica')
+        self.assertEqual(Producto.objects.all().db, 'default')
+
+    def test_solo_los_modelos_de_stoke(self):
+        with lectura_en_replica():
+            self.assertEqual(User.objects.all().db, 'default')
+
+    def test_escrituras_a_la_principal(self):
+        with lectura_en_replica():
+            self.assertEqual(Producto.objects.select_for_update().db, 'default')
+            producto = Producto.objects.create(nombre='Agua', precio=Decimal('1'))
+        self.assertEqual(producto._state.db, 'default')
+
+    def test_dentro_de_una_transaccion_se_lee_de_la_principal(self):
+        with lectura_en_replica(), transaction.atomic():
+            self.assertEqual(Producto.objects.all().db, 'default')
+
+    def test_sin_replica_configurada_todo_va_a_la_principal(self):
+        with mock.patch('stoke.routers.replica_configurada', return_value=False), lectura_en_replica():
+            self.assertEqual(Producto.objects.all().db, 'default')
+
+
+HAY_REPLICA = 'replica' in settings.DATABASES
+
+
+@skipUnless(HAY_REPLICA, 'Requiere una réplica configurada (DB_REPLICA_HOST o DATABASE_REPLICA_URL)')
+@sin_manifiesto
+class ReplicaTests(TransactionTestCase):
+    """Con dos bases locales: el historial lee de la réplica y la caja nunca (user-033)"""
+    databases = {'default', 'replica'} if HAY_REPLICA else {'default'}
+
+    def setUp(self):
+        sucursal = Sucursal.objects.create(nombre='Centro')  # TransactionTestCase vacía las tablas
+        self.vendedor = User.objects.create_user('vendedor')
+        sucursal.usuarios.add(self.vendedor)
+        self.producto = Producto.objects.create(nombre='Agua', precio=Decimal('100'))
+        Existencia.objects.create(sucursal=sucursal, producto=self.producto, stock=5)
+        self.client.force_login(self.vendedor)
+
+    def consultas(self, metodo, url, **kwargs):
+        with CaptureQueriesContext(connections['replica']) as replica, CaptureQueriesContext(connections['default']) as principal:
+            respuesta = getattr(self.client, metodo)(url, **kwargs)
+        self.assertLess(respuesta.status_code, 400)
+        return len(replica), len(principal), respuesta
+
+    def test_historial_lee_de_la_replica(self):
+        en_replica, _, _ = self.consultas('get', '/historial/')
+        self.assertGreater(en_replica, 0)
+
+    def test_la_caja_usa_solo_la_principal(self):
+        cuerpo = dumps({'detalles': [{'producto_id': self.producto.id, 'cantidad': 1}]})
+
+        en_replica, en_principal, respuesta = self.consultas('post', '/ventas/', data=cuerpo, content_type='application/json')
+
+        self.assertEqual(en_replica, 0)
+        self.assertGreater(en_principal, 0)
+        # Después de escribir, el usuario lee lo propio desde la principal
+        self.assertIn('stoke_escritura', respuesta.cookies)
+        en_replica, _, _ = self.consultas('get', '/historial/')
+        self.assertEqual(en_replica, 0)
+
+
+@sin_manifiesto
+class ExistenciaAdminTests(TestCase):
+    """El stock se corrige con ajustes relativos, nunca pisando un valor absoluto (user-034)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='clave')
+        cls.sucursal = Sucursal.principal()
+        cls.producto = Producto.objects.create(nombre='Gaseosa', precio=Decimal('250.00'))
+        cls.existencia = Existencia.objects.create(sucursal=cls.sucursal, producto=cls.producto, stock=10)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_el_ajuste_no_pisa_las_ventas_concurrentes(self):
+        url = f'/admin/stoke/existencia/{self.existencia.id}/change/'
+        self.client.get(url)
+        Existencia.descontar(self.sucursal.id, self.producto.id, 3)  # Una venta mientras el admin edita
+
+        self.client.post(url, {'ajuste': '5', 'stock': '100'})
+
+        self.existencia.refresh_from_db()
+        self.assertEqual(self.existencia.stock, 12)
+
+    def test_el_stock_no_es_editable(self):
+        respuesta = self.client.get('/admin/stoke/existencia/')
+        self.assertNotContains(respuesta, 'name="form-0-stock"')
+
+        respuesta = self.client.get(f'/admin/stoke/producto/{self.producto.id}/change/')
+        self.assertNotContains(respuesta, 'name="existencias-0-stock"')
+
+    def test_alta_con_stock_inicial(self):
+        otra = Sucursal.objects.create(nombre='Centro')
+
+        self.client.post('/admin/stoke/existencia/add/', {'producto': self.producto.id, 'sucursal': otra.id, 'ajuste': '4'})
+
+        self.assertEqual(Existencia.disponible(otra.id, self.producto.id), 4)
+
+
+class InventarioTests(VentaTestCase):
+    """Recuentos físicos mientras se sigue vendiendo (user-039)"""
+
+    def setUp(self):
+        super().setUp()
+        self.otra = Sucursal.objects.create(nombre='Centro')
+        Existencia.objects.create(sucursal=self.otra, producto=self.gaseosa, stock=50)
+        self.inventario = Inventario.objects.create(sucursal=self.sucursal, usuario=self.vendedor)
+
+    def contar(self, **datos):
+        respuesta = self.client.post(f'/inventarios/{self.inventario.id}/contar/', dumps(datos), content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json()
+
+    def test_las_ventas_durante_el_recuento_no_se_pierden(self):
+        self.cobrar([(self.gaseosa, 2)])  # Antes de contar: ya no está en la góndola
+        self.contar(codigos=['7790001000019'] * 6, items=[{'codigo': '7790001000026', 'cantidad': 12}])
+        self.cobrar([(self.gaseosa, 1), (self.chicle, 2)])  # Después de contar
+
+        self.assertEqual(self.inventario.cerrar(self.vendedor), 2)
+
+        self.assertEqual((self.stock(self.gaseosa), self.stock(self.chicle)), (5, 10))
+        self.assertEqual(Existencia.disponible(self.otra.id, self.gaseosa.id), 50)
+        resumen = self.resumen()
+        self.assertEqual((resumen.cantidad_ventas, resumen.total_ventas), (2, Decimal('816.66')))
+
+    def test_codigos_desconocidos_y_productos_sin_existencia(self):
+        respuesta = self.contar(codigos=['7790001000033', '7790001000033', '123'])
+
+        self.assertEqual((respuesta['unidades'], respuesta['desconocidos']), (2, ['123']))
+        self.inventario.cerrar()
+        self.assertEqual(self.stock(self.agua), 2)
+        self.assertEqual(self.stock(self.gaseosa), 10)
+
+    def test_recuento_completo_deja_en_cero_lo_no_contado(self):
+        Inventario.objects.filter(pk=self.inventario.pk).update(no_contados_en_cero=True)
+        self.contar(codigos=['7790001000019'])
+
+        self.inventario.cerrar()
+
+        self.assertEqual((self.stock(self.gaseosa), self.stock(self.chicle)), (1, 0))
+        self.assertEqual(Existencia.disponible(self.otra.id, self.gaseosa.id), 50)
+
+    def test_cancelado_no_toca_el_stock_ni_se_puede_cerrar(self):
+        self.contar(codigos=['7790001000019'])
+
+        self.inventario.cancelar(self.vendedor)
+
+        self.assertEqual(self.stock(self.gaseosa), 10)
+        with self.assertRaises(ValidationError):
+            self.inventario.cerrar()
+
+
+class ImportVentasHistoricasTests(VentaTestCase):
+    """Importación de ventas de un sistema anterior (user-045)"""
+
+    def importar(self, contenido):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8') as archivo:
+            archivo.write(contenido)
+            archivo.flush()
+            salida = StringIO()
+            call_command(
+                'import_ventas_historicas', archivo.name,
+                sucursal=self.sucursal.id, usuario='vendedor', stdout=salida,
+            )
+        return salida.getvalue()
+
+    def test_una_fila_invalida_rechaza_la_venta_entera(self):
+        salida = self.importar(
+            'venta,fecha,codigo,cantidad,precio_unitario\n'
+            'A1,2023-05-01 10:00,7790001000019,2,250.00\n'
+            'A2,2023-05-01 11:00,7790001000026,1,50.50\n'
+            'A2,2023-05-01 11:00,7790001000019,x,250.00\n'
+            'A2,2023-05-01 11:00,999,1,10.00\n'
+            'A3,2023-05-01 12:00,999,1,10.00\n'
+        )
+
+        ventas = Venta.objects.order_by('id')
+        self.assertEqual([venta.total for venta in ventas], [Decimal('500.00'), Decimal('10.00')])
+        self.assertEqual(ventas[1].monto_manual, Decimal('10.00'))
+        self.assertEqual(DetalleVenta.objects.count(), 1)
+        self.assertIn('1 filas con errores: 1 ventas no importadas', salida)
+        self.assertIn('1 líneas con 1 códigos desconocidos', salida)
+        self.assertEqual(self.stock(self.gaseosa), 10)
+
+    def test_fecha_invalida_no_deja_importar_el_resto_de_la_venta(self):
+        self.importar(
+            'venta,fecha,codigo,cantidad,precio_unitario\n'
+            'B1,ayer,7790001000019,1,250.00\n'
+            'B1,2023-05-01 10:00,7790001000026,1,33.33\n'
+        )
+
+        self.assertFalse(Venta.objects.exists())
+
+    def test_reimportar_no_duplica_ventas(self):
+        primera = 'venta,fecha,codigo,cantidad,precio_unitario\nC1,2023-05-01 10:00,7790001000019,2,250.00\n'
+        self.importar(primera)
+        salida = self.importar(
+            primera
+            + 'C2,2023-05-01 11:00,7790001000026,1,33.33\n'
+            + 'C2,2023-05-01 11:00,999,1,10.00\n'
+        )
+
+        self.assertIn('Se importaron 1 ventas', salida)
+        self.assertIn('1 ventas salteadas porque ya estaban importadas', salida)
+        ventas = Venta.objects.order_by('id')
+        self.assertEqual([venta.venta_externa for venta in ventas], ['C1', 'C2'])
+        self.assertEqual([venta.total for venta in ventas], [Decimal('500.00'), Decimal('43.33')])
+        self.assertEqual(
+            list(DetalleVenta.objects.order_by('id').values_list('venta_id', 'producto_id')),
+            [(ventas[0].id, self.gaseosa.id), (ventas[1].id, self.chicle.id)],
+        )
+
+    def test_migracion_marca_las_ventas_ya_importadas(self):
+        migracion = importlib.import_module('stoke.migrations.0020_venta_externa')
+        observaciones = 'Importada del sistema anterior (venta D1)'
+        primera = Venta.objects.create(sucursal=self.sucursal, usuario=self.vendedor, total=1, observaciones=observaciones)
+        repetida = Venta.objects.create(sucursal=self.sucursal, usuario=self.vendedor, total=1, observaciones=observaciones)
+
+        migracion.completar_venta_externa(apps, None)
+
+        primera.refresh_from_db()
+        repetida.refresh_from_db()
+        self.assertEqual((primera.venta_externa, repetida.venta_externa), ('D1', None))
+
+
+class RespaldosTests(VentaTestCase):
+    """Respaldo y restauración con stoke_backup / stoke_restore (user-046)"""
+
+    def respaldar(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        call_command('stoke_backup', directorio.name, stdout=StringIO())
+        return directorio.name
+
+    def test_ida_y_vuelta_con_vaciar(self):
+        permiso = Permission.objects.get(codename='change_producto')
+        self.vendedor.user_permissions.add(permiso)
+        venta = self.cobrar([(self.gaseosa, 2)])
+        origen = self.respaldar()
+
+        self.vendedor.user_permissions.clear()
+        Venta.objects.all().delete()
+        Producto.objects.filter(pk=self.gaseosa.pk).delete()
+        registro = LogEntry.objects.create(
+            user=self.vendedor, content_type=ContentType.objects.get_for_model(Venta), object_id=str(venta.id),
+            object_repr='venta', action_flag=ADDITION,
+        )
+        call_command('stoke_restore', origen, vaciar=True, stdout=StringIO())
+
+        self.assertEqual(Venta.objects.get().total, Decimal('500.00'))
+        self.assertEqual(self.stock(self.gaseosa), 8)
+        self.assertEqual(list(User.objects.get(pk=self.vendedor.pk).user_permissions.all()), [permiso])
+        self.assertTrue(LogEntry.objects.filter(pk=registro.pk).exists())  # Fuera del respaldo: no se toca
+
+    def test_sin_vaciar_no_pisa_datos(self):
+        origen = self.respaldar()
+
+        with self.assertRaisesMessage(CommandError, 'usá --vaciar'):
+            call_command('stoke_restore', origen, stdout=StringIO())
+
+    def test_permisos_con_otro_id(self):
+        self.vendedor.user_permissions.add(Permission.objects.get(codename='change_producto'))
+        origen = self.respaldar()
+        Permission.objects.filter(codename='change_producto').update(codename='otro')
+
+        with self.assertRaisesMessage(CommandError, 'stoke.change_producto tienen otro id'):
+            call_command('stoke_restore', origen, vaciar=True, stdout=StringIO())
+
+
+class EventosTests(VentaTestCase):
+    """Outbox de eventos contra el receptor de prueba de stub_contabilidad (user-047)"""
+
+    def setUp(self):
+        super().setUp()
+        self.servidor = ServidorContabilidad(puerto=0)
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        ajustes = override_settings(STOKE_EVENTOS_URL=self.servidor.url)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.enviador = EnviadorHTTP()
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+        self.addCleanup(self.enviador.cerrar)
+
+    def vencer(self):
+        """Adelanta el reloj: los reintentos y las reservas ya están vencidos"""
+        EventoSalida.objects.update(proximo_intento=timezone.now() - timedelta(seconds=1))
+
+    def test_entrega_la_venta_y_la_marca(self):
+        venta = self.cobrar([(self.gaseosa, 2)])
+
+        self.assertEqual(despachar(self.enviador), (1, 1, 0))
+
+        evento = EventoSalida.objects.get()
+        self.assertEqual((evento.estado, evento.intentos), ('entregado', 1))
+        self.assertIsNotNone(evento.fecha_entrega)
+        recibido = self.servidor.recibidos[f'stoke-{evento.id}']
+        self.assertEqual((recibido['tipo'], recibido['clave']), ('venta.registrada', str(venta.id)))
+        self.assertEqual(recibido['datos']['total'], '500.00')
+        self.assertEqual(despachar(self.enviador), (0, 0, 0))
+
+    def test_falla_reintenta_con_espera_y_no_cuenta_el_resto_del_lote(self):
+        primero = EventoSalida.objects.create(tipo='venta.registrada', clave='1', datos={})
+        segundo = EventoSalida.objects.create(tipo='venta.registrada', clave='2', datos={})
+        self.servidor.fallas = 1.0
+
+        antes = timezone.now()
+        self.assertEqual(despachar(self.enviador), (2, 0, 1))
+
+        primero.refresh_from_db()
+        segundo.refresh_from_db()
+        self.assertEqual((primero.estado, primero.intentos), ('pendiente', 1))
+        self.assertIn('HTTP 503', primero.ultimo_error)
+        self.assertGreaterEqual(primero.proximo_intento, antes + timedelta(seconds=4))  # 5 s ±20%
+        self.assertEqual((segundo.estado, segundo.intentos), ('pendiente', 0))
+        self.assertEqual(despachar(self.enviador), (0, 0, 0))  # Todavía no venció la espera
+
+        self.vencer()
+        self.assertEqual(despachar(self.enviador), (2, 0, 1))
+        primero.refresh_from_db()
+        self.assertGreaterEqual(primero.proximo_intento, timezone.now() + timedelta(seconds=7))  # 10 s ±20%
+
+        self.servidor.fallas = 0.0
+        self.vencer()
+        self.assertEqual(despachar(self.enviador), (2, 2, 0))
+        self.assertEqual(len(self.servidor.recibidos), 2)
+        self.assertEqual(
+            list(EventoSalida.objects.values_list('estado', 'intentos')), [('entregado', 3), ('entregado', 1)]
+        )
+
+    @override_settings(STOKE_EVENTOS_MAX_INTENTOS=2)
+    def test_agotados_los_intentos_queda_fallido(self):
+        EventoSalida.objects.create(tipo='venta.registrada', clave='1', datos={})
+        self.servidor.fallas = 1.0
+
+        despachar(self.enviador)
+        self.vencer()
+        despachar(self.enviador)
+
+        self.assertEqual(EventoSalida.objects.get().estado, 'fallido')
+        self.vencer()
+        self.assertEqual(despachar(self.enviador), (0, 0, 0))
+
+    def test_caida_entre_el_envio_y_la_marca_no_duplica_el_evento(self):
+        evento = EventoSalida.objects.create(tipo='venta.registrada', clave='1', datos={'total': '10.00'})
+
+        # El proceso envía y muere antes de marcarlo entregado
+        for reclamado in reclamar(10):
+            self.enviador.enviar(reclamado)
+        self.assertEqual(despachar(self.enviador), (0, 0, 0))  # Sigue reservado
+
+        self.vencer()  # Vence la reserva: otro despachador lo vuelve a tomar
+        self.assertEqual(despachar(self.enviador), (1, 1, 0))
+
+        evento.refresh_from_db()
+        self.assertEqual((evento.estado, evento.intentos), ('entregado', 2))
+        self.assertEqual(list(self.servidor.recibidos), [f'stoke-{evento.id}'])
+        self.assertEqual(self.servidor.repetidos, 1)
+
+
+class AuditoriaTests(VentaTestCase):
+    """Controles de integridad con audit_stoke, informando y reparando (user-048)"""
+
+    def auditar(self, **opciones):
+        with tempfile.TemporaryDirectory() as directorio:
+            salida = os.path.join(directorio, 'informe.jsonl')
+            call_command('audit_stoke', salida=salida, procesos=1, stdout=StringIO(), **opciones)
+            with open(salida, 'rb') as informe:
+                return [loads(linea) for linea in informe]
+
+    def venta_manual(self, **datos):
+        """Venta sin detalles, como las cargadas a mano antes de existir monto_manual"""
+        return Venta.objects.create(
+            sucursal=self.sucursal, usuario=self.vendedor, total=Decimal('500.00'), monto_recibido=Decimal('1000.00'),
+            vuelto=Decimal('500.00'), **datos,
+        )
+
+    def test_informa_sin_reparar(self):
+        venta = self.cobrar([(self.gaseosa, 2)], monto_recibido='1000.00')
+        Venta.objects.filter(pk=venta.pk).update(total=Decimal('450.00'))
+
+        hallazgos = self.auditar()
+
+        fila = next(fila for fila in hallazgos if fila['chequeo'] == 'venta_total')
+        self.assertEqual((fila['id'], fila['actual'], fila['esperado'], fila['reparado']), (venta.id, '450.00', '500.00', False))
+        venta.refresh_from_db()
+        self.assertEqual(venta.total, Decimal('450.00'))
+
+    def test_repara_total_y_vuelto(self):
+        venta = self.cobrar([(self.gaseosa, 2)], monto_recibido='1000.00')
+        Venta.objects.filter(pk=venta.pk).update(total=Decimal('450.00'), vuelto=Decimal('550.00'))
+
+        hallazgos = self.auditar(reparar=True)
+
+        self.assertEqual(
+            sorted((fila['chequeo'], fila['reparado']) for fila in hallazgos if fila['id'] == venta.id),
+            [('venta_total', True), ('venta_vuelto', True)],
+        )
+        venta.refresh_from_db()
+        self.assertEqual((venta.total, venta.vuelto), (Decimal('500.00'), Decimal('500.00')))
+        self.assertEqual(self.auditar(), [])
+
+    def test_no_repara_ventas_sin_detalles(self):
+        venta = self.venta_manual()
+
+        hallazgos = self.auditar(reparar=True)
+
+        self.assertEqual(
+            [(fila['chequeo'], fila['reparado'], fila['sin_reparar']) for fila in hallazgos],
+            [('venta_total', False, 'sin detalles')],
+        )
+        venta.refresh_from_db()
+        self.assertEqual((venta.total, venta.vuelto), (Decimal('500.00'), Decimal('500.00')))
+
+    def test_no_repara_ventas_anteriores_a_monto_manual(self):
+        venta = self.cobrar([(self.gaseosa, 1)])
+        Venta.objects.filter(pk=venta.pk).update(total=Decimal('300.00'), fecha=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+
+        hallazgos = self.auditar(reparar=True)
+
+        fila = next(fila for fila in hallazgos if fila['chequeo'] == 'venta_total')
+        self.assertEqual((fila['reparado'], fila['sin_reparar']), (False, 'anterior a monto_manual'))
+        venta.refresh_from_db()
+        self.assertEqual(venta.total, Decimal('300.00'))
+
+
+class PopularidadTests(VentaTestCase):
+    """Unidades vendidas por sucursal para ordenar por popularidad (user-049)"""
+
+    def setUp(self):
+        super().setUp()
+        self.hoy = dia_comercial()
+        venta = self.cobrar([(self.gaseosa, 3), (self.chicle, 2)])
+        detalle = venta.detalles.get(producto=self.gaseosa)
+        devolver(venta.id, {detalle.id: 1}, self.vendedor)
+        anular_ventas([self.cobrar([(self.chicle, 4)]).id], self.vendedor)
+        ayer = self.cobrar([(self.gaseosa, 2)])
+        Venta.objects.filter(pk=ayer.pk).update(fecha=ayer.fecha - timedelta(days=1))
+
+    def contadores(self, producto):
+        return Existencia.objects.values_list('vendidas_hoy', 'vendidas_30_dias', 'vendidas_total').get(
+            sucursal=self.sucursal, producto=producto
+        )
+
+    def test_reconstruir_descuenta_devoluciones_y_anuladas(self):
+        reconstruir(self.hoy)
+
+        self.assertEqual(self.contadores(self.gaseosa), (2, 4, 4))
+        self.assertEqual(self.contadores(self.chicle), (2, 2, 2))
+
+    def test_la_ventana_corrida_cuenta_solo_lo_vendido_de_verdad(self):
+        self.assertEqual(self.contadores(self.chicle), (6, 6, 6))  # Los cobros suman al momento
+
+        actualizar(self.hoy + timedelta(days=1))
+
+        self.assertEqual(self.contadores(self.gaseosa)[:2], (0, 4))
+        self.assertEqual(self.contadores(self.chicle)[:2], (0, 2))
+
+    def test_grilla_acota_el_limite(self):
+        for limite in ('0', '-5'):
+            respuesta = self.client.get('/productos/', {'limite': limite})
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(len(respuesta.json()['productos']), 1)
+            self.assertEqual(respuesta.json()['siguiente']['despues_id'], respuesta.json()['productos'][0]['id'])
+
+        respuesta = self.client.get('/productos/', {'limite': '1000'})
+        self.assertEqual((len(respuesta.json()['productos']), respuesta.json()['siguiente']), (3, None))
+        self.assertEqual(self.client.get('/productos/', {'limite': 'diez'}).status_code, 400)
+
+
+class OrdenCompraTests(VentaTestCase):
+    """Mercadería recibida de proveedores mientras se sigue vendiendo (user-050)"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', password='clave')
+        self.otra = Sucursal.objects.create(nombre='Centro')
+        Existencia.objects.create(sucursal=self.otra, producto=self.gaseosa, stock=50)
+        self.orden = OrdenCompra.objects.create(sucursal=self.sucursal, usuario=self.admin, proveedor='Distribuidora')
+
+    def escanear(self, **datos):
+        respuesta = self.client.post(f'/compras/{self.orden.id}/agregar/', dumps(datos), content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta.json()
+
+    def test_recibir_suma_al_stock_sin_pisar_las_ventas(self):
+        respuesta = self.escanear(
+            codigos=['7790001000019'] * 5 + ['123'],
+            items=[{'codigo': '7790001000026', 'cantidad': 12, 'costo': '20.50'}, {'codigo': '7790001000033', 'cantidad': 3}],
+        )
+        self.assertEqual((respuesta['unidades'], respuesta['desconocidos']), (20, ['123']))
+        self.cobrar([(self.gaseosa, 2)])  # Mientras se carga la orden
+
+        self.assertEqual(self.orden.recibir(self.admin), 3)
+
+        self.assertEqual((self.stock(self.gaseosa), self.stock(self.chicle), self.stock(self.agua)), (13, 22, 3))
+        self.assertEqual(Existencia.disponible(self.otra.id, self.gaseosa.id), 50)
+        self.orden.refresh_from_db()
+        self.assertEqual((self.orden.estado, self.orden.productos_recibidos, self.orden.unidades_recibidas), ('recibida', 3, 20))
+        self.chicle.refresh_from_db()
+        self.gaseosa.refresh_from_db()
+        self.assertEqual((self.chicle.costo, self.gaseosa.costo), (Decimal('20.50'), None))
+        resumen = self.resumen()
+        self.assertEqual((resumen.cantidad_ventas, resumen.total_ventas), (1, Decimal('500.00')))
+
+    def test_correcciones_y_costos_sin_actualizar(self):
+        OrdenCompra.objects.filter(pk=self.orden.pk).update(actualizar_costos=False)
+        self.orden.refresh_from_db()
+        self.escanear(items=[
+            {'codigo': '7790001000019', 'cantidad': 2, 'costo': '180.00'},
+            {'codigo': '7790001000026', 'cantidad': 1},
+        ])
+        self.escanear(items=[{'codigo': '7790001000019', 'cantidad': -2}])  # Escaneado de más
+
+        self.assertEqual(self.orden.recibir(self.admin), 1)
+
+        self.assertEqual((self.stock(self.gaseosa), self.stock(self.chicle)), (10, 11))
+        self.gaseosa.refresh_from_db()
+        self.assertIsNone(self.gaseosa.costo)
+
+    def test_csv_y_recepcion_desde_la_vista(self):
+        self.client.force_login(self.admin)
+        archivo = SimpleUploadedFile('remito.csv', 'codigo,cantidad,costo\n7790001000019,4,"199,90"\n'.encode('utf-8'))
+        self.client.post(f'/compras/{self.orden.id}/', {'archivo_csv': archivo})
+        self.client.post(f'/compras/{self.orden.id}/', {'accion': 'recibir'})
+        self.client.post(f'/compras/{self.orden.id}/', {'accion': 'recibir'})
+
+        self.assertEqual(self.stock(self.gaseosa), 14)
+        self.gaseosa.refresh_from_db()
+        self.assertEqual(self.gaseosa.costo, Decimal('199.90'))
+        with self.assertRaises(ValidationError):
+            self.orden.recibir(self.admin)
+        with self.assertRaises(ValidationError):
+            self.orden.agregar_lineas({'7790001000019': 1})
+        self.assertEqual(self.stock(self.gaseosa), 14)
+
+    def test_cancelada_no_toca_el_stock(self):
+        self.escanear(codigos=['7790001000019'])
+
+        self.orden.cancelar(self.admin)
+
+        self.assertEqual(self.stock(self.gaseosa), 10)
+        with self.assertRaises(ValidationError):
+            self.orden.recibir()
+
+
+class PromocionesTests(VentaTestCase):
+    """Precio de la canasta calculado en el servidor (user-032)"""
+
+    def setUp(self):
+        super().setUp()
+        self.bebidas = Categoria.objects.create(nombre='Bebidas')
+        Producto.objects.filter(pk=self.gaseosa.pk).update(categoria=self.bebidas)
+
+    def cotizar(self, cantidades, metodo_pago='efectivo', monto_manual=Decimal('0')):
+        productos = Producto.objects.in_bulk([producto.id for producto in cantidades])
+        return promociones.cotizar(
+            productos, {producto.id: cantidad for producto, cantidad in cantidades.items()}, metodo_pago, monto_manual
+        )
+
+    def test_cada_linea_recibe_la_promocion_que_mas_descuenta(self):
+        tres_por_dos = Promocion.objects.create(
+            nombre='3x2 gaseosa', tipo='nxm', producto=self.gaseosa, cantidad=3, cantidad_paga=2
+        )
+        Promocion.objects.create(nombre='10% bebidas', tipo='descuento', categoria=self.bebidas, porcentaje=Decimal('10'))
+        combo = Promocion.objects.create(nombre='3 chicles', tipo='combo', producto=self.chicle, cantidad=3, precio=Decimal('90'))
+
+        cotizacion = self.cotizar({self.gaseosa: 7, self.chicle: 4})
+
+        gaseosa, chicle = cotizacion.lineas
+        self.assertEqual((gaseosa.descuento, gaseosa.promocion), (Decimal('500.00'), tres_por_dos))  # Contra 175 del 10%
+        self.assertEqual((chicle.descuento, chicle.promocion), (Decimal('9.99'), combo))
+        self.assertEqual(cotizacion.total, Decimal('1250.00') + Decimal('123.33'))
+
+    def test_metodo_de_pago_vigencia_y_recargo(self):
+        Promocion.objects.create(
+            nombre='Débito 20%', tipo='descuento', metodo_pago='tarjeta_debito', porcentaje=Decimal('20')
+        )
+        Promocion.objects.create(
+            nombre='Futura', tipo='descuento', porcentaje=Decimal('50'), fecha_desde=timezone.now() + timedelta(days=1)
+        )
+        Promocion.objects.create(nombre='Recargo crédito', tipo='recargo', metodo_pago='tarjeta_credito', porcentaje=Decimal('10'))
+
+        self.assertEqual(self.cotizar({self.gaseosa: 2}).total, Decimal('500.00'))
+        self.assertEqual(self.cotizar({self.gaseosa: 2}, 'tarjeta_debito').total, Decimal('400.00'))
+        credito = self.cotizar({self.gaseosa: 2}, 'tarjeta_credito', Decimal('10.00'))
+        self.assertEqual((credito.recargo, credito.total), (Decimal('51.00'), Decimal('561.00')))
+
+    def test_el_cobro_usa_el_precio_del_servidor(self):
+        Promocion.objects.create(nombre='2x1 gaseosa', tipo='nxm', producto=self.gaseosa, cantidad=2, cantidad_paga=1)
+
+        venta = self.cobrar([(self.gaseosa, 2)], total='1.00')
+
+        self.assertEqual(venta.total, Decimal('250.00'))
+        detalle = venta.detalles.get()
+        self.assertEqual((detalle.subtotal, detalle.descuento), (Decimal('250.00'), Decimal('250.00')))
+
+    def test_promocion_borrada_deja_de_aplicarse(self):
+        promocion = Promocion.objects.create(nombre='2x1', tipo='nxm', producto=self.gaseosa, cantidad=2, cantidad_paga=1)
+        self.assertEqual(self.cotizar({self.gaseosa: 2}).total, Decimal('250.00'))
+
+        promocion.delete()
+
+        self.assertEqual(self.cotizar({self.gaseosa: 2}).total, Decimal('500.00'))
+
+    def test_la_migracion_pasa_el_importe_manual_de_las_ventas_viejas(self):
+        migracion = importlib.import_module('stoke.migrations.0008_promociones')
+        manual = Venta.objects.create(sucursal=self.sucursal, usuario=self.vendedor, total=Decimal('500.00'))
+        mixta = self.cobrar([(self.gaseosa, 1)], monto_manual='20.00')
+        Venta.objects.filter(pk=mixta.pk).update(monto_manual=0)
+        normal = self.cobrar([(self.chicle, 1)])
+
+        migracion.completar_monto_manual(apps, None)
+
+        self.assertEqual(
+            [Venta.objects.get(pk=venta.pk).monto_manual for venta in (manual, mixta, normal)],
+            [Decimal('500.00'), Decimal('20.00'), Decimal('0.00')],
+        )
+
+
+@override_settings(STOKE_USUARIO_TTL=300)
+class UsuarioEnCacheTests(TestCase):
+    """Usuario de la sesión servido desde la caché (user-035)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cajero', password='clave')
+        cls.grupo = Group.objects.create(name='Cajeros')
+        cls.grupo.permissions.add(Permission.objects.get(codename='view_venta'))
+
+    def setUp(self):
+        cache.clear()
+        self.backend = BackendConCache()
+
+    def test_segunda_lectura_sin_consultas(self):
+        self.backend.get_user(self.usuario.id)
+
+        with self.assertNumQueries(0):
+            usuario = self.backend.get_user(self.usuario.id)
+            self.assertFalse(usuario.has_perm('stoke.view_venta'))
+
+    def test_cambio_de_contrasena_y_desactivacion_invalidan(self):
+        self.backend.get_user(self.usuario.id)
+
+        self.usuario.set_password('otra')
+        self.usuario.save()
+        self.assertTrue(self.backend.get_user(self.usuario.id).check_password('otra'))
+
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertIsNone(self.backend.get_user(self.usuario.id))
+
+    def test_cambios_de_grupos_invalidan_los_permisos(self):
+        self.backend.get_user(self.usuario.id)
+
+        self.usuario.groups.add(self.grupo)
+        self.assertTrue(self.backend.get_user(self.usuario.id).has_perm('stoke.view_venta'))
+
+        self.grupo.permissions.clear()
+        self.assertFalse(self.backend.get_user(self.usuario.id).has_perm('stoke.view_venta'))
+
+    def test_las_sesiones_con_el_backend_anterior_siguen_abiertas(self):
+        self.client.force_login(self.usuario, backend='django.contrib.auth.backends.ModelBackend')
+
+        respuesta = self.client.get('/productos/')
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.wsgi_request.user, self.usuario)
+
+    def test_el_login_nuevo_usa_la_cache(self):
+        self.assertTrue(self.client.login(username='cajero', password='clave'))
+
+        self.assertEqual(self.client.session['_auth_user_backend'], 'stoke.autenticacion.BackendConCache')
+
+
+class GruposTests(TestCase):
+    """Grupo de vendedores creado por la migración 0012 y configurar_grupos (user-036)"""
+
+    def permisos(self):
+        return sorted(
+            f'{app_label}.{codename}'
+            for app_label, codename in Group.objects.get(name='Vendedores').permissions.values_list(
+                'content_type__app_label', 'codename'
+            )
+        )
+
+    def test_la_migracion_crea_el_grupo_y_configurar_es_idempotente(self):
+        self.assertEqual(self.permisos(), sorted(GRUPOS['Vendedores']))
+
+        self.assertEqual(configurar_grupos(Group, Permission), {'Vendedores': 0})
+
+    def test_configurar_repone_los_permisos_que_falten(self):
+        Group.objects.get(name='Vendedores').permissions.clear()
+
+        self.assertEqual(configurar_grupos(Group, Permission), {'Vendedores': len(GRUPOS['Vendedores'])})
+        self.assertEqual(self.permisos(), sorted(GRUPOS['Vendedores']))
+
+
+class FragmentosCatalogoTests(VentaTestCase):
+    """Fragmentos de plantilla cacheados por versión del catálogo (user-037)"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.bebidas = Categoria.objects.create(nombre='Bebidas')
+        Producto.objects.filter(pk=self.gaseosa.pk).update(categoria=self.bebidas)
+
+    def clave(self):
+        return make_template_fragment_key('grilla_categorias', [version_catalogo()])
+
+    def test_la_clave_cambia_con_el_catalogo(self):
+        antes = self.clave()
+        self.assertEqual(self.clave(), antes)
+
+        self.chicle.precio = Decimal('40.00')
+        self.chicle.save()
+        despues = self.clave()
+        self.assertNotEqual(despues, antes)
+
+        Categoria.objects.create(nombre='Golosinas')
+        self.assertNotEqual(self.clave(), despues)
+
+    def test_los_cambios_en_bloque_invalidan_al_confirmar(self):
+        antes = self.clave()
+        lista = ListaPrecios.objects.create(nombre='Aumento', valor=Decimal('10'), usuario=self.vendedor)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lista.aplicar()
+
+        self.assertNotEqual(self.clave(), antes)
+
+    def test_la_grilla_muestra_las_categorias_al_dia(self):
+        self.assertContains(self.client.get('/ventas/'), 'Bebidas')
+        self.assertIsNotNone(cache.get(self.clave()))
+
+        self.bebidas.nombre = 'Gaseosas'
+        self.bebidas.save()
+
+        respuesta = self.client.get('/ventas/')
+        self.assertContains(respuesta, 'Gaseosas')
+        self.assertNotContains(respuesta, 'Bebidas')
+
+
+class PerfiladoTests(TestCase):
+    """Perfilado por muestreo de requests (user-038)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cajero', password='clave')
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        self.client.force_login(self.usuario)
+
+    def perfilar(self, **ajustes):
+        # El middleware se arma en la primera request del cliente, con los ajustes vigentes
+        ajustes = {'STOKE_PERFILADO': True, 'STOKE_PERFILADO_DIR': self.directorio, **ajustes}
+        with self.settings(**ajustes):
+            self.assertEqual(self.client.get('/productos/').status_code, 200)
+        return leer_capturas(self.directorio)
+
+    def test_la_request_sorteada_guarda_pilas_y_sql(self):
+        captura, = self.perfilar(STOKE_PERFILADO_MUESTREO=1.0)
+
+        self.assertEqual((captura['ruta'], captura['vista'], captura['estado']), ('/productos/', 'stoke:listar_productos', 200))
+        self.assertGreater(captura['sql_cantidad'], 0)
+        self.assertEqual(sum(leer_pilas(captura['id'], self.directorio).values()), captura['muestras'])
+        salida = StringIO()
+        call_command('perfiles', '--resumen', '--dir', self.directorio, stdout=salida)
+        self.assertIn('stoke:listar_productos', salida.getvalue())
+
+    def test_solo_se_guardan_las_lentas_o_sorteadas(self):
+        self.assertEqual(self.perfilar(STOKE_PERFILADO_MUESTREO=0, STOKE_PERFILADO_UMBRAL_MS=60_000), [])
+
+    def test_apagado_no_escribe_nada(self):
+        self.assertEqual(self.perfilar(STOKE_PERFILADO=False, STOKE_PERFILADO_MUESTREO=1.0), [])
+
+    def test_podar_deja_las_mas_nuevas(self):
+        for numero in range(5):
+            for extension in ('.json', '.folded'):
+                open(os.path.join(self.directorio, f'2026010{numero}{extension}'), 'w').close()
+
+        podar(self.directorio, maximo=3)
+
+        self.assertEqual(
+            sorted(os.listdir(self.directorio)),
+            [f'2026010{numero}{extension}' for numero in (2, 3, 4) for extension in ('.folded', '.json')],
+        )
+
+    def test_categoria_de_una_pila(self):
+        vista = 'ventas (stoke/views.py:30)'
+        self.assertEqual(categoria((vista, 'execute (django/db/backends/utils.py:65)')), 'sql')
+        self.assertEqual(categoria((vista, 'render (django/template/base.py:170)')), 'plantillas')
+        self.assertEqual(categoria((vista, 'cotizar (stoke/promociones.py:140)')), 'python')
+
+
+class CodigosTests(SimpleTestCase):
+    """Normalización y dígito verificador de códigos de barras (user-040)"""
+
+    def test_variantes_del_mismo_articulo_normalizan_igual(self):
+        self.assertEqual(normalizar_codigo('7790310981238'), '07790310981238')
+        self.assertEqual(normalizar_codigo('07790310981238'), '07790310981238')
+        self.assertEqual(normalizar_codigo(' 779-0310 981238 '), '07790310981238')
+        self.assertEqual(normalizar_codigo('036000291452'), normalizar_codigo('0036000291452'))  # UPC-A y su EAN-13
+        self.assertEqual(normalizar_codigo('abc 12'), 'ABC12')
+        self.assertIsNone(normalizar_codigo('  '))
+        self.assertIsNone(normalizar_codigo(None))
+
+    def test_digito_verificador(self):
+        self.assertEqual(digito_verificador('779031098123'), '8')  # EAN-13
+        self.assertEqual(digito_verificador('03600029145'), '2')  # UPC-A
+        self.assertEqual(digito_verificador('9638507'), '4')  # EAN-8
+
+    def test_gtin_con_verificador_invalido(self):
+        for codigo in ('7790310981239', '036000291453', '96385075', '17790310981236'):
+            with self.subTest(codigo=codigo), self.assertRaises(ValidationError):
+                validar_codigo(codigo)
+        self.assertEqual(validar_codigo('96385074'), '00000096385074')
+
+    def test_codigos_internos_sin_verificador(self):
+        for codigo in (
+            '1234',  # PLU
+            '1234567890',  # 9 a 11 dígitos: no son GTIN
+            '2001234567891',  # EAN-13 de circulación restringida (balanza)
+            '412345678901',  # UPC-A interno del comercio
+            '20123456',  # EAN-8 interno
+            'INT-0001',
+        ):
+            with self.subTest(codigo=codigo):
+                self.assertEqual(validar_codigo(codigo), normalizar_codigo(codigo))
+        with self.assertRaises(ValidationError):
+            validar_codigo('X' * 51)
+
+
+class CodigosProductoTests(TestCase):
+    """Códigos repetidos entre productos y códigos alternativos (user-040)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = Producto.objects.create(nombre='Gaseosa', codigo_barras='7790310981238', precio=Decimal('1'))
+        cls.otro = Producto.objects.create(nombre='Agua', precio=Decimal('1'))
+        CodigoBarras.objects.create(producto=cls.producto, codigo='7790001000019')
+
+    def test_codigo_de_otro_producto_con_ceros_es_error_de_validacion(self):
+        self.otro.codigo_barras = '07790310981238'
+        with self.assertRaises(ValidationError) as error:
+            self.otro.full_clean()
+        self.assertIn('codigo_barras', error.exception.message_dict)
+
+        self.producto.codigo_barras = '07790310981238'
+        self.producto.full_clean()  # El propio código con otro formato es válido
+
+    def test_codigo_alternativo_repetido(self):
+        self.otro.codigo_barras = '7790001000019'
+        with self.assertRaises(ValidationError):
+            self.otro.full_clean()
+        with self.assertRaises(ValidationError):
+            CodigoBarras(producto=self.otro, codigo='07790001000019').full_clean()
+        with self.assertRaises(ValidationError):
+            CodigoBarras(producto=self.otro, codigo='7790310981238').full_clean()
+
+    def test_la_migracion_renombra_los_codigos_repetidos(self):
+        migracion = importlib.import_module('stoke.migrations.0015_normalizar_codigos')
+        Producto.objects.update(codigo_normalizado=None)
+        Producto.objects.filter(pk=self.otro.pk).update(codigo_barras='07790310981238')
+
+        migracion.normalizar(apps, None)
+
+        self.otro.refresh_from_db()
+        self.assertEqual(self.otro.codigo_barras, f'REPETIDO{self.otro.id}:07790310981238')
+        self.otro.precio = Decimal('2')
+        self.otro.full_clean()
+        self.otro.save()  # Se puede volver a guardar
+        self.assertEqual(Producto.ids_por_codigo(['7790310981238']), {'7790310981238': self.producto.id})
+
+
+class ResolverProductosTests(VentaTestCase):
+    """Resolución en lote de lo que junta el lector (user-041)"""
+
+    def resolver(self, **parametros):
+        return self.client.get('/productos/resolver/', parametros)
+
+    def test_codigos_repetidos_alternativos_y_desconocidos(self):
+        CodigoBarras.objects.create(producto=self.chicle, codigo='7790001000057')
+        Producto.objects.create(nombre='Viejo', codigo_barras='7790001000040', precio=Decimal('1'), activo=False)
+
+        respuesta = self.resolver(
+            codigo=['7790001000019', '07790001000019', '7790001000019', '7790001000057', '123', '7790001000040', ' '],
+            id=[self.agua.id],
+        )
+
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(
+            sorted((producto['nombre'], producto['stock']) for producto in datos['productos']),
+            [('Agua', 0), ('Chicle', 10), ('Gaseosa', 10)],
+        )
+        self.assertEqual(datos['codigos'], {
+            '7790001000019': self.gaseosa.id, '07790001000019': self.gaseosa.id, '7790001000057': self.chicle.id,
+        })
+        self.assertEqual(datos['desconocidos'], ['123', '7790001000040'])
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.resolver(id='x').status_code, 400)
+        self.assertEqual(self.resolver(codigo=[str(numero) for numero in range(101)]).status_code, 400)
+        self.assertEqual(self.resolver().json()['productos'], [])
+
+
+class MetricasTests(VentaTestCase):
+    """Métricas de Prometheus en /metrics (user-042)"""
+
+    def setUp(self):
+        super().setUp()
+        metricas.registro.reiniciar()
+
+    def test_requests_y_cobros_por_vista(self):
+        self.client.get('/productos/')
+        self.cobrar([(self.gaseosa, 1)])
+
+        texto = self.client.get('/metrics').content.decode()
+
+        self.assertIn('stoke_http_requests_total{estado="200",metodo="GET",vista="stoke:listar_productos"} 1\n', texto)
+        self.assertIn('stoke_http_request_duration_seconds_count{vista="stoke:ventas"} 1\n', texto)
+        self.assertIn('stoke_http_request_db_queries_bucket{vista="stoke:ventas",le="+Inf"} 1\n', texto)
+        self.assertIn('stoke_cobros_total{resultado="ok"} 1\n', texto)
+        self.assertIn('stoke_ventas_importe_total{metodo_pago="efectivo"} 250.0\n', texto)
+
+    def test_histograma_acumulado(self):
+        metricas.observar('stoke_csv_duracion_seconds', 0.03)
+        metricas.observar('stoke_csv_duracion_seconds', 90)
+
+        texto = metricas.exponer()
+
+        self.assertIn('stoke_csv_duracion_seconds_bucket{le="0.025"} 0\n', texto)
+        self.assertIn('stoke_csv_duracion_seconds_bucket{le="0.05"} 1\n', texto)
+        self.assertIn('stoke_csv_duracion_seconds_bucket{le="120"} 2\n', texto)
+        self.assertIn('stoke_csv_duracion_seconds_sum 90.03\n', texto)
+        self.assertIn('stoke_csv_duracion_seconds_count 2\n', texto)
+
+    def test_suma_los_workers_y_conserva_los_que_terminaron(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        foto = {'contadores': [['stoke_sin_stock_total', [], 2]], 'histogramas': []}
+        metricas.escribir(os.path.join(directorio.name, '101.json'), foto)
+        metricas.escribir(os.path.join(directorio.name, '102.json'), foto)
+
+        with self.settings(STOKE_METRICAS_DIR=directorio.name):
+            metricas.incrementar('stoke_sin_stock_total')
+            self.assertIn('stoke_sin_stock_total 5\n', metricas.exponer())
+            metricas.archivar_proceso(101)
+            self.assertIn('stoke_sin_stock_total 5\n', metricas.exponer())
+
+        self.assertFalse(os.path.exists(os.path.join(directorio.name, '101.json')))
+
+    def test_acceso_a_metrics(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='10.0.0.1').status_code, 403)
+        with self.settings(STOKE_METRICAS_TOKEN='secreto'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreto').status_code, 200)
+
+
+@override_settings(STOKE_ADMISION=True, STOKE_ADMISION_DIFERIBLES=1, STOKE_ADMISION_LATENCIA_MS=800, STOKE_ADMISION_REINTENTO=7)
+class AdmisionTests(SimpleTestCase):
+    """Control de admisión: los reportes esperan si el cobro se pone lento (user-044)"""
+
+    def setUp(self):
+        metricas.registro.reiniciar()
+        self.fabrica = RequestFactory()
+        self.middleware = AdmisionMiddleware(self.atender)
+        self.adentro = None  # Lo que pasa mientras la request está en la vista
+
+    def atender(self, request):
+        # Como la cadena de Django: process_view y después la vista
+        rechazo = self.middleware.process_view(request, request.vista, (), {})
+        if rechazo is not None:
+            return rechazo
+        if self.adentro is not None:
+            adentro, self.adentro = self.adentro, None
+            adentro()
+        return HttpResponse('ok')
+
+    def pedir(self, vista):
+        request = self.fabrica.get('/')
+        request.resolver_match = None
+        request.vista = vista
+        return self.middleware(request)
+
+    def test_sin_lugar_para_diferibles_responde_503(self):
+        respuestas = []
+        self.adentro = lambda: respuestas.extend([self.pedir(views.cargar_csv), self.pedir(views.ventas)])
+
+        self.assertEqual(self.pedir(views.historial_ventas).status_code, 200)
+
+        rechazada, critica = respuestas
+        self.assertEqual((rechazada.status_code, rechazada['Retry-After']), (503, '7'))
+        self.assertEqual(critica.status_code, 200)
+        self.assertEqual(self.pedir(views.cargar_csv).status_code, 200)  # Terminada la primera, se liberó el lugar
+        self.assertIn('stoke_admision_rechazos_total{clase="diferible",motivo="concurrencia"} 1\n', metricas.exponer())
+
+    def test_cobro_lento_frena_los_reportes_pero_no_las_ventas(self):
+        self.middleware.latencia.observar(2.0)
+
+        self.assertEqual(self.pedir(views.historial_ventas).status_code, 503)
+        self.assertEqual(self.pedir(views.ventas).status_code, 200)
+        self.assertEqual(self.pedir(views.elegir_sucursal).status_code, 200)  # Normal
+
+    def test_la_latencia_vence_sin_ventas_recientes(self):
+        latencia = LatenciaCobro(umbral_ms=800, ventana=30)
+        with mock.patch('stoke.middleware.time.monotonic', return_value=1000):
+            latencia.observar(2.0)
+            self.assertTrue(latencia.saturada())
+        with mock.patch('stoke.middleware.time.monotonic', return_value=1031):
+            self.assertFalse(latencia.saturada())
+            latencia.observar(0.1)  # Después de la ventana el promedio arranca de nuevo
+            self.assertFalse(latencia.saturada())
+
+    def test_timeout_de_postgresql_es_503(self):
+        request = self.fabrica.get('/')
+        error = OperationalError('canceling statement due to statement timeout')
+        error.__cause__ = Exception('QueryCanceled')
+        error.__cause__.sqlstate = '57014'  # Como el error de psycopg
+
+        respuesta = self.middleware.process_exception(request, error)
+
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertIsNone(self.middleware.process_exception(request, OperationalError('otra')))
+
+
+@override_settings(STOKE_ADMISION=True, STOKE_ADMISION_DIFERIBLES=0)
+class AdmisionAdminTests(TestCase):
+    """El admin es diferible; el POS no (user-044)"""
+
+    def test_admin_rechazado_y_pos_atendido(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='clave'))
+
+        self.assertEqual(self.client.get('/admin/').status_code, 503)
+        self.assertEqual(self.client.get('/productos/').status_code, 200)
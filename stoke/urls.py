@@ -5,8 +5,20 @@ app_name = 'stoke'
 
 urlpatterns = [
     path('ventas/', views.ventas, name='ventas'),
+    path('ventas/cotizar/', views.cotizar_venta, name='cotizar_venta'),
     path('buscar-producto/', views.buscar_producto, name='buscar_producto'),
+    path('productos/', views.listar_productos, name='listar_productos'),
+    path('productos/resolver/', views.resolver_productos, name='resolver_productos'),
     path('cierre-caja/', views.cierre_caja, name='cierre_caja'),
     path('historial/', views.historial_ventas, name='historial_ventas'),
+    path('ventas/<int:venta_id>/devolver/', views.devolver_venta, name='devolver_venta'),
+    path('sucursal/', views.elegir_sucursal, name='elegir_sucursal'),
+    path('inventarios/', views.inventarios, name='inventarios'),
+    path('inventarios/<int:inventario_id>/', views.inventario, name='inventario'),
+    path('inventarios/<int:inventario_id>/contar/', views.contar_inventario, name='contar_inventario'),
+    path('compras/', views.compras, name='compras'),
+    path('compras/<int:orden_id>/', views.compra, name='compra'),
+    path('compras/<int:orden_id>/agregar/', views.agregar_compra, name='agregar_compra'),
     path('cargar-csv/', views.cargar_csv, name='cargar_csv'),
+    path('metrics', views.metricas_prometheus, name='metricas'),
 ]
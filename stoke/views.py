@@ -1,143 +1,353 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Sum, Q
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Max, Sum, Q
 from django.utils import timezone
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.http import require_http_methods
-import json
 import csv
 import io
+import time
+from decimal import Decimal, InvalidOperation
 
-from .models import Producto, Venta, DetalleVenta, CierreCaja, Categoria
+from .models import Producto, Venta, DetalleVenta, CierreCaja, Categoria, ResumenDiario, Sucursal, Existencia, Inventario, CodigoBarras, OrdenCompra, HistorialPrecio
 from .forms import VentaForm, CierreCajaForm, CargaCSVForm
+from .jornada import dia_comercial, filtro_dia
+from .serializers import RespuestaJSON, loads, validar_conteo, validar_devolucion, validar_recepcion, validar_venta
+from .devoluciones import anular_ventas, devolver
+from .promociones import cotizar
+from .middleware import critica, diferible, solo_lectura
+from . import eventos, metricas
+from .catalogo import version_catalogo
+from .codigos import normalizar_codigo, validar_codigo
+from .stock import anotar_stock
+from .sucursales import guardar_sucursal, sucursal_actual
 
 
+@critica
 @login_required
 def ventas(request):
     """Interfaz de ventas tipo calculadora"""
-    # Optimizado: solo cargar productos activos, sin prefetch innecesario
-    productos = Producto.objects.filter(activo=True).select_related('categoria').order_by('nombre')[:50]  # Limitar a 50 para mejor rendimiento
+    sucursal_id = sucursal_actual(request)
     
     if request.method == 'POST':
+        # Validar el cuerpo completo antes de tocar la base de datos
         try:
-            data = json.loads(request.body)
-            
-            # Crear venta
-            venta = Venta.objects.create(
-                usuario=request.user,
-                metodo_pago=data.get('metodo_pago', 'efectivo'),
-                total=data.get('total', 0),
-                monto_recibido=data.get('monto_recibido'),
-                recargo_tarjeta=data.get('recargo_tarjeta', 0),
-                observaciones='Venta manual' if data.get('es_manual') else ''
-            )
-            
-            # Crear detalles de venta (solo si hay productos reales) - Optimizado con bulk_create
-            detalles = data.get('detalles', [])
-            if detalles:
-                # Obtener todos los productos de una vez
-                producto_ids = [d['producto_id'] for d in detalles if d.get('producto_id')]
-                productos_dict = {p.id: p for p in Producto.objects.filter(id__in=producto_ids)}
+            data = validar_venta(loads(request.body))
+        except ValueError:
+            metricas.incrementar('stoke_cobros_total', resultado='rechazado')
+            return RespuestaJSON({'success': False, 'error': 'JSON inválido'}, status=400)
+        except ValidationError as e:
+            metricas.incrementar('stoke_cobros_total', resultado='rechazado')
+            return RespuestaJSON({'success': False, 'error': ' '.join(e.messages)}, status=400)
+        
+        if not data['detalles'] and not data['monto_manual']:
+            metricas.incrementar('stoke_cobros_total', resultado='rechazado')
+            return RespuestaJSON({'success': False, 'error': 'La venta está vacía'}, status=400)
+        
+        sin_stock = False
+        try:
+            with transaction.atomic():
+                cantidades = data['detalles']
+                productos_dict = {}
+                existencias = {}
+                if cantidades:
+                    # Obtener todos los productos de una vez
+                    productos_dict = Producto.objects.only(*CAMPOS_COTIZACION).in_bulk(cantidades)
+                    faltantes = set(cantidades) - set(productos_dict)
+                    if faltantes:
+                        raise ValidationError(f'Productos inexistentes: {sorted(faltantes)}')
+                    
+                    # Solo se bloquea el stock de esta sucursal, hasta el fin de la venta
+                    existencias = {
+                        existencia.producto_id: existencia
+                        for existencia in Existencia.objects.select_for_update().filter(
+                            sucursal_id=sucursal_id,
+                            producto_id__in=cantidades
+                        ).order_by('producto_id')
+                    }
+                    hoy = dia_comercial()
+                    for producto_id, cantidad in cantidades.items():
+                        existencia = existencias.get(producto_id)
+                        disponible = existencia.stock if existencia else 0
+                        if disponible < cantidad:
+                            sin_stock = True
+                            raise ValidationError(f'Stock insuficiente de {productos_dict[producto_id].nombre}. Disponible: {disponible}, Solicitado: {cantidad}')
+                        existencia.stock -= cantidad
+                        # Contadores de popularidad: van en el mismo UPDATE que el stock
+                        existencia.contar_venta(cantidad, hoy)
                 
-                # Crear todos los detalles de una vez
-                detalles_venta = []
-                for detalle_data in detalles:
-                    producto_id = detalle_data.get('producto_id')
-                    if producto_id and producto_id in productos_dict:
-                        producto = productos_dict[producto_id]
-                        detalles_venta.append(DetalleVenta(
+                # Precios vigentes y promociones: el total lo calcula el servidor
+                cotizacion = cotizar(productos_dict, cantidades, data['metodo_pago'], data['monto_manual'])
+                if data['metodo_pago'] == 'efectivo' and data['monto_recibido'] is not None and data['monto_recibido'] < cotizacion.total:
+                    raise ValidationError(f'El monto recibido no alcanza. Total: ${cotizacion.total}')
+                
+                # Crear venta
+                venta = Venta.objects.create(
+                    sucursal_id=sucursal_id,
+                    usuario=request.user,
+                    metodo_pago=data['metodo_pago'],
+                    total=cotizacion.total,
+                    monto_recibido=data['monto_recibido'],
+                    recargo_tarjeta=cotizacion.recargo,
+                    monto_manual=cotizacion.monto_manual,
+                    observaciones='Venta manual' if data['es_manual'] else ''
+                )
+                
+                # Crear detalles de venta (solo si hay productos reales) y actualizar el stock de una vez
+                if cotizacion.lineas:
+                    DetalleVenta.objects.bulk_create([
+                        DetalleVenta(
                             venta=venta,
-                            producto=producto,
-                            cantidad=detalle_data['cantidad'],
-                            precio_unitario=producto.precio,
-                            subtotal=producto.precio * detalle_data['cantidad']
-                        ))
+                            producto=productos_dict[linea.producto_id],
+                            cantidad=linea.cantidad,
+                            precio_unitario=linea.precio_unitario,
+                            descuento=linea.descuento,
+                            promocion=linea.promocion,
+                            subtotal=linea.subtotal
+                        )
+                        for linea in cotizacion.lineas
+                    ])
+                    Existencia.objects.bulk_update(existencias.values(), ['stock', *CAMPOS_VENDIDAS])
+                # Si es venta manual sin productos, la venta se guarda sin detalles
                 
-                # Crear todos los detalles de una vez (más rápido)
-                if detalles_venta:
-                    DetalleVenta.objects.bulk_create(detalles_venta)
-                    
-                    # Actualizar stock de todos los productos de una vez
-                    for detalle_venta in detalles_venta:
-                        detalle_venta.producto.stock -= detalle_venta.cantidad
-                    Producto.objects.bulk_update([d.producto for d in detalles_venta], ['stock'])
-            # Si es venta manual sin productos, la venta se guarda sin detalles
-            
-            return JsonResponse({
-                'success': True,
-                'venta_id': venta.id,
-                'vuelto': float(venta.vuelto) if venta.metodo_pago == 'efectivo' else 0
-            })
+                # Totales del día para la vista previa del cierre de caja
+                ResumenDiario.registrar_venta(venta)
+                # Para contabilidad: se confirma (o no) junto con la venta y lo envía despachar_eventos
+                eventos.registrar_venta(venta, cotizacion.lineas)
+        except ValidationError as e:
+            metricas.incrementar('stoke_cobros_total', resultado='sin_stock' if sin_stock else 'rechazado')
+            if sin_stock:
+                metricas.incrementar('stoke_sin_stock_total')
+            return RespuestaJSON({'success': False, 'error': ' '.join(e.messages)}, status=400)
         except Exception as e:
-            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+            metricas.incrementar('stoke_cobros_total', resultado='error')
+            return RespuestaJSON({'success': False, 'error': str(e)}, status=400)
+        
+        metricas.incrementar('stoke_cobros_total', resultado='ok')
+        metricas.incrementar('stoke_ventas_total', metodo_pago=venta.metodo_pago)
+        metricas.incrementar('stoke_ventas_importe_total', float(venta.total), metodo_pago=venta.metodo_pago)
+        
+        return RespuestaJSON({
+            'success': True,
+            'venta_id': venta.id,
+            'total': venta.total,
+            'vuelto': venta.vuelto if venta.metodo_pago == 'efectivo' else 0
+        })
     
+    # La grilla de productos se carga por páginas desde listar_productos.
+    # Las pestañas de categorías se cachean por versión del catálogo: la consulta
+    # (lazy) solo se ejecuta si el fragmento no está en la caché
     return render(request, 'stoke/ventas.html', {
-        'productos': productos
+        'categorias': Categoria.objects.filter(producto__activo=True).distinct().order_by('nombre'),
+        'version_catalogo': version_catalogo(),
     })
 
 
+# Contadores de Existencia que actualiza cada cobro (ver Existencia.contar_venta)
+CAMPOS_VENDIDAS = ['vendidas_hoy', 'dia_vendidas', 'vendidas_30_dias', 'vendidas_total']
+
+# Columnas necesarias para cotizar y cobrar una canasta
+CAMPOS_COTIZACION = ['id', 'nombre', 'precio', 'categoria_id']
+
+
+@critica
+@login_required
+@require_http_methods(['POST'])
+def cotizar_venta(request):
+    """Vista previa del total con promociones, con el mismo cálculo que el cobro"""
+    try:
+        data = validar_venta(loads(request.body))
+    except ValueError:
+        return RespuestaJSON({'success': False, 'error': 'JSON inválido'}, status=400)
+    except ValidationError as e:
+        return RespuestaJSON({'success': False, 'error': ' '.join(e.messages)}, status=400)
+    
+    cantidades = data['detalles']
+    productos_dict = Producto.objects.only(*CAMPOS_COTIZACION).in_bulk(cantidades) if cantidades else {}
+    cantidades = {producto_id: cantidad for producto_id, cantidad in cantidades.items() if producto_id in productos_dict}
+    
+    cotizacion = cotizar(productos_dict, cantidades, data['metodo_pago'], data['monto_manual'])
+    return RespuestaJSON({'success': True, **cotizacion.como_dict()})
+
+
+# Columnas que devuelve la búsqueda (sin cargar el modelo completo; `stock` es el de la sucursal)
+CAMPOS_BUSQUEDA = ['id', 'nombre', 'precio', 'stock', 'codigo_barras', 'tamaño', 'categoria__nombre']
+
+
+@critica
 @login_required
 def buscar_producto(request):
     """Buscar producto por código de barras o nombre"""
     query = request.GET.get('q', '').strip()
     
     if not query:
-        return JsonResponse({'productos': []})
+        return RespuestaJSON({'productos': []})
     
-    productos = Producto.objects.filter(
-        Q(codigo_barras__iexact=query) | 
-        Q(nombre__icontains=query),
-        activo=True
-    )[:10]
+    # Un escaneo se resuelve por igualdad sobre el índice del código normalizado;
+    # si no es un código conocido, se busca por nombre
+    producto_id = Producto.ids_por_codigo([query]).get(query) if not any(c.isspace() for c in query) else None
+    if producto_id is not None:
+        productos = Producto.objects.filter(pk=producto_id, activo=True)
+    else:
+        productos = Producto.objects.filter(nombre__icontains=query, activo=True)
+    # Los más vendidos de la sucursal primero
+    productos = anotar_stock(productos, sucursal_actual(request)).order_by('-vendidas', 'nombre', 'id')
+    resultados = list(productos.values(*CAMPOS_BUSQUEDA)[:10])
     
-    resultados = [{
-        'id': p.id,
-        'nombre': p.nombre,
-        'precio': float(p.precio),
-        'stock': p.stock,
-        'codigo_barras': p.codigo_barras or '',
-        'tamaño': p.tamaño or '',
-        'categoria': p.categoria.nombre if p.categoria else ''
-    } for p in productos]
+    for producto in resultados:
+        producto['codigo_barras'] = producto['codigo_barras'] or ''
+        producto['tamaño'] = producto['tamaño'] or ''
+        producto['categoria'] = producto.pop('categoria__nombre') or ''
     
-    return JsonResponse({'productos': resultados})
+    return RespuestaJSON({'productos': resultados})
+
+
+MAXIMO_RESOLUCION = 100
 
 
+@critica
+@login_required
+def resolver_productos(request):
+    """
+    Resuelve en lote lo que juntó el lector: ?codigo=...&codigo=...&id=...
+    Los códigos principales y los ids salen de una sola consulta por índice;
+    solo los códigos que no aparecen se buscan entre los alternativos.
+    """
+    codigos = [codigo.strip() for codigo in request.GET.getlist('codigo') if codigo.strip()]
+    try:
+        ids = {int(producto_id) for producto_id in request.GET.getlist('id')}
+    except ValueError:
+        return RespuestaJSON({'error': 'id inválido'}, status=400)
+    if len(codigos) + len(ids) > MAXIMO_RESOLUCION:
+        return RespuestaJSON({'error': f'No se pueden resolver más de {MAXIMO_RESOLUCION} productos a la vez'}, status=400)
+    
+    normalizados = {codigo: normalizar_codigo(codigo) for codigo in codigos}
+    buscados = {normalizado for normalizado in normalizados.values() if normalizado}
+    productos_activos = anotar_stock(Producto.objects.filter(activo=True), sucursal_actual(request))
+    campos = [*CAMPOS_BUSQUEDA, 'codigo_normalizado']
+    
+    productos = {}
+    if buscados or ids:
+        productos = {
+            producto['id']: producto
+            for producto in productos_activos.filter(Q(codigo_normalizado__in=buscados) | Q(id__in=ids)).values(*campos)
+        }
+    por_codigo = {producto['codigo_normalizado']: producto['id'] for producto in productos.values() if producto['codigo_normalizado']}
+    
+    faltantes = buscados.difference(por_codigo)
+    if faltantes:
+        alternativos = dict(CodigoBarras.objects.filter(codigo_normalizado__in=faltantes).values_list('codigo_normalizado', 'producto_id'))
+        nuevos = set(alternativos.values()).difference(productos)
+        if nuevos:
+            productos.update((producto['id'], producto) for producto in productos_activos.filter(id__in=nuevos).values(*campos))
+        por_codigo.update(alternativos)
+    
+    for producto in productos.values():
+        del producto['codigo_normalizado']
+        producto['codigo_barras'] = producto['codigo_barras'] or ''
+        producto['tamaño'] = producto['tamaño'] or ''
+        producto['categoria'] = producto.pop('categoria__nombre') or ''
+    
+    resueltos = {codigo: por_codigo.get(normalizado) for codigo, normalizado in normalizados.items()}
+    return RespuestaJSON({
+        'productos': list(productos.values()),
+        'codigos': {codigo: producto_id for codigo, producto_id in resueltos.items() if producto_id in productos},
+        'desconocidos': [codigo for codigo, producto_id in resueltos.items() if producto_id not in productos],
+    })
+
+
+# Columnas que necesita la grilla de ventas (sin cargar el modelo completo; `stock` y `vendidas` son de la sucursal)
+CAMPOS_GRILLA = ['id', 'nombre', 'precio', 'stock', 'vendidas', 'tamaño', 'categoria_id']
+LIMITE_GRILLA = 200
+LIMITE_GRILLA_MAXIMO = 500
+
+
+@critica
+@login_required
+def listar_productos(request):
+    """
+    Página de productos activos para la grilla de ventas, los más vendidos de la
+    sucursal primero (contadores de Existencia, sin agregar ventas).
+    Paginación por cursor sobre (vendidas, nombre, id), sin OFFSET: cuesta lo
+    mismo la primera página que la última.
+    """
+    try:
+        limite = max(1, min(int(request.GET.get('limite') or LIMITE_GRILLA), LIMITE_GRILLA_MAXIMO))
+        despues_id = int(request.GET['despues_id']) if request.GET.get('despues_id') else None
+        despues_vendidas = int(request.GET.get('despues_vendidas') or 0)
+        categoria_id = int(request.GET['categoria']) if request.GET.get('categoria') else None
+    except ValueError:
+        return RespuestaJSON({'error': 'Parámetros inválidos'}, status=400)
+    
+    productos = Producto.objects.filter(activo=True)
+    if categoria_id:
+        productos = productos.filter(categoria_id=categoria_id)
+    productos = anotar_stock(productos, sucursal_actual(request))
+    
+    if despues_id is not None:
+        despues_nombre = request.GET.get('despues_nombre', '')
+        productos = productos.filter(
+            Q(vendidas__lt=despues_vendidas) |
+            Q(vendidas=despues_vendidas, nombre__gt=despues_nombre) |
+            Q(vendidas=despues_vendidas, nombre=despues_nombre, id__gt=despues_id)
+        )
+    
+    filas = list(productos.order_by('-vendidas', 'nombre', 'id').values(*CAMPOS_GRILLA)[:limite + 1])
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    
+    siguiente = None
+    if hay_mas:
+        siguiente = {
+            'despues_vendidas': filas[-1]['vendidas'],
+            'despues_nombre': filas[-1]['nombre'],
+            'despues_id': filas[-1]['id'],
+        }
+    
+    return RespuestaJSON({'productos': filas, 'siguiente': siguiente})
+
+
+@diferible
+@solo_lectura
 @login_required
 def cierre_caja(request):
-    """Vista de cierre de caja"""
-    hoy = timezone.now().date()
+    """Vista de cierre de caja (de la sucursal actual)"""
+    hoy = dia_comercial()
+    sucursal_id = sucursal_actual(request)
     
-    # Obtener o crear cierre del día
-    cierre, created = CierreCaja.objects.get_or_create(
-        fecha=hoy,
-        usuario=request.user,
-        defaults={'dinero_inicial': 0}
-    )
+    # El cierre solo se guarda al enviar el formulario: un GET no escribe en la base
+    cierre = CierreCaja.objects.filter(sucursal_id=sucursal_id, fecha=hoy, usuario=request.user).first()
+    if cierre is None:
+        cierre = CierreCaja(sucursal_id=sucursal_id, fecha=hoy, usuario=request.user)
     
     if request.method == 'POST':
         form = CierreCajaForm(request.POST, instance=cierre)
         if form.is_valid():
-            cierre = form.save(commit=False)
-            cierre.calcular_totales()
-            cierre.save()
+            with transaction.atomic():
+                cierre = form.save(commit=False)
+                # Al cerrar se re-agregan las ventas y se concilia con el resumen incremental
+                cierre.calcular_totales()
+                diferencias = cierre.conciliar_resumen()
+                cierre.save()
+            if diferencias:
+                messages.warning(request, f'El resumen del día no coincidía con las ventas ({", ".join(diferencias)}) y fue corregido')
             messages.success(request, 'Cierre de caja guardado exitosamente')
-            return redirect('cierre_caja')
+            return redirect('stoke:cierre_caja')
     else:
-        # Calcular totales automáticamente
-        cierre.calcular_totales()
-        cierre.save()
+        # Vista previa con los totales acumulados en cada venta (sin re-agregar)
+        cierre.cargar_resumen(ResumenDiario.del_dia(sucursal_id, request.user, hoy))
         form = CierreCajaForm(instance=cierre)
     
     # Ventas del día
-    inicio_dia = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    fin_dia = timezone.now().replace(hour=23, minute=59, second=59, microsecond=999999)
-    
     ventas_dia = Venta.objects.filter(
-        fecha__gte=inicio_dia,
-        fecha__lte=fin_dia,
-        usuario=request.user
+        sucursal_id=sucursal_id,
+        usuario=request.user,
+        **filtro_dia(hoy)
     ).order_by('-fecha')
     
     return render(request, 'stoke/cierre_caja.html', {
@@ -147,29 +357,278 @@ def cierre_caja(request):
     })
 
 
+@diferible
+@solo_lectura
 @login_required
 def historial_ventas(request):
-    """Historial de ventas"""
-    ventas = Venta.objects.filter(usuario=request.user).order_by('-fecha')[:100]
+    """Historial de ventas (de la sucursal actual)"""
+    # Cada venta se dibuja desde la caché mientras no tenga devoluciones nuevas
+    ventas = Venta.objects.filter(
+        sucursal_id=sucursal_actual(request),
+        usuario=request.user
+    ).annotate(
+        ultima_devolucion=Max('devoluciones__id')
+    ).prefetch_related('detalles__producto').order_by('-fecha')[:100]
     
     return render(request, 'stoke/historial_ventas.html', {
         'ventas': ventas
     })
 
 
+@login_required
+@require_http_methods(['POST'])
+def devolver_venta(request, venta_id):
+    """Devolución parcial (algunas unidades) o anulación completa de una venta"""
+    venta = get_object_or_404(Venta.objects.only('id', 'usuario_id'), pk=venta_id)
+    if not (request.user.is_superuser or venta.usuario_id == request.user.id):
+        return RespuestaJSON({'success': False, 'error': 'No podés devolver ventas de otro usuario'}, status=403)
+    
+    try:
+        data = validar_devolucion(loads(request.body))
+        if data['anular']:
+            anular_ventas([venta.id], request.user, data['motivo'])
+        else:
+            devolver(venta.id, data['detalles'], request.user, data['motivo'])
+    except ValueError:
+        return RespuestaJSON({'success': False, 'error': 'JSON inválido'}, status=400)
+    except ValidationError as e:
+        return RespuestaJSON({'success': False, 'error': ' '.join(e.messages)}, status=400)
+    
+    venta = Venta.objects.only('total', 'total_devuelto', 'anulada').get(pk=venta.id)
+    return RespuestaJSON({
+        'success': True,
+        'venta_id': venta.id,
+        'total_devuelto': venta.total_devuelto,
+        'anulada': venta.anulada
+    })
+
+
+@login_required
+def elegir_sucursal(request):
+    """Cambiar la sucursal en la que trabaja el usuario"""
+    sucursales = Sucursal.de_usuario(request.user)
+    
+    if request.method == 'POST':
+        try:
+            sucursal_id = int(request.POST.get('sucursal_id', ''))
+        except ValueError:
+            messages.error(request, 'Sucursal inválida')
+            return redirect('stoke:elegir_sucursal')
+        sucursal = get_object_or_404(sucursales, pk=sucursal_id)
+        guardar_sucursal(request, sucursal)
+        messages.success(request, f'Ahora estás trabajando en {sucursal.nombre}')
+        return redirect('stoke:ventas')
+    
+    return render(request, 'stoke/elegir_sucursal.html', {
+        'sucursales': sucursales,
+        'actual': sucursal_actual(request)
+    })
+
+
+@login_required
+def inventarios(request):
+    """Recuentos físicos de stock de la sucursal actual (los abre un administrador)"""
+    sucursal_id = sucursal_actual(request)
+    
+    if request.method == 'POST':
+        if not request.user.is_superuser:
+            messages.error(request, 'Solo los administradores pueden abrir un inventario')
+            return redirect('stoke:inventarios')
+        if Inventario.objects.filter(sucursal_id=sucursal_id, estado='abierto').exists():
+            messages.error(request, 'Ya hay un inventario abierto en esta sucursal')
+            return redirect('stoke:inventarios')
+        inventario = Inventario.objects.create(
+            sucursal_id=sucursal_id,
+            usuario=request.user,
+            descripcion=request.POST.get('descripcion', '').strip()[:200],
+            no_contados_en_cero=bool(request.POST.get('no_contados_en_cero')),
+        )
+        return redirect('stoke:inventario', inventario_id=inventario.id)
+    
+    return render(request, 'stoke/inventarios.html', {
+        'inventarios': Inventario.objects.filter(sucursal_id=sucursal_id).select_related('usuario')[:50]
+    })
+
+
+@login_required
+def inventario(request, inventario_id):
+    """Pantalla de escaneo de un inventario; cierre o cancelación por un administrador"""
+    inventario = get_object_or_404(Inventario, pk=inventario_id, sucursal_id=sucursal_actual(request))
+    
+    if request.method == 'POST':
+        if not request.user.is_superuser:
+            messages.error(request, 'Solo los administradores pueden cerrar un inventario')
+            return redirect('stoke:inventario', inventario_id=inventario.id)
+        try:
+            if request.POST.get('accion') == 'cancelar':
+                inventario.cancelar(request.user)
+                messages.success(request, 'Inventario cancelado, el stock no se modificó')
+            else:
+                ajustados = inventario.cerrar(request.user)
+                messages.success(request, f'✅ Inventario cerrado: {ajustados} productos ajustados')
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
+        return redirect('stoke:inventario', inventario_id=inventario.id)
+    
+    conteos = inventario.conteos.select_related('producto').order_by('-fecha_actualizacion')
+    return render(request, 'stoke/inventario.html', {
+        'inventario': inventario,
+        'conteos': conteos[:200],
+        'totales': conteos.aggregate(productos=Count('id'), unidades=Sum('cantidad')),
+    })
+
+
+@login_required
+@require_http_methods(['POST'])
+def contar_inventario(request, inventario_id):
+    """Recibe lotes de escaneos: {"codigos": [...]} y/o {"items": [{"codigo", "cantidad"}]}"""
+    inventario = get_object_or_404(
+        Inventario.objects.only('id', 'sucursal_id'),
+        pk=inventario_id,
+        sucursal_id=sucursal_actual(request)
+    )
+    try:
+        unidades, desconocidos = inventario.registrar_conteos(validar_conteo(loads(request.body)))
+    except ValueError:
+        return RespuestaJSON({'success': False, 'error': 'JSON inválido'}, status=400)
+    except ValidationError as e:
+        return RespuestaJSON({'success': False, 'error': ' '.join(e.messages)}, status=400)
+    
+    return RespuestaJSON({'success': True, 'unidades': unidades, 'desconocidos': desconocidos})
+
+
+@login_required
+def compras(request):
+    """Órdenes de compra (mercadería recibida de proveedores) de la sucursal actual"""
+    sucursal_id = sucursal_actual(request)
+    
+    if request.method == 'POST':
+        if not request.user.is_superuser:
+            messages.error(request, 'Solo los administradores pueden abrir una orden de compra')
+            return redirect('stoke:compras')
+        proveedor = request.POST.get('proveedor', '').strip()[:200]
+        if not proveedor:
+            messages.error(request, 'Falta el proveedor')
+            return redirect('stoke:compras')
+        orden = OrdenCompra.objects.create(
+            sucursal_id=sucursal_id,
+            usuario=request.user,
+            proveedor=proveedor,
+            remito=request.POST.get('remito', '').strip()[:50],
+            actualizar_costos=bool(request.POST.get('actualizar_costos')),
+        )
+        return redirect('stoke:compra', orden_id=orden.id)
+    
+    return render(request, 'stoke/compras.html', {
+        'ordenes': OrdenCompra.objects.filter(sucursal_id=sucursal_id).select_related('usuario')[:50]
+    })
+
+
+def _lineas_csv(archivo):
+    """
+    Convierte un CSV con columnas codigo, cantidad y opcionalmente costo en items
+    para validar_recepcion. Acepta coma decimal en el costo.
+    """
+    items = []
+    reader = csv.DictReader(io.StringIO(archivo.read().decode('utf-8-sig')))
+    for fila_num, fila in enumerate(reader, start=2):  # La fila 1 es el encabezado
+        codigo = (fila.get('codigo') or '').strip()
+        if not codigo:
+            continue
+        try:
+            cantidad = int((fila.get('cantidad') or '').strip())
+        except ValueError:
+            raise ValidationError(f'Fila {fila_num}: cantidad inválida')
+        item = {'codigo': codigo, 'cantidad': cantidad}
+        costo = (fila.get('costo') or '').strip().replace(',', '.')
+        if costo:
+            item['costo'] = costo
+        items.append(item)
+    return {'items': items}
+
+
+@login_required
+def compra(request, orden_id):
+    """Carga de una orden de compra; la recepción, cancelación o subida de CSV la hace un administrador"""
+    orden = get_object_or_404(OrdenCompra, pk=orden_id, sucursal_id=sucursal_actual(request))
+    
+    if request.method == 'POST':
+        if not request.user.is_superuser:
+            messages.error(request, 'Solo los administradores pueden recibir una orden de compra')
+            return redirect('stoke:compra', orden_id=orden.id)
+        try:
+            if request.POST.get('accion') == 'cancelar':
+                orden.cancelar(request.user)
+                messages.success(request, 'Orden de compra cancelada, el stock no se modificó')
+            elif request.POST.get('accion') == 'recibir':
+                recibidos = orden.recibir(request.user)
+                messages.success(request, f'✅ Mercadería recibida: {recibidos} productos, {orden.unidades_recibidas} unidades sumadas al stock')
+            else:
+                form = CargaCSVForm(request.POST, request.FILES)
+                if not form.is_valid():
+                    raise ValidationError('Falta el archivo CSV')
+                try:
+                    cantidades, costos = validar_recepcion(_lineas_csv(request.FILES['archivo_csv']))
+                except UnicodeDecodeError:
+                    raise ValidationError('El archivo debe estar en UTF-8')
+                unidades, desconocidos = orden.agregar_lineas(cantidades, costos)
+                messages.success(request, f'CSV cargado: {unidades} unidades')
+                if desconocidos:
+                    messages.warning(request, f'{len(desconocidos)} códigos desconocidos: {", ".join(desconocidos[:20])}')
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
+        return redirect('stoke:compra', orden_id=orden.id)
+    
+    lineas = orden.lineas.select_related('producto').order_by('producto__nombre')
+    return render(request, 'stoke/compra.html', {
+        'orden': orden,
+        'lineas': lineas[:500],
+        'totales': lineas.aggregate(productos=Count('id'), unidades=Sum('cantidad')),
+        'form': CargaCSVForm(),
+    })
+
+
+@login_required
+@require_http_methods(['POST'])
+def agregar_compra(request, orden_id):
+    """Recibe lotes de escaneos para una orden de compra (mismo formato que el inventario, con "costo" opcional por item)"""
+    orden = get_object_or_404(
+        OrdenCompra.objects.only('id', 'sucursal_id'),
+        pk=orden_id,
+        sucursal_id=sucursal_actual(request)
+    )
+    try:
+        unidades, desconocidos = orden.agregar_lineas(*validar_recepcion(loads(request.body)))
+    except ValueError:
+        return RespuestaJSON({'success': False, 'error': 'JSON inválido'}, status=400)
+    except ValidationError as e:
+        return RespuestaJSON({'success': False, 'error': ' '.join(e.messages)}, status=400)
+    
+    return RespuestaJSON({'success': True, 'unidades': unidades, 'desconocidos': desconocidos})
+
+
+@diferible
 @login_required
 def cargar_csv(request):
-    """Cargar productos desde archivo CSV"""
+    """
+    Cargar productos desde archivo CSV. La columna stock es el stock absoluto de
+    la sucursal actual y reemplaza al que haya: es para la carga inicial o después
+    de un recuento. Vacía deja el stock como está; para sumar mercadería o corregir
+    mientras se vende están las órdenes de compra y los inventarios.
+    """
     if not request.user.is_superuser:
         messages.error(request, 'Solo los administradores pueden cargar productos')
         return redirect('stoke:ventas')
     
+    sucursal_id = sucursal_actual(request)
+    
     if request.method == 'POST':
         form = CargaCSVForm(request.POST, request.FILES)
         if form.is_valid():
             archivo = request.FILES['archivo_csv']
             
             # Leer el archivo CSV
+            inicio = time.perf_counter()
             try:
                 # Decodificar el archivo
                 contenido = archivo.read().decode('utf-8-sig')
@@ -185,7 +644,7 @@ def cargar_csv(request):
                         nombre = fila.get('nombre', '').strip()
                         codigo_barras = fila.get('codigo_barras', '').strip() or None
                         precio = fila.get('precio', '').strip()
-                        stock = fila.get('stock', '0').strip()
+                        stock = (fila.get('stock') or '').strip()
                         categoria_nombre = fila.get('categoria', '').strip()
                         tamaño = fila.get('tamaño', '').strip() or None
                         
@@ -198,9 +657,9 @@ def cargar_csv(request):
                             continue
                         
                         try:
-                            precio = float(precio)
-                            stock = int(stock) if stock else 0
-                        except ValueError:
+                            precio = Decimal(precio).quantize(Decimal('0.01'))
+                            stock = int(stock) if stock else None
+                        except (InvalidOperation, ValueError):
                             errores.append(f"Fila {fila_num}: Precio o stock inválido")
                             continue
                         
@@ -209,40 +668,43 @@ def cargar_csv(request):
                         if categoria_nombre:
                             categoria, _ = Categoria.objects.get_or_create(nombre=categoria_nombre)
                         
-                        # Crear o actualizar producto
+                        # Crear o actualizar producto (el código puede venir como EAN-13, UPC-A o ser un alternativo)
                         if codigo_barras:
-                            producto, created = Producto.objects.update_or_create(
-                                codigo_barras=codigo_barras,
-                                defaults={
-                                    'nombre': nombre,
-                                    'precio': precio,
-                                    'stock': stock,
-                                    'categoria': categoria,
-                                    'tamaño': tamaño,
-                                    'activo': True
-                                }
-                            )
+                            try:
+                                validar_codigo(codigo_barras)
+                            except ValidationError as e:
+                                errores.append(f"Fila {fila_num}: {' '.join(e.messages)}")
+                                continue
+                            producto_id = Producto.ids_por_codigo([codigo_barras]).get(codigo_barras)
+                            producto = Producto.objects.filter(pk=producto_id).first() if producto_id else None
+                            created = producto is None
+                            if created:
+                                producto = Producto(codigo_barras=codigo_barras)
                         else:
                             # Si no hay código de barras, buscar por nombre
-                            producto, created = Producto.objects.get_or_create(
-                                nombre=nombre,
-                                codigo_barras__isnull=True,
-                                defaults={
-                                    'precio': precio,
-                                    'stock': stock,
-                                    'categoria': categoria,
-                                    'tamaño': tamaño,
-                                    'activo': True
-                                }
-                            )
-                            if not created:
-                                # Actualizar producto existente
-                                producto.precio = precio
-                                producto.stock = stock
-                                producto.categoria = categoria
-                                producto.tamaño = tamaño
-                                producto.activo = True
-                                producto.save()
+                            producto = Producto.objects.filter(nombre=nombre, codigo_barras__isnull=True).first()
+                            created = producto is None
+                            if created:
+                                producto = Producto()
+                        
+                        # Los cambios de precio quedan en el historial, igual que en el admin y las listas de precios
+                        cambio = None if created else HistorialPrecio.cambio(producto.pk, producto.precio, precio, request.user)
+                        producto.nombre = nombre
+                        producto.precio = precio
+                        producto.categoria = categoria
+                        producto.tamaño = tamaño
+                        producto.activo = True
+                        with transaction.atomic():
+                            producto.save()
+                            if cambio:
+                                cambio.save()
+                            if stock is not None:
+                                # Valor absoluto: update_or_create bloquea la fila, así no se mezcla con un cobro en curso
+                                Existencia.objects.update_or_create(
+                                    sucursal_id=sucursal_id,
+                                    producto=producto,
+                                    defaults={'stock': stock}
+                                )
                         
                         if created:
                             productos_creados += 1
@@ -252,6 +714,11 @@ def cargar_csv(request):
                     except Exception as e:
                         errores.append(f"Fila {fila_num}: {str(e)}")
                 
+                metricas.incrementar('stoke_csv_filas_total', productos_creados, resultado='creado')
+                metricas.incrementar('stoke_csv_filas_total', productos_actualizados, resultado='actualizado')
+                metricas.incrementar('stoke_csv_filas_total', len(errores), resultado='error')
+                metricas.observar('stoke_csv_duracion_seconds', time.perf_counter() - inicio)
+                
                 # Mensajes de resultado
                 if productos_creados > 0 or productos_actualizados > 0:
                     mensaje = f"✅ {productos_creados} productos creados, {productos_actualizados} actualizados"
@@ -276,3 +743,23 @@ def cargar_csv(request):
         'form': form,
         'errores': errores
     })
+
+
+@require_http_methods(['GET'])
+def metricas_prometheus(request):
+    """
+    Métricas en formato de texto de Prometheus. Con STOKE_METRICAS_TOKEN hay que
+    mandar "Authorization: Bearer <token>"; sin token solo se aceptan pedidos
+    locales directos (sin X-Forwarded-For, o sea, que no vienen por el proxy).
+    """
+    token = settings.STOKE_METRICAS_TOKEN
+    if token:
+        autorizado = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        autorizado = (
+            request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1') and
+            'x-forwarded-for' not in request.headers
+        )
+    if not autorizado:
+        return HttpResponseForbidden()
+    return HttpResponse(metricas.exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
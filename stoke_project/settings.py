@@ -46,11 +46,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'stoke.middleware.PerfiladoMiddleware',
+    'stoke.middleware.MetricasMiddleware',
+    'stoke.middleware.AdmisionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'stoke.middleware.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -61,13 +65,20 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Las plantillas se compilan una vez por proceso (en desarrollo se recargan al editarlas)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'stoke.sucursales.contexto',
             ],
         },
     },
@@ -121,6 +132,73 @@ else:
         }
     }
 
+# Réplica de solo lectura (opcional) para reportes, historial y listados del admin.
+# Se configura con DATABASE_REPLICA_URL o con DB_REPLICA_HOST (mismas credenciales que la principal)
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL', '')
+DB_REPLICA_HOST = os.getenv('DB_REPLICA_HOST', '')
+
+if DATABASE_REPLICA_URL or DB_REPLICA_HOST:
+    replica = None
+    if DATABASE_REPLICA_URL:
+        try:
+            import dj_database_url
+            replica = dj_database_url.parse(DATABASE_REPLICA_URL)
+        except ImportError:
+            pass
+    if replica is None:
+        replica = {
+            **DATABASES['default'],
+            'HOST': DB_REPLICA_HOST or DATABASES['default'].get('HOST', ''),
+            'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default'].get('PORT', '')),
+        }
+    # En los tests la réplica apunta a la misma base que 'default'
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES['replica'] = replica
+
+DATABASE_ROUTERS = ['stoke.routers.RouterReplica']
+
+# Segundos que un usuario lee de la base principal después de escribir (read-your-writes)
+STOKE_REPLICA_PEGAJOSO = int(os.getenv('STOKE_REPLICA_PEGAJOSO', '10'))
+
+
+# Caché: compartida entre workers con REDIS_URL (requiere el paquete redis),
+# si no, una caché en memoria por proceso
+REDIS_URL = os.getenv('REDIS_URL', '')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Sesiones: con caché compartida se leen de la caché (cached_db) y no de la base en cada request.
+# Con la caché por proceso se quedan en la base: un logout en un worker no borraría la copia de los demás.
+# También se puede usar 'django.contrib.sessions.backends.signed_cookies' (sin consultas, pero un
+# logout no invalida copias de la cookie hasta que vencen)
+SESSION_ENGINE = os.getenv(
+    'SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if REDIS_URL else 'django.contrib.sessions.backends.db'
+)
+
+# La sesión guarda la ruta del backend que autenticó: ModelBackend sigue en la lista para que
+# las sesiones abiertas antes de BackendConCache sigan valiendo (no se desloguean las cajas)
+AUTHENTICATION_BACKENDS = [
+    'stoke.autenticacion.BackendConCache',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Segundos que se reutiliza el usuario de la sesión (y sus permisos) desde la caché.
+# 0 lo desactiva; por defecto solo se activa con caché compartida (ver stoke/autenticacion.py)
+STOKE_USUARIO_TTL = int(os.getenv('STOKE_USUARIO_TTL', '300' if REDIS_URL else '0'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -152,11 +230,76 @@ USE_I18N = True
 
 USE_TZ = True
 
+# Hora local en la que empieza el día comercial (cierres de caja y resúmenes).
+# Ej: '04:00' para kioscos que siguen abiertos pasada la medianoche
+STOKE_HORA_CORTE = os.getenv('STOKE_HORA_CORTE', '00:00')
+
+# Segundos máximos que un worker usa el índice de promociones sin recompilarlo
+STOKE_PROMOCIONES_TTL = int(os.getenv('STOKE_PROMOCIONES_TTL', '60'))
+
+# Perfilado de requests en producción (ver stoke/perfilado.py y `manage.py perfiles`).
+# Desactivado salvo STOKE_PERFILADO=1. Se guarda la fracción MUESTREO de las requests
+# y toda request más lenta que UMBRAL_MS (0 = sin umbral)
+STOKE_PERFILADO = os.getenv('STOKE_PERFILADO', '0').lower() in ('1', 'true', 'si')
+STOKE_PERFILADO_MUESTREO = float(os.getenv('STOKE_PERFILADO_MUESTREO', '0.01'))
+STOKE_PERFILADO_UMBRAL_MS = int(os.getenv('STOKE_PERFILADO_UMBRAL_MS', '500'))
+STOKE_PERFILADO_INTERVALO_MS = int(os.getenv('STOKE_PERFILADO_INTERVALO_MS', '5'))
+STOKE_PERFILADO_DIR = os.getenv('STOKE_PERFILADO_DIR', str(BASE_DIR / 'perfiles'))
+STOKE_PERFILADO_MAXIMO = int(os.getenv('STOKE_PERFILADO_MAXIMO', '500'))
+
+# Métricas para Prometheus en /metrics (ver stoke/metricas.py). Con varios workers de
+# gunicorn, STOKE_METRICAS_DIR debe ser un directorio compartido por todos (ej: /run/stoke-metricas).
+# Sin STOKE_METRICAS_TOKEN, /metrics solo responde a pedidos locales que no pasan por un proxy
+STOKE_METRICAS = os.getenv('STOKE_METRICAS', '1').lower() in ('1', 'true', 'si')
+STOKE_METRICAS_DIR = os.getenv('STOKE_METRICAS_DIR', '')
+STOKE_METRICAS_INTERVALO = float(os.getenv('STOKE_METRICAS_INTERVALO', '1'))
+STOKE_METRICAS_TOKEN = os.getenv('STOKE_METRICAS_TOKEN', '')
+
+# Control de admisión (ver AdmisionMiddleware en stoke/middleware.py). Por worker: si las
+# requests de cobro promedian más de LATENCIA_MS (medido en los últimos VENTANA segundos)
+# o ya hay DIFERIBLES reportes en curso, los reportes y el admin reciben 503 con
+# Retry-After de REINTENTO segundos. Los timeouts por clase aplican solo en PostgreSQL (0 = el de la base)
+STOKE_ADMISION = os.getenv('STOKE_ADMISION', '1').lower() in ('1', 'true', 'si')
+STOKE_ADMISION_LATENCIA_MS = int(os.getenv('STOKE_ADMISION_LATENCIA_MS', '800'))
+STOKE_ADMISION_VENTANA = int(os.getenv('STOKE_ADMISION_VENTANA', '30'))
+STOKE_ADMISION_DIFERIBLES = int(os.getenv('STOKE_ADMISION_DIFERIBLES', '2'))
+STOKE_ADMISION_REINTENTO = int(os.getenv('STOKE_ADMISION_REINTENTO', '10'))
+STOKE_TIMEOUT_CRITICA_MS = int(os.getenv('STOKE_TIMEOUT_CRITICA_MS', '5000'))
+STOKE_TIMEOUT_DIFERIBLE_MS = int(os.getenv('STOKE_TIMEOUT_DIFERIBLE_MS', '30000'))
+
+# Eventos para contabilidad/facturación (ver stoke/eventos.py y `manage.py despachar_eventos`).
+# El enviador por defecto hace POST de cada evento a STOKE_EVENTOS_URL con Idempotency-Key
+STOKE_EVENTOS_ENVIADOR = os.getenv('STOKE_EVENTOS_ENVIADOR', 'stoke.eventos.EnviadorHTTP')
+STOKE_EVENTOS_URL = os.getenv('STOKE_EVENTOS_URL', '')
+STOKE_EVENTOS_TOKEN = os.getenv('STOKE_EVENTOS_TOKEN', '')
+STOKE_EVENTOS_TIMEOUT = float(os.getenv('STOKE_EVENTOS_TIMEOUT', '10'))
+STOKE_EVENTOS_MAX_INTENTOS = int(os.getenv('STOKE_EVENTOS_MAX_INTENTOS', '12'))
+STOKE_EVENTOS_RETENCION_DIAS = int(os.getenv('STOKE_EVENTOS_RETENCION_DIAS', '7'))
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Archivos con hash en el nombre y precomprimidos (correr collectstatic al desplegar).
+# Con whitenoise instalado, Django los sirve directamente con cabeceras de caché largas
+try:
+    import whitenoise  # noqa: F401
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+    ALMACENAMIENTO_ESTATICOS = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+except ImportError:
+    ALMACENAMIENTO_ESTATICOS = 'stoke.estaticos.ManifestComprimido'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': ALMACENAMIENTO_ESTATICOS,
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -0,0 +1,48 @@
+"""
+Configuración de producción: la de settings.py con DEBUG apagado y los ajustes
+de seguridad y conexiones. La usa gunicorn.conf.py por defecto; también se puede
+elegir con DJANGO_SETTINGS_MODULE=stoke_project.settings_produccion.
+
+Con DEBUG = True Django guarda cada consulta SQL de la request en memoria
+(connection.queries) y muestra trazas con datos internos ante un error.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DEBUG = False
+
+SECRET_KEY = os.getenv('SECRET_KEY', '')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Definí SECRET_KEY en el entorno para usar la configuración de producción')
+
+# Ej: ALLOWED_HOSTS=pos.ejemplo.com,10.0.0.5
+ALLOWED_HOSTS = [host.strip() for host in os.getenv('ALLOWED_HOSTS', '').split(',') if host.strip()]
+CSRF_TRUSTED_ORIGINS = [origen.strip() for origen in os.getenv('CSRF_TRUSTED_ORIGINS', '').split(',') if origen.strip()]
+
+# Conexiones persistentes: cada hilo de cada worker reutiliza su conexión entre
+# requests en lugar de abrir una nueva (y autenticarse) cada vez
+for base in DATABASES.values():
+    base['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+    base['CONN_HEALTH_CHECKS'] = True
+
+# Detrás de un proxy con HTTPS (nginx, balanceador). STOKE_HTTPS=0 para servir por HTTP en una red local
+if os.getenv('STOKE_HTTPS', '1').lower() in ('1', 'true', 'si'):
+    SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    SESSION_COOKIE_SECURE = True
+    CSRF_COOKIE_SECURE = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'consola': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['consola'],
+        'level': os.getenv('LOG_LEVEL', 'WARNING'),
+    },
+}